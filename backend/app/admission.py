@@ -0,0 +1,292 @@
+"""
+Admission control for expensive endpoints: per-user rate limits and per-class concurrency caps.
+
+Endpoints are grouped into classes ("read", "aggregate", "inference", "write"), each with
+- a token bucket per user (the authenticated user; the client address on endpoints without
+  login): a request takes one token, and an empty bucket answers 429 with Retry-After;
+- a concurrency cap shared by everyone. Requests over the cap wait in a queue ordered by
+  priority, then arrival. "interactive" requests (one student, one form) are served before
+  "bulk" ones (whole classes, batches, jobs), and bulk requests may only use
+  concurrency - reserved_for_interactive slots, so a class re-run never takes the last one.
+  A full queue, or a wait longer than max_wait_seconds, answers 503 with Retry-After.
+
+Endpoints opt in with `dependencies=[Depends(admit("inference", BULK))]`. Limits are per
+worker and can be changed with ADMISSION_LIMITS, a JSON object such as
+'{"inference": {"concurrency": 8, "rate_per_second": 5}}'. ADMISSION_CONTROL_ENABLED=0
+turns admission control off. Queue depth, in-flight requests, waits and decisions are
+exported on /metrics as pof_admission_*.
+
+Behind a reverse proxy every request arrives from the proxy's address, so endpoints without
+login would share one bucket. List the proxies in ADMISSION_TRUSTED_PROXIES (comma-separated
+addresses) and those endpoints are keyed by the nearest X-Forwarded-For hop that is not a
+trusted proxy. X-Forwarded-For from any other address is ignored, since clients can forge it.
+"""
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from fastapi import Depends, HTTPException, Request, status
+from typing import Callable, Dict, List, Optional
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+
+from app.auth.auth import get_current_user
+from app.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REQUESTS, ADMISSION_WAIT_SECONDS
+from app.models import User
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "1") == "1"
+# Reverse proxies whose X-Forwarded-For header identifies the client
+ADMISSION_TRUSTED_PROXIES = frozenset(
+    address.strip() for address in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if address.strip()
+)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+_PRIORITY_RANK = {INTERACTIVE: 0, BULK: 1}
+
+# Idle buckets are full again and can be forgotten; checked when this many users are tracked
+MAX_TRACKED_BUCKETS = 10_000
+# Smoothing of the average slot hold time used for 503 Retry-After estimates
+HOLD_TIME_SMOOTHING = 0.2
+
+
+class AdmissionError(Exception):
+    """Raised for unknown endpoint classes or priorities and invalid ADMISSION_LIMITS."""
+    pass
+
+
+@dataclass(frozen=True)
+class ClassLimits:
+    rate_per_second: float            # Token refill rate of each user's bucket
+    burst: int                        # Bucket size
+    concurrency: int                  # Requests of this class running at once, all users
+    reserved_for_interactive: int     # Slots bulk requests may not take
+    max_queue: int                    # Requests waiting for a slot before new ones get 503
+    max_wait_seconds: float           # Longest wait for a slot before 503
+
+
+DEFAULT_LIMITS: Dict[str, ClassLimits] = {
+    # Indexed lookups and cached lists
+    "read": ClassLimits(rate_per_second=20, burst=60, concurrency=32, reserved_for_interactive=0, max_queue=128, max_wait_seconds=5.0),
+    # Dashboard statistics, rankings, trends: several scans or aggregates each
+    "aggregate": ClassLimits(rate_per_second=2, burst=10, concurrency=4, reserved_for_interactive=1, max_queue=32, max_wait_seconds=10.0),
+    # Model scoring is CPU-bound; more concurrent batches than cores only adds latency
+    "inference": ClassLimits(rate_per_second=2, burst=10, concurrency=max(2, os.cpu_count() or 2), reserved_for_interactive=1, max_queue=32, max_wait_seconds=10.0),
+    # SQLite has a single writer; extra concurrency only waits on its lock
+    "write": ClassLimits(rate_per_second=5, burst=20, concurrency=4, reserved_for_interactive=1, max_queue=64, max_wait_seconds=5.0),
+}
+
+
+def _load_limits() -> Dict[str, ClassLimits]:
+    overrides = json.loads(os.getenv("ADMISSION_LIMITS", "{}") or "{}")
+    limits = dict(DEFAULT_LIMITS)
+    for endpoint_class, values in overrides.items():
+        if endpoint_class not in limits:
+            raise AdmissionError(f"ADMISSION_LIMITS: unknown endpoint class '{endpoint_class}'.")
+        limits[endpoint_class] = replace(limits[endpoint_class], **values)
+    return limits
+
+
+class AdmissionRejected(HTTPException):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+@dataclass
+class _TokenBucket:
+    tokens: float
+    updated: float
+
+
+@dataclass(order=True)
+class _Waiter:
+    rank: int
+    sequence: int
+    priority: str = field(compare=False)
+    future: "asyncio.Future" = field(compare=False)
+    abandoned: bool = field(default=False, compare=False)
+
+
+class _ClassGate:
+    """Token buckets and the priority queue of one endpoint class. Used from the event loop only."""
+
+    def __init__(self, name: str, limits: ClassLimits):
+        self.name = name
+        self.limits = limits
+        self.buckets: Dict[str, _TokenBucket] = {}
+        self.in_flight = 0
+        self.waiters: List[_Waiter] = []
+        self.queued = 0
+        self.average_hold_seconds = 0.05
+        self._sequence = itertools.count()
+
+    def take_token(self, key: str, now: float) -> Optional[float]:
+        """Takes one token from `key`'s bucket; returns the seconds until one is available if empty."""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_TRACKED_BUCKETS:
+                self._forget_full_buckets(now)
+            bucket = self.buckets[key] = _TokenBucket(tokens=self.limits.burst, updated=now)
+        bucket.tokens = min(self.limits.burst, bucket.tokens + (now - bucket.updated) * self.limits.rate_per_second)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return None
+        return (1 - bucket.tokens) / self.limits.rate_per_second
+
+    def _forget_full_buckets(self, now: float) -> None:
+        refill_seconds = self.limits.burst / self.limits.rate_per_second
+        self.buckets = {key: b for key, b in self.buckets.items() if now - b.updated < refill_seconds}
+
+    def _has_slot(self, priority: str) -> bool:
+        cap = self.limits.concurrency
+        if priority == BULK:
+            cap -= self.limits.reserved_for_interactive
+        return self.in_flight < max(cap, 1)
+
+    def retry_after(self) -> float:
+        # Time for the queue ahead to drain through the available slots
+        return self.average_hold_seconds * (self.queued + 1) / self.limits.concurrency
+
+    async def acquire(self, priority: str) -> None:
+        if self._has_slot(priority) and not self._waiting_at_or_above(priority):
+            self.in_flight += 1
+            return
+        if self.queued >= self.limits.max_queue:
+            raise AdmissionRejected(status.HTTP_503_SERVICE_UNAVAILABLE, f"Too many {self.name} requests queued; retry later.", self.retry_after())
+        waiter = _Waiter(_PRIORITY_RANK[priority], next(self._sequence), priority, asyncio.get_running_loop().create_future())
+        heapq.heappush(self.waiters, waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.limits.max_wait_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # Granted as the wait ended: the slot is ours, or handed on if the client left
+                if isinstance(e, asyncio.CancelledError):
+                    self.release(None)
+                    raise
+                return
+            waiter.abandoned = True
+            self.queued -= 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise AdmissionRejected(status.HTTP_503_SERVICE_UNAVAILABLE, f"Timed out waiting for a {self.name} slot; retry later.", self.retry_after())
+
+    def _waiting_at_or_above(self, priority: str) -> bool:
+        # Newcomers never overtake queued requests of the same or higher priority
+        return any(not w.abandoned and w.rank <= _PRIORITY_RANK[priority] for w in self.waiters)
+
+    def release(self, held_seconds: Optional[float]) -> None:
+        self.in_flight -= 1
+        if held_seconds is not None:
+            self.average_hold_seconds += HOLD_TIME_SMOOTHING * (held_seconds - self.average_hold_seconds)
+        while self.waiters:
+            waiter = self.waiters[0]
+            if waiter.abandoned:
+                heapq.heappop(self.waiters)
+                continue
+            if not self._has_slot(waiter.priority):
+                break  # The head is bulk and only reserved slots are free; interactive requests sort ahead of it
+            heapq.heappop(self.waiters)
+            self.queued -= 1
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+
+class AdmissionController:
+    def __init__(self, limits: Optional[Dict[str, ClassLimits]] = None, enabled: bool = ADMISSION_CONTROL_ENABLED):
+        self.enabled = enabled
+        self.gates = {name: _ClassGate(name, class_limits) for name, class_limits in (limits or _load_limits()).items()}
+
+    def _gate(self, endpoint_class: str) -> _ClassGate:
+        try:
+            return self.gates[endpoint_class]
+        except KeyError:
+            raise AdmissionError(f"Unknown endpoint class '{endpoint_class}'; expected one of {', '.join(self.gates)}.")
+
+    async def admit(self, endpoint_class: str, priority: str, key: str) -> float:
+        """Waits for a slot; returns the admission time for release(). Raises AdmissionRejected."""
+        gate = self._gate(endpoint_class)
+        labels = dict(endpoint_class=endpoint_class, priority=priority)
+        start = time.monotonic()
+        retry_after = gate.take_token(key, start)
+        if retry_after is not None:
+            ADMISSION_REQUESTS.inc(outcome="rate_limited", **labels)
+            raise AdmissionRejected(status.HTTP_429_TOO_MANY_REQUESTS, f"Rate limit for {endpoint_class} requests exceeded.", retry_after)
+        try:
+            await gate.acquire(priority)
+        except AdmissionRejected:
+            ADMISSION_REQUESTS.inc(outcome="rejected", **labels)
+            raise
+        finally:
+            self._export(gate)
+        admitted = time.monotonic()
+        ADMISSION_REQUESTS.inc(outcome="admitted", **labels)
+        ADMISSION_WAIT_SECONDS.observe(admitted - start, **labels)
+        return admitted
+
+    def release(self, endpoint_class: str, admitted: float) -> None:
+        gate = self._gate(endpoint_class)
+        gate.release(time.monotonic() - admitted)
+        self._export(gate)
+
+    def _export(self, gate: _ClassGate) -> None:
+        ADMISSION_QUEUE_DEPTH.set(gate.queued, endpoint_class=gate.name)
+        ADMISSION_IN_FLIGHT.set(gate.in_flight, endpoint_class=gate.name)
+
+    def status(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"in_flight": gate.in_flight, "queued": gate.queued, "concurrency": gate.limits.concurrency}
+            for name, gate in self.gates.items()
+        }
+
+
+admission_controller = AdmissionController()
+
+
+def client_address(request: Request) -> str:
+    """The client's address; behind a trusted proxy, the nearest X-Forwarded-For hop that is not one."""
+    host = request.client.host if request.client else "unknown"
+    if host not in ADMISSION_TRUSTED_PROXIES:
+        return host
+    hops = [hop.strip() for value in request.headers.getlist("x-forwarded-for") for hop in value.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in ADMISSION_TRUSTED_PROXIES:
+            return hop
+    return hops[0] if hops else host
+
+
+def admit(endpoint_class: str, priority: str = INTERACTIVE, per_user: bool = True) -> Callable:
+    """
+    Dependency admitting a request of `endpoint_class`. Keyed by the authenticated user
+    (resolved once per request, shared with the endpoint's own get_current_user), or by
+    client_address() with per_user=False for endpoints without login.
+    """
+    admission_controller._gate(endpoint_class)
+    if priority not in _PRIORITY_RANK:
+        raise AdmissionError(f"Unknown priority '{priority}'; expected '{INTERACTIVE}' or '{BULK}'.")
+
+    @asynccontextmanager
+    async def slot(key: str):
+        if not admission_controller.enabled:
+            yield
+            return
+        admitted = await admission_controller.admit(endpoint_class, priority, key)
+        try:
+            yield
+        finally:
+            admission_controller.release(endpoint_class, admitted)
+
+    if per_user:
+        async def admit_user(current_user: User = Depends(get_current_user)):
+            async with slot(f"user:{current_user.id}"):
+                yield
+        return admit_user
+
+    async def admit_client(request: Request):
+        async with slot(f"client:{client_address(request)}"):
+            yield
+    return admit_client
@@ -48,3 +48,23 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     if user is None:
         raise credentials_exception
     return user
+
+def is_admin_token(token: str) -> bool:
+    # For checks outside dependency injection (middleware)
+    try:
+        email = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return False
+    if email is None:
+        return False
+    db = SessionLocal()
+    try:
+        user = get_user_by_email(db, email)
+    finally:
+        db.close()
+    return user is not None and user.role == "admin"
+
+def get_current_admin_user(current_user = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
@@ -0,0 +1,199 @@
+"""
+Per-table data versions and an ETag-keyed response cache for read endpoints.
+
+Every commit through a SQLAlchemy Session bumps the version of each table it wrote to
+(ORM flushes and session.execute() DML alike), so read endpoints can derive a strong
+ETag from the versions of the tables they read and skip their queries entirely when
+the client already holds the current representation.
+
+Versions live in the coordination store, so with COORDINATION_BACKEND=sqlite a commit
+in one worker process invalidates the cached responses of every worker. ETags also carry
+the store's epoch, a random value created along with the counters: the local store's
+counters restart at 0 with the process, and an ETag issued before a restart must not
+match the same counter values afterwards.
+"""
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Any, Callable, FrozenSet, Optional, Sequence, Tuple, Type
+from app.coordination import coordination_store
+from app.encoding import encode_columnar, negotiate_columnar
+from app.metrics import RESPONSE_CACHE_REQUESTS
+import functools
+import hashlib
+import json
+import threading
+import uuid
+
+# Maximum number of serialized responses kept in memory
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+DATA_VERSION_KEY_PREFIX = "data_version:"
+DATA_VERSION_EPOCH_KEY = "data_version_epoch"
+
+
+def get_versions(tables: Sequence[str]) -> Tuple[int, ...]:
+    counters = coordination_store.get_counters([DATA_VERSION_KEY_PREFIX + table for table in tables])
+    return tuple(counters.get(DATA_VERSION_KEY_PREFIX + table, 0) for table in tables)
+
+
+def bump_versions(tables) -> None:
+    coordination_store.incr([DATA_VERSION_KEY_PREFIX + table for table in sorted(tables)])
+
+
+@functools.lru_cache(maxsize=None)
+def data_version_epoch() -> str:
+    # Fixed for the life of the counters: per process with the local store, shared (and persisted) with sqlite
+    return coordination_store.setdefault_value(DATA_VERSION_EPOCH_KEY, uuid.uuid4().hex)
+
+
+# --- Change tracking via Session events ---
+
+def _touched_tables(session: Session) -> set:
+    return session.info.setdefault("touched_tables", set())
+
+
+@functools.lru_cache(maxsize=None)
+def _cascaded_tables(table) -> FrozenSet[str]:
+    """Tables whose rows the database deletes along with rows of `table` (ON DELETE CASCADE, transitively)."""
+    cascaded = set()
+    for other in table.metadata.tables.values():
+        for fk in other.foreign_keys:
+            if fk.column.table is table and (fk.ondelete or "").upper() == "CASCADE" and other.name not in cascaded:
+                cascaded.add(other.name)
+                cascaded |= _cascaded_tables(other)
+    return frozenset(cascaded)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session, flush_context):
+    touched = _touched_tables(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            touched.add(table.name)
+    for obj in session.deleted:
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            touched |= _cascaded_tables(table)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_executed_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            touched = _touched_tables(orm_execute_state.session)
+            touched.add(table.name)
+            if orm_execute_state.is_delete:
+                touched |= _cascaded_tables(table)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_tables(session):
+    touched = session.info.pop("touched_tables", None)
+    if touched:
+        bump_versions(touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_tables(session):
+    session.info.pop("touched_tables", None)
+
+
+# --- Response cache ---
+
+class ResponseCache:
+    """Small thread-safe LRU of serialized response bodies keyed by (cache key, ETag)."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+        RESPONSE_CACHE_REQUESTS.inc(result="hit" if body is not None else "miss")
+        return body
+
+    def put(self, key: Tuple[str, str], body: bytes) -> None:
+        with self._lock:
+            # Older versions of the same resource can never be served again
+            for stale_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+                del self._entries[stale_key]
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def make_etag(cache_key: str, versions: Tuple[int, ...]) -> str:
+    digest = hashlib.sha1(f"{cache_key}|{data_version_epoch()}|{versions}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _weak(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison (RFC 9110): CompressionMiddleware sends W/ ETags for compressed bodies
+    if not if_none_match:
+        return False
+    candidates = [_weak(candidate.strip()) for candidate in if_none_match.split(",")]
+    return "*" in candidates or _weak(etag) in candidates
+
+
+def cached_json_response(
+    request: Request,
+    cache_key: str,
+    tables: Sequence[str],
+    build: Callable[[], Any],
+    columnar_model: Optional[Type[BaseModel]] = None,
+) -> Response:
+    """
+    Answers a GET with 304 when If-None-Match carries the current ETag, otherwise serves the
+    cached body for this version or calls `build()` and caches its JSON serialization.
+    `cache_key` must include everything besides table data the payload depends on
+    (path parameters, query parameters, the current user when it is echoed back).
+    For list endpoints, `columnar_model` (the row schema) enables the columnar encodings
+    of app.encoding, negotiated through the Accept header and cached per media type.
+    Responses built from the analytics replica (app.replica) are cached per replica snapshot.
+    """
+    replica_snapshot = getattr(request.state, "replica_snapshot", None)
+    if replica_snapshot is not None:
+        # Read from the analytics replica: a refresh changes the data without a version bump
+        cache_key = f"{cache_key}|replica:{replica_snapshot}"
+    media_type = negotiate_columnar(request) if columnar_model is not None else None
+    if media_type is not None:
+        cache_key = f"{cache_key}|{media_type}"
+    etag = make_etag(cache_key, get_versions(tables))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if columnar_model is not None:
+        headers["Vary"] = "Accept"
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        RESPONSE_CACHE_REQUESTS.inc(result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get((cache_key, etag))
+    if body is None:
+        if media_type is not None:
+            body = encode_columnar(columnar_model, build(), media_type)
+        else:
+            body = json.dumps(jsonable_encoder(build()), separators=(",", ":")).encode("utf-8")
+        response_cache.put((cache_key, etag), body)
+    return Response(content=body, media_type=media_type or "application/json", headers=headers)
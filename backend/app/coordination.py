@@ -0,0 +1,233 @@
+"""
+Shared state for running several uvicorn workers (or several app processes on one host).
+
+COORDINATION_BACKEND selects the store:
+- "local" (default): in-process dictionaries. Correct for a single worker only.
+- "sqlite": a small SQLite database in WAL mode (COORDINATION_DB_PATH) shared by every
+  process on the host. It keeps its own file so coordination traffic never contends
+  with writes to the main database.
+
+The store offers three primitives: monotonically increasing counters (data versions for
+cache invalidation), a key/value register (the published model version, the counters'
+epoch) and leases
+with an owner and a TTL (leader locks). A Redis-backed store only needs to implement
+the same methods (INCR, GET/SET, SET NX PX) to scale the same setup across hosts.
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "local")
+COORDINATION_DB_PATH = os.getenv("COORDINATION_DB_PATH", "./coordination.db")
+# How long lock() waits between attempts while another owner holds the lease
+LOCK_POLL_SECONDS = 0.05
+
+# Identifies this process as a lock owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LockNotAcquiredError(Exception):
+    """Raised when a lease is held by another owner and could not be acquired in time."""
+    pass
+
+
+class CoordinationStore(ABC):
+    """Interface shared by every backend."""
+
+    @abstractmethod
+    def incr(self, keys: Sequence[str]) -> None:
+        """Adds one to each counter, creating it at 1."""
+
+    @abstractmethod
+    def get_counters(self, keys: Sequence[str]) -> Dict[str, int]:
+        """Current value of each counter; counters never incremented are left out."""
+
+    @abstractmethod
+    def get_value(self, key: str) -> Optional[str]:
+        """The value stored under `key`, or None."""
+
+    @abstractmethod
+    def set_value(self, key: str, value: str) -> None:
+        """Stores `value` under `key`, replacing any previous value."""
+
+    @abstractmethod
+    def setdefault_value(self, key: str, value: str) -> str:
+        """Stores `value` unless `key` already has one; returns the stored value."""
+
+    @abstractmethod
+    def try_acquire(self, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+        """Takes (or renews, if already ours) the lease `name`; False if another owner holds it."""
+
+    @abstractmethod
+    def release(self, name: str, owner: str = WORKER_ID) -> None:
+        """Gives up the lease `name` if `owner` holds it."""
+
+    @contextmanager
+    def lock(self, name: str, ttl_seconds: float, wait_seconds: float = 0.0, owner: str = WORKER_ID) -> Iterator[None]:
+        """Holds the lease for the duration of the block, waiting up to `wait_seconds` for it."""
+        deadline = time.monotonic() + wait_seconds
+        while not self.try_acquire(name, ttl_seconds, owner):
+            if time.monotonic() >= deadline:
+                raise LockNotAcquiredError(f"Lock '{name}' is held by another worker.")
+            time.sleep(LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            self.release(name, owner)
+
+
+class LocalCoordinationStore(CoordinationStore):
+    def __init__(self):
+        self._counters: Dict[str, int] = {}
+        self._values: Dict[str, str] = {}
+        self._leases: Dict[str, tuple] = {}  # name -> (owner, expires_at)
+        self._lock = threading.Lock()
+
+    def incr(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+    def get_counters(self, keys: Sequence[str]) -> Dict[str, int]:
+        with self._lock:
+            return {key: self._counters[key] for key in keys if key in self._counters}
+
+    def get_value(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._values.get(key)
+
+    def set_value(self, key: str, value: str) -> None:
+        with self._lock:
+            self._values[key] = value
+
+    def setdefault_value(self, key: str, value: str) -> str:
+        with self._lock:
+            return self._values.setdefault(key, value)
+
+    def try_acquire(self, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is not None and holder[0] != owner and holder[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl_seconds)
+            return True
+
+    def release(self, name: str, owner: str = WORKER_ID) -> None:
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is not None and holder[0] == owner:
+                del self._leases[name]
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+"""
+
+
+class SQLiteCoordinationStore(CoordinationStore):
+    """
+    One autocommit connection per thread; every operation is a single statement (or one
+    short IMMEDIATE transaction), so processes never hold the file lock for long.
+    """
+
+    def __init__(self, path: str = COORDINATION_DB_PATH, busy_timeout_seconds: float = 5.0):
+        self.path = path
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(_SQLITE_SCHEMA)
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_seconds, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        yield conn
+
+    def incr(self, keys: Sequence[str]) -> None:
+        if not keys:
+            return
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO counters (key, value) VALUES (?, 1) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + 1",
+                    [(key,) for key in keys],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get_counters(self, keys: Sequence[str]) -> Dict[str, int]:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._connection() as conn:
+            rows = conn.execute(f"SELECT key, value FROM counters WHERE key IN ({placeholders})", list(keys)).fetchall()
+        return dict(rows)
+
+    def get_value(self, key: str) -> Optional[str]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_value(self, key: str, value: str) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (key, value, time.time()),
+            )
+
+    def setdefault_value(self, key: str, value: str) -> str:
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?) ON CONFLICT(key) DO NOTHING",
+                (key, value, time.time()),
+            )
+            return conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0]
+
+    def try_acquire(self, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+        now = time.time()
+        with self._connection() as conn:
+            # Insert, or take over only if the lease expired or is already ours; atomic in one statement
+            cursor = conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+                (name, owner, now + ttl_seconds, now),
+            )
+            return cursor.rowcount > 0
+
+    def release(self, name: str, owner: str = WORKER_ID) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+def create_store(backend: str = COORDINATION_BACKEND) -> CoordinationStore:
+    if backend == "local":
+        return LocalCoordinationStore()
+    if backend == "sqlite":
+        logger.info("Using SQLite coordination store at %s (worker %s)", COORDINATION_DB_PATH, WORKER_ID)
+        return SQLiteCoordinationStore()
+    raise ValueError(f"Unknown COORDINATION_BACKEND '{backend}'. Expected 'local' or 'sqlite'.")
+
+
+coordination_store = create_store()
@@ -1,108 +1,127 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case
-from app.models import Student, Prediction
-from app.schema import (
-    ProgramStudentCount, SectionStudentCount, ProgramAverageScore,
-    ScoreDistributionBucket, LearnGuideStatusByProgram, DashboardStudentSummary
-)
-from typing import List, Optional, Tuple
-from datetime import datetime, timedelta
+from sqlalchemy import text
+from app.cache import bump_versions
+from app.models import DashboardClassAggregate, DashboardRiskBandCount, Student, StudentLatestPrediction
+from app.schema import DashboardStudentSummary
+from typing import Dict, List, Optional, Sequence
 import math
 
+# Dashboard score distribution: (label, aggregate column, min, max), both ends inclusive
+SCORE_BUCKETS = (
+    ("90-100", "score_90_100", 90, 100),
+    ("80-89", "score_80_89", 80, 89.99),
+    ("70-79", "score_70_79", 70, 79.99),
+    ("60-69", "score_60_69", 60, 69.99),
+    ("0-59", "score_0_59", 0, 59.99),
+)
+
 # --- Helper for rounding ---
 def safe_round(value: Optional[float], digits: int = 2) -> Optional[float]:
     if value is None or math.isnan(value) or math.isinf(value):
         return None
     return round(value, digits)
 
-# --- Individual Metric Functions ---
-
-def get_total_students(db: Session) -> int:
-    return db.query(func.count(Student.student_id)).scalar() or 0
-
-def get_total_unique_programs(db: Session) -> int:
-    return db.query(func.count(func.distinct(Student.program))).filter(Student.program.isnot(None)).scalar() or 0
-
-def get_total_unique_sections(db: Session) -> int:
-    return db.query(func.count(func.distinct(Student.section))).filter(Student.section.isnot(None)).scalar() or 0
-
-def get_overall_average_score(db: Session) -> Optional[float]:
-    avg = db.query(func.avg(Student.avg_test_score)).filter(Student.avg_test_score.isnot(None)).scalar()
-    return safe_round(avg)
-
-def get_learn_guide_completion_rate(db: Session) -> Optional[float]:
-    total_students = get_total_students(db)
-    if total_students == 0:
-        return 0.0 
-
-    completed_count = db.query(func.count(Student.student_id))\
-        .filter(Student.learn_guide_completed == True).scalar() or 0
-
-    rate = (completed_count / total_students) * 100 if total_students > 0 else 0.0
-    return safe_round(rate)
-
-def get_students_at_risk_count(db: Session, threshold: float = 60.0) -> int:
-    return db.query(func.count(Student.student_id))\
-        .filter(Student.avg_test_score.isnot(None), Student.avg_test_score < threshold).scalar() or 0
-
-def get_students_per_program(db: Session) -> List[ProgramStudentCount]:
-    results = db.query(
-        Student.program,
-        func.count(Student.student_id).label("count")
-    ).filter(Student.program.isnot(None)).group_by(Student.program).order_by(Student.program).all()
-    return [ProgramStudentCount(program=row.program, count=row.count) for row in results]
-
-def get_students_per_section(db: Session) -> List[SectionStudentCount]:
-    results = db.query(
-        Student.section,
-        func.count(Student.student_id).label("count")
-    ).filter(Student.section.isnot(None)).group_by(Student.section).order_by(Student.section).all()
-    return [SectionStudentCount(section=row.section, count=row.count) for row in results]
-
-def get_average_score_per_program(db: Session) -> List[ProgramAverageScore]:
-    results = db.query(
-        Student.program,
-        func.avg(Student.avg_test_score).label("average_score")
-    ).filter(Student.program.isnot(None), Student.avg_test_score.isnot(None))\
-     .group_by(Student.program).order_by(Student.program).all()
-    return [
-        ProgramAverageScore(program=row.program, average_score=safe_round(row.average_score))
-        for row in results
-    ]
-
-def get_overall_score_distribution(db: Session) -> List[ScoreDistributionBucket]:
-    # Define score ranges/buckets
-    buckets = [
-        {"label": "90-100", "min": 90, "max": 100},
-        {"label": "80-89", "min": 80, "max": 89.99},
-        {"label": "70-79", "min": 70, "max": 79.99},
-        {"label": "60-69", "min": 60, "max": 69.99},
-        {"label": "0-59", "min": 0, "max": 59.99},
-    ]
-    distribution = []
-    for bucket in buckets:
-        count = db.query(func.count(Student.student_id)).filter(
-            Student.avg_test_score.isnot(None),
-            Student.avg_test_score >= bucket["min"],
-            Student.avg_test_score <= bucket["max"]
-        ).scalar() or 0
-        distribution.append(ScoreDistributionBucket(range=bucket["label"], count=count))
-    return distribution
-
-def get_learn_guide_status_per_program(db: Session) -> List[LearnGuideStatusByProgram]:
-    results = db.query(
-        Student.program,
-        func.sum(case((Student.learn_guide_completed == True, 1), else_=0)).label("completed"),
-        func.sum(case((Student.learn_guide_completed == False, 1), else_=0)).label("not_completed")
-    ).filter(Student.program.isnot(None)).group_by(Student.program).order_by(Student.program).all()
+# --- Aggregates maintained by triggers ---
+# One SQL expression per DashboardClassAggregate counter: what one `students` row (`row`
+# is new, old or a table alias) adds to its class. Triggers and the rebuild share them.
+
+def _class_contributions(row: str) -> Dict[str, str]:
+    contributions = {
+        "student_count": "1",
+        "score_count": f"CASE WHEN {row}.avg_test_score IS NOT NULL THEN 1 ELSE 0 END",
+        "score_sum": f"coalesce({row}.avg_test_score, 0)",
+        "learn_guide_completed": f"CASE WHEN {row}.learn_guide_completed = 1 THEN 1 ELSE 0 END",
+        "learn_guide_not_completed": f"CASE WHEN {row}.learn_guide_completed = 0 THEN 1 ELSE 0 END",
+    }
+    for _, column, low, high in SCORE_BUCKETS:
+        contributions[column] = f"CASE WHEN {row}.avg_test_score >= {low} AND {row}.avg_test_score <= {high} THEN 1 ELSE 0 END"
+    return contributions
+
+def _class_key(row: str) -> List[str]:
+    # NULL cannot take part in ON CONFLICT matching, so it is stored as "" plus a marker
+    return [f"coalesce({row}.program, '')", f"({row}.program IS NULL)",
+            f"coalesce({row}.section, '')", f"({row}.section IS NULL)"]
+
+_CLASS_TABLE = DashboardClassAggregate.__tablename__
+_CLASS_KEY = ("program", "program_is_null", "section", "section_is_null")
+_BAND_TABLE = DashboardRiskBandCount.__tablename__
+_CLASS_COLUMNS = list(_class_contributions("s"))
+
+def _add_student(row: str) -> str:
+    values = ", ".join(_class_contributions(row).values())
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in _CLASS_COLUMNS)
+    return (
+        f"INSERT INTO {_CLASS_TABLE} ({', '.join(_CLASS_KEY)}, {', '.join(_CLASS_COLUMNS)}) "
+        f"VALUES ({', '.join(_class_key(row))}, {values}) "
+        f"ON CONFLICT ({', '.join(_CLASS_KEY)}) DO UPDATE SET {updates};"
+    )
+
+def _remove_student(row: str) -> str:
+    updates = ", ".join(f"{c} = {c} - ({expr})" for c, expr in _class_contributions(row).items())
+    return (
+        f"UPDATE {_CLASS_TABLE} SET {updates} "
+        f"WHERE {' AND '.join(f'{c} = {e}' for c, e in zip(_CLASS_KEY, _class_key(row)))};"
+    )
+
+def _add_band(row: str) -> str:
+    return (
+        f"INSERT INTO {_BAND_TABLE} (risk_band, student_count) VALUES (coalesce({row}.risk_band, ''), 1) "
+        f"ON CONFLICT (risk_band) DO UPDATE SET student_count = student_count + 1;"
+    )
+
+def _remove_band(row: str) -> str:
+    return f"UPDATE {_BAND_TABLE} SET student_count = student_count - 1 WHERE risk_band = coalesce({row}.risk_band, '');"
+
+_CREATE_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS {_CLASS_TABLE}_ai AFTER INSERT ON students BEGIN {_add_student('new')} END",
+    f"CREATE TRIGGER IF NOT EXISTS {_CLASS_TABLE}_ad AFTER DELETE ON students BEGIN {_remove_student('old')} END",
+    f"CREATE TRIGGER IF NOT EXISTS {_CLASS_TABLE}_au AFTER UPDATE OF program, section, avg_test_score, learn_guide_completed "
+    f"ON students BEGIN {_remove_student('old')} {_add_student('new')} END",
+    f"CREATE TRIGGER IF NOT EXISTS {_BAND_TABLE}_ai AFTER INSERT ON student_latest_predictions BEGIN {_add_band('new')} END",
+    f"CREATE TRIGGER IF NOT EXISTS {_BAND_TABLE}_ad AFTER DELETE ON student_latest_predictions BEGIN {_remove_band('old')} END",
+    f"CREATE TRIGGER IF NOT EXISTS {_BAND_TABLE}_au AFTER UPDATE OF risk_band ON student_latest_predictions "
+    f"WHEN old.risk_band IS NOT new.risk_band BEGIN {_remove_band('old')} {_add_band('new')} END",
+)
 
-    return [
-        LearnGuideStatusByProgram(
-            program=row.program,
-            completed=row.completed or 0,
-            not_completed=row.not_completed or 0
-        ) for row in results
-    ]
+def ensure_dashboard_triggers(bind) -> None:
+    """Creates the triggers keeping the dashboard aggregate tables current (SQLite only)."""
+    if bind.dialect.name != "sqlite":
+        return
+    with bind.begin() as conn:
+        for statement in _CREATE_TRIGGERS:
+            conn.execute(text(statement))
+
+def rebuild_dashboard_aggregates(db: Session) -> int:
+    """
+    Recomputes both aggregate tables from `students` and `student_latest_predictions`
+    (backfill, or after writes that bypassed the triggers), and moves their data versions so
+    cached dashboards and open streams pick up the corrected counts. Returns the class row count.
+    """
+    sums = ", ".join(f"sum({expr})" for expr in _class_contributions("s").values())
+    db.execute(text(f"DELETE FROM {_CLASS_TABLE}"))
+    result = db.execute(text(
+        f"INSERT INTO {_CLASS_TABLE} ({', '.join(_CLASS_KEY)}, {', '.join(_CLASS_COLUMNS)}) "
+        f"SELECT {', '.join(_class_key('s'))}, {sums} FROM students AS s GROUP BY 1, 2, 3, 4"
+    ))
+    db.execute(text(f"DELETE FROM {_BAND_TABLE}"))
+    db.execute(text(
+        f"INSERT INTO {_BAND_TABLE} (risk_band, student_count) "
+        f"SELECT coalesce(risk_band, ''), count(*) FROM student_latest_predictions GROUP BY 1"
+    ))
+    db.commit()
+    # Raw SQL is not seen by the session's change tracking (app.cache)
+    bump_versions((_CLASS_TABLE, _BAND_TABLE))
+    return result.rowcount or 0
+
+# --- Metric Functions ---
+
+def get_class_aggregates(db: Session) -> List[DashboardClassAggregate]:
+    # Classes whose last student left keep a row of zeros
+    return db.query(DashboardClassAggregate).filter(DashboardClassAggregate.student_count > 0).all()
+
+def get_risk_band_counts(db: Session) -> Dict[str, int]:
+    # "" counts latest predictions without a band
+    return {row.risk_band: row.student_count for row in db.query(DashboardRiskBandCount).all()}
 
 def get_recent_students(db: Session, limit: int = 5) -> List[DashboardStudentSummary]:
     results = db.query(Student).order_by(Student.student_id.desc()).limit(limit).all()
@@ -117,10 +136,12 @@ def get_recent_students(db: Session, limit: int = 5) -> List[DashboardStudentSum
         ) for s in results
     ]
 
-def get_low_performing_students(db: Session, threshold: float = 60.0, limit: int = 5) -> List[DashboardStudentSummary]:
+def get_low_performing_students(db: Session, bands: Sequence[str], limit: int = 5) -> List[DashboardStudentSummary]:
+    # At-risk students with the lowest predicted pass probability first
     results = db.query(Student)\
-        .filter(Student.avg_test_score.isnot(None), Student.avg_test_score < threshold)\
-        .order_by(Student.avg_test_score.asc())\
+        .join(StudentLatestPrediction, StudentLatestPrediction.student_id == Student.student_id)\
+        .filter(StudentLatestPrediction.risk_band.in_(bands))\
+        .order_by(StudentLatestPrediction.predicted_score.asc())\
         .limit(limit).all()
     return [
         DashboardStudentSummary(
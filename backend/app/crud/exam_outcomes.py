@@ -0,0 +1,20 @@
+from sqlalchemy.orm import Session
+from app.models import ExamOutcome
+from app.schema import ExamOutcomeIn
+from typing import List
+
+
+def create_exam_outcome(db: Session, student_id: int, outcome: ExamOutcomeIn) -> ExamOutcome:
+    db_outcome = ExamOutcome(student_id=student_id, **outcome.model_dump())
+    db.add(db_outcome)
+    db.commit()
+    db.refresh(db_outcome)
+    return db_outcome
+
+
+def get_exam_outcomes_for_student(db: Session, student_id: int) -> List[ExamOutcome]:
+    # Newest attempt first; served by ix_exam_outcomes_student_date
+    return db.query(ExamOutcome)\
+        .filter(ExamOutcome.student_id == student_id)\
+        .order_by(ExamOutcome.exam_date.desc(), ExamOutcome.outcome_id.desc())\
+        .all()
@@ -1,25 +1,206 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app.models import Prediction, Student
-from app.schema import PredictionCreate
-from typing import List, Optional
+from sqlalchemy import desc, func, select, delete, insert, or_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import Prediction, PredictionExplanation, Student, StudentLatestPrediction
+from app.schema import PredictionCreate, PredictionOut, StudentRiskSummary
+from app.ml.explain import ExplanationBatch, encode_vector
+from app.crud.trends import record_predictions_in_trends
+from app.services.risk_band_service import reband_latest_predictions
+from typing import List, Optional, Tuple
+from datetime import date
+import math
 
-def create_prediction(db: Session, prediction: PredictionCreate) -> Prediction:
+LATEST_REBUILD_CHUNK_SIZE = 5000
+# Rows per multi-row upsert statement (6 bound parameters each, well under SQLite's limit)
+LATEST_UPSERT_CHUNK_SIZE = 1000
+# Most students one risk ranking returns, in count or percentile mode
+RISK_RANKING_MAX_LIMIT = 1000
+
+def create_prediction(db: Session, prediction: PredictionCreate, explanation: Optional[ExplanationBatch] = None) -> Prediction:
     db_prediction = Prediction(
         student_id=prediction.student_id,
         date=prediction.date,
         predicted_score=prediction.predicted_score,
         category=prediction.category,
-        model_type=prediction.model_type
+        model_type=prediction.model_type,
+        risk_band=prediction.risk_band
     )
     db.add(db_prediction)
+    db.flush()  # To get db_prediction.prediction_id
+    record_predictions_in_trends(db, [db_prediction])  # Before the latest row moves: flips compare against it
+    upsert_latest_prediction(db, db_prediction)
+    if explanation is not None:
+        save_prediction_explanations(db, [db_prediction.prediction_id], explanation)
     db.commit()
     db.refresh(db_prediction)
     return db_prediction
 
-def get_predictions_by_student_id(db: Session, student_id: int) -> List[Prediction]:
-    return db.query(Prediction)\
-             .filter(Prediction.student_id == student_id)\
+def create_predictions_bulk(
+    db: Session,
+    predictions: List[PredictionCreate],
+    explanations: Optional[ExplanationBatch] = None
+) -> List[Prediction]:
+    """
+    Inserts many predictions and updates their students' latest-prediction rows and the trend
+    rollups in one transaction.
+    `explanations`, if given, holds one row per prediction in the same order.
+    """
+    if not predictions:
+        return []
+    rows = [
+        {
+            "student_id": p.student_id,
+            "date": p.date,
+            "predicted_score": p.predicted_score,
+            "category": p.category,
+            "model_type": p.model_type,
+            "risk_band": p.risk_band,
+        } for p in predictions
+    ]
+    # One multi-row INSERT ... RETURNING instead of the unit of work's per-row INSERTs;
+    # sort_by_parameter_order returns the ids in the order of `rows`
+    returned = db.execute(
+        insert(Prediction).returning(Prediction.prediction_id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    # Detached objects: nothing to expire on commit, so reading them back costs no refresh SELECTs
+    db_predictions = [
+        Prediction(prediction_id=prediction_id, **row)
+        for prediction_id, row in zip(returned, rows)
+    ]
+    record_predictions_in_trends(db, db_predictions)  # Before the latest rows move: flips compare against them
+    upsert_latest_predictions(db, db_predictions)
+    if explanations is not None:
+        save_prediction_explanations(db, [p.prediction_id for p in db_predictions], explanations)
+    db.commit()
+    return db_predictions
+
+def save_prediction_explanations(db: Session, prediction_ids: List[int], explanations: ExplanationBatch) -> None:
+    """Stores row i of `explanations` for prediction_ids[i]. Does not commit."""
+    feature_names = ",".join(explanations.feature_names)
+    db.execute(insert(PredictionExplanation), [
+        {
+            "prediction_id": prediction_id,
+            "space": explanations.space,
+            "base_value": float(explanations.base_values[i]),
+            "feature_names": feature_names,
+            "contributions": encode_vector(explanations.contributions[i]),
+            "feature_values": encode_vector(explanations.feature_values[i]),
+        } for i, prediction_id in enumerate(prediction_ids)
+    ])
+
+def get_prediction_explanation(db: Session, prediction_id: int) -> Optional[PredictionExplanation]:
+    return db.get(PredictionExplanation, prediction_id)
+
+def upsert_latest_prediction(db: Session, prediction: Prediction) -> None:
+    upsert_latest_predictions(db, [prediction])
+
+def upsert_latest_predictions(db: Session, predictions: List[Prediction]) -> None:
+    """
+    Points each student's StudentLatestPrediction row at the given prediction unless the row
+    already references a newer one (later date, or same date and higher prediction_id).
+    Does not commit; runs inside the caller's transaction.
+    """
+    # A statement may not upsert the same student twice; keep the newest when a batch has several
+    newest_by_student = {}
+    for p in predictions:
+        current = newest_by_student.get(p.student_id)
+        if current is None or (p.date, p.prediction_id) > (current.date, current.prediction_id):
+            newest_by_student[p.student_id] = p
+    rows = [
+        {
+            "student_id": p.student_id,
+            "prediction_id": p.prediction_id,
+            "date": p.date,
+            "predicted_score": p.predicted_score,
+            "category": p.category,
+            "risk_band": p.risk_band,
+        } for p in newest_by_student.values()
+    ]
+    for start in range(0, len(rows), LATEST_UPSERT_CHUNK_SIZE):
+        db.execute(_latest_prediction_upsert(rows[start:start + LATEST_UPSERT_CHUNK_SIZE]))
+
+def _latest_prediction_upsert(rows: List[dict]):
+    stmt = sqlite_insert(StudentLatestPrediction).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StudentLatestPrediction.student_id],
+        set_={
+            "prediction_id": stmt.excluded.prediction_id,
+            "date": stmt.excluded.date,
+            "predicted_score": stmt.excluded.predicted_score,
+            "category": stmt.excluded.category,
+            "risk_band": stmt.excluded.risk_band,
+        },
+        where=or_(
+            stmt.excluded.date > StudentLatestPrediction.date,
+            and_(
+                stmt.excluded.date == StudentLatestPrediction.date,
+                stmt.excluded.prediction_id > StudentLatestPrediction.prediction_id,
+            ),
+        ),
+    )
+    return stmt
+
+def rebuild_latest_predictions(db: Session, student_ids: Optional[List[int]] = None, commit: bool = True) -> int:
+    """
+    Recomputes StudentLatestPrediction from the predictions history, either for every
+    student or only for `student_ids`. Used to backfill the table and after history is rewritten.
+    The rows copied from history carry the band and category assigned at inference time, so
+    the current thresholds are applied again. With commit=False the caller commits, so the
+    rebuild joins the transaction that rewrote the history. Returns the number of latest-prediction rows written.
+    """
+    if student_ids is None:
+        written = _rebuild_latest_predictions_chunk(db, None)
+    else:
+        written = 0
+        for start in range(0, len(student_ids), LATEST_REBUILD_CHUNK_SIZE):
+            written += _rebuild_latest_predictions_chunk(db, student_ids[start:start + LATEST_REBUILD_CHUNK_SIZE])
+    reband_latest_predictions(db, student_ids)
+    if commit:
+        db.commit()
+    return written
+
+def _rebuild_latest_predictions_chunk(db: Session, student_ids: Optional[List[int]]) -> int:
+    ranked = select(
+        Prediction.student_id,
+        Prediction.prediction_id,
+        Prediction.date,
+        Prediction.predicted_score,
+        Prediction.category,
+        Prediction.risk_band,
+        func.row_number().over(
+            partition_by=Prediction.student_id,
+            order_by=(desc(Prediction.date), desc(Prediction.prediction_id)),
+        ).label("rn"),
+    )
+    clear_stmt = delete(StudentLatestPrediction)
+    if student_ids is not None:
+        ranked = ranked.where(Prediction.student_id.in_(student_ids))
+        clear_stmt = clear_stmt.where(StudentLatestPrediction.student_id.in_(student_ids))
+    ranked = ranked.subquery()
+
+    db.execute(clear_stmt)
+    result = db.execute(
+        sqlite_insert(StudentLatestPrediction).from_select(
+            ["student_id", "prediction_id", "date", "predicted_score", "category", "risk_band"],
+            select(ranked.c.student_id, ranked.c.prediction_id, ranked.c.date,
+                   ranked.c.predicted_score, ranked.c.category, ranked.c.risk_band).where(ranked.c.rn == 1),
+        )
+    )
+    return result.rowcount or 0
+
+def _filter_date_range(query, start_date: Optional[date], end_date: Optional[date]):
+    # Inclusive on both ends; served by ix_predictions_student_date
+    if start_date is not None:
+        query = query.filter(Prediction.date >= start_date)
+    if end_date is not None:
+        query = query.filter(Prediction.date <= end_date)
+    return query
+
+def get_predictions_by_student_id(
+    db: Session, student_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None
+) -> List[Prediction]:
+    query = db.query(Prediction).filter(Prediction.student_id == student_id)
+    return _filter_date_range(query, start_date, end_date)\
              .order_by(desc(Prediction.date), desc(Prediction.prediction_id))\
              .all()
 
@@ -29,31 +210,92 @@ def get_latest_prediction_for_student(db: Session, student_id: int) -> Optional[
              .order_by(desc(Prediction.date), desc(Prediction.prediction_id))\
              .first()
 
-def get_predictions_by_class(db: Session, program: str, section: str) -> List[Prediction]:
+def get_predictions_by_class(
+    db: Session, program: str, section: str, start_date: Optional[date] = None, end_date: Optional[date] = None
+) -> List[Prediction]:
     """
-    Gets all historical predictions for all students in a given class.
+    Gets historical predictions for all students in a given class, optionally limited to a date range.
     """
-    return db.query(Prediction)\
-             .join(Student, Prediction.student_id == Student.student_id)\
-             .filter(Student.program == program, Student.section == section)\
+    query = db.query(Prediction)\
+              .join(Student, Prediction.student_id == Student.student_id)\
+              .filter(Student.program == program, Student.section == section)
+    return _filter_date_range(query, start_date, end_date)\
              .order_by(Student.student_id, desc(Prediction.date), desc(Prediction.prediction_id))\
              .all()
 
-def get_latest_predictions_for_students_in_class(db: Session, program: str, section: str) -> List[Prediction]:
+def get_latest_predictions_for_students_in_class(db: Session, program: str, section: str) -> List[PredictionOut]:
     """
-    Gets only the latest prediction for each student in a given class.
+    Gets only the latest prediction for each student in a given class, in one query
+    through the StudentLatestPrediction pointers. Category and risk band come from the
+    latest row, which follows threshold changes, like the dashboard and the risk ranking.
     """
-    students_in_class = db.query(Student.student_id)\
-        .filter(Student.program == program, Student.section == section).all()
+    rows = db.query(Prediction, StudentLatestPrediction.category, StudentLatestPrediction.risk_band)\
+             .join(StudentLatestPrediction, StudentLatestPrediction.prediction_id == Prediction.prediction_id)\
+             .join(Student, Student.student_id == StudentLatestPrediction.student_id)\
+             .filter(Student.program == program, Student.section == section)\
+             .order_by(Student.student_id)\
+             .all()
+    return [
+        PredictionOut.model_validate(prediction).model_copy(update={"category": category, "risk_band": risk_band})
+        for prediction, category, risk_band in rows
+    ]
 
-    latest_predictions_list = []
-    student_ids_in_class = [s.student_id for s in students_in_class]
+def get_risk_ranking(
+    db: Session,
+    program: Optional[str] = None,
+    section: Optional[str] = None,
+    limit: Optional[int] = 20,
+    percentile: Optional[float] = None,
+) -> Tuple[int, List[StudentRiskSummary]]:
+    """
+    Ranks students by their latest predicted pass probability, lowest (most at risk) first.
+    Either returns the top `limit` students or, when `percentile` is given, the bottom
+    `percentile` percent of the ranked population, capped at RISK_RANKING_MAX_LIMIT rows.
+    Returns (total_ranked, rows).
 
-    if not student_ids_in_class:
-        return []
+    Rows are read in predicted_score order from ix_student_latest_predictions_score and
+    SQLite stops after the requested number of rows, so no full sort of predictions happens.
+    """
+    def _class_filter(query):
+        if program is not None:
+            query = query.filter(Student.program == program)
+        if section is not None:
+            query = query.filter(Student.section == section)
+        return query
+
+    count_query = db.query(func.count(StudentLatestPrediction.student_id))
+    if program is not None or section is not None:
+        count_query = _class_filter(
+            count_query.join(Student, Student.student_id == StudentLatestPrediction.student_id)
+        )
+    total_ranked = count_query.scalar() or 0
+    if total_ranked == 0:
+        return 0, []
+
+    if percentile is not None:
+        limit = max(1, math.ceil(total_ranked * percentile / 100.0))
+    limit = min(limit, RISK_RANKING_MAX_LIMIT)
+
+    rows = _class_filter(
+        db.query(StudentLatestPrediction, Student)
+          .join(Student, Student.student_id == StudentLatestPrediction.student_id)
+    ).order_by(StudentLatestPrediction.predicted_score.asc(), StudentLatestPrediction.student_id.asc())\
+     .limit(limit).all()
 
-    for student_id in student_ids_in_class:
-        latest_pred = get_latest_prediction_for_student(db, student_id)
-        if latest_pred:
-            latest_predictions_list.append(latest_pred)
-    return latest_predictions_list
+    ranking = [
+        StudentRiskSummary(
+            student_id=student.student_id,
+            first_name=student.first_name,
+            last_name=student.last_name,
+            program=student.program,
+            section=student.section,
+            avg_test_score=round(student.avg_test_score, 2) if student.avg_test_score is not None else None,
+            predicted_score=latest.predicted_score,
+            category=latest.category,
+            risk_band=latest.risk_band,
+            prediction_date=latest.date,
+            rank=rank,
+            percentile=round(rank / total_ranked * 100, 2),
+        ) for rank, (latest, student) in enumerate(rows, start=1)
+    ]
+    return total_ranked, ranking
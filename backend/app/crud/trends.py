@@ -0,0 +1,162 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import Prediction, PredictionTrendRollup, Student, StudentLatestPrediction
+from app.schema import TrendPoint
+from typing import Dict, List, Optional
+from datetime import date
+
+# Students whose previous prediction is read per statement (one bound parameter each)
+TREND_LOOKUP_CHUNK_SIZE = 5000
+# Rows per multi-row upsert statement (9 bound parameters each)
+TREND_UPSERT_CHUNK_SIZE = 1000
+TREND_GRANULARITIES = ("day", "week", "month")
+_COUNTER_COLUMNS = ("prediction_count", "probability_sum", "pass_count", "fail_count", "flips_to_pass", "flips_to_fail")
+
+
+def record_predictions_in_trends(db: Session, predictions: List[Prediction]) -> None:
+    """
+    Adds new predictions to their class/day rollups. Flips are detected against each student's
+    latest prediction, so this must run before upsert_latest_predictions. Does not commit.
+    A prediction dated before the student's latest one is counted but never as a flip.
+    """
+    student_ids = sorted({p.student_id for p in predictions})
+    students = {}
+    for start in range(0, len(student_ids), TREND_LOOKUP_CHUNK_SIZE):
+        chunk = student_ids[start:start + TREND_LOOKUP_CHUNK_SIZE]
+        students.update({
+            row.student_id: row for row in db.execute(
+                select(Student.student_id, Student.program, Student.section,
+                       StudentLatestPrediction.date, StudentLatestPrediction.prediction_id, StudentLatestPrediction.category)
+                .outerjoin(StudentLatestPrediction, StudentLatestPrediction.student_id == Student.student_id)
+                .where(Student.student_id.in_(chunk))
+            )
+        })
+
+    previous = {
+        student_id: (row.date, row.prediction_id, row.category)
+        for student_id, row in students.items() if row.prediction_id is not None
+    }
+    buckets: Dict[tuple, Dict[str, float]] = {}
+    for p in sorted(predictions, key=lambda p: (p.date, p.prediction_id)):
+        student = students.get(p.student_id)
+        program, section = (student.program or "", student.section or "") if student is not None else ("", "")
+        key = (program, section, p.date)
+        bucket = buckets.setdefault(key, dict.fromkeys(_COUNTER_COLUMNS, 0))
+        bucket["prediction_count"] += 1
+        bucket["probability_sum"] += p.predicted_score
+        bucket["pass_count" if p.category == "Pass" else "fail_count"] += 1
+        prior = previous.get(p.student_id)
+        if prior is None or (p.date, p.prediction_id) > (prior[0], prior[1]):
+            if prior is not None and prior[2] != p.category:
+                bucket["flips_to_pass" if p.category == "Pass" else "flips_to_fail"] += 1
+            previous[p.student_id] = (p.date, p.prediction_id, p.category)
+
+    rows = [
+        {"program": program, "section": section, "bucket_date": bucket_date, **counters}
+        for (program, section, bucket_date), counters in buckets.items()
+    ]
+    for start in range(0, len(rows), TREND_UPSERT_CHUNK_SIZE):
+        stmt = sqlite_insert(PredictionTrendRollup).values(rows[start:start + TREND_UPSERT_CHUNK_SIZE])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[PredictionTrendRollup.program, PredictionTrendRollup.section, PredictionTrendRollup.bucket_date],
+            set_={name: getattr(PredictionTrendRollup, name) + stmt.excluded[name] for name in _COUNTER_COLUMNS},
+        ))
+
+
+def rebuild_trend_rollups(db: Session) -> int:
+    """
+    Recomputes every rollup row from the predictions history (backfill, or after history was
+    rewritten). Students are attributed to their current program and section. Returns the row count.
+    """
+    ordered = select(
+        Prediction.student_id,
+        Prediction.date,
+        Prediction.predicted_score,
+        Prediction.category,
+        func.lag(Prediction.category).over(
+            partition_by=Prediction.student_id, order_by=(Prediction.date, Prediction.prediction_id),
+        ).label("previous_category"),
+    ).subquery()
+    is_pass = ordered.c.category == "Pass"
+    flipped = and_(ordered.c.previous_category.is_not(None), ordered.c.previous_category != ordered.c.category)
+    aggregated = (
+        select(
+            func.coalesce(Student.program, ""),
+            func.coalesce(Student.section, ""),
+            ordered.c.date,
+            func.count(),
+            func.sum(ordered.c.predicted_score),
+            func.sum(case((is_pass, 1), else_=0)),
+            func.sum(case((is_pass, 0), else_=1)),
+            func.sum(case((and_(flipped, is_pass), 1), else_=0)),
+            func.sum(case((and_(flipped, ~is_pass), 1), else_=0)),
+        )
+        .join(Student, Student.student_id == ordered.c.student_id)
+        .group_by(func.coalesce(Student.program, ""), func.coalesce(Student.section, ""), ordered.c.date)
+    )
+    db.execute(delete(PredictionTrendRollup))
+    result = db.execute(
+        sqlite_insert(PredictionTrendRollup).from_select(
+            ["program", "section", "bucket_date", *_COUNTER_COLUMNS], aggregated
+        )
+    )
+    db.commit()
+    return result.rowcount or 0
+
+
+def _bucket_start(granularity: str):
+    if granularity == "week":
+        # Monday of the bucket_date's week
+        return func.date(PredictionTrendRollup.bucket_date, "weekday 0", "-6 days")
+    if granularity == "month":
+        return func.date(PredictionTrendRollup.bucket_date, "start of month")
+    return PredictionTrendRollup.bucket_date
+
+
+def get_trend_points(
+    db: Session,
+    granularity: str = "week",
+    program: Optional[str] = None,
+    section: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    by_class: bool = False,
+) -> List[TrendPoint]:
+    """
+    Trend series from the rollups, one point per bucket (per class and bucket with by_class).
+    Filters and the date range apply to the daily rows before they are summed.
+    """
+    bucket = _bucket_start(granularity).label("bucket_start")
+    group_columns = [bucket]
+    if by_class:
+        group_columns = [PredictionTrendRollup.program, PredictionTrendRollup.section, bucket]
+    query = select(
+        *group_columns,
+        *(func.sum(getattr(PredictionTrendRollup, name)).label(name) for name in _COUNTER_COLUMNS),
+    )
+    if program is not None:
+        query = query.where(PredictionTrendRollup.program == program)
+    if section is not None:
+        query = query.where(PredictionTrendRollup.section == section)
+    if start_date is not None:
+        query = query.where(PredictionTrendRollup.bucket_date >= start_date)
+    if end_date is not None:
+        query = query.where(PredictionTrendRollup.bucket_date <= end_date)
+    query = query.group_by(*group_columns).order_by(bucket, *group_columns[:-1])
+
+    return [
+        TrendPoint(
+            bucket_start=row.bucket_start,
+            program=row.program if by_class else program,
+            section=row.section if by_class else section,
+            predictions=row.prediction_count,
+            mean_probability=round(row.probability_sum / row.prediction_count, 4) if row.prediction_count else None,
+            pass_count=row.pass_count,
+            fail_count=row.fail_count,
+            flips_to_pass=row.flips_to_pass,
+            flips_to_fail=row.flips_to_fail,
+            flips=row.flips_to_pass + row.flips_to_fail,
+        )
+        for row in db.execute(query)
+    ]
@@ -1,9 +1,14 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.models import User, Student, StudentFeatureSet
 from app.auth.utils import get_password_hash # Assuming you have this
 from datetime import date
 import math
 from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def _calculate_student_metrics(
@@ -114,7 +119,7 @@ def create_student_with_features(
         db.refresh(new_student)
     except Exception as e:
         db.rollback()
-        print(f"Error creating student and features: {e}")
+        logger.error("Error creating student and features: %s", e)
         raise
     return new_student
 
@@ -132,68 +137,58 @@ def update_student_with_features(
     test_3_score: Optional[float],
     learn_guide_completed: bool
 ) -> Optional[Student]:
-    student = db.query(Student).filter(Student.student_id == student_id).first()
-    if not student:
-        return None
-
+    """
+    Two statements: UPDATE ... RETURNING for the student, then an upsert of its feature set.
+    The returned Student is detached, so reading it after the commit costs no query.
+    """
     avg_score, improvement_rate, std_dev = _calculate_student_metrics(
         test_1_score, test_2_score, test_3_score
     )
-
-    student.first_name = first_name
-    student.last_name = last_name
-    student.dob = dob
-    student.program = program
-    student.section = section
-    student.test_1_score = test_1_score
-    student.test_2_score = test_2_score
-    student.test_3_score = test_3_score
-    student.avg_test_score = avg_score
-    student.score_improvement_rate = improvement_rate
-    student.test_scores_std_dev = std_dev
-    student.learn_guide_completed = learn_guide_completed
-
-    # Update the related feature set
-    feature_set = db.query(StudentFeatureSet).filter(StudentFeatureSet.student_id == student_id).first()
-    if feature_set:
-        feature_set.test_1_score = test_1_score
-        feature_set.test_2_score = test_2_score
-        feature_set.test_3_score = test_3_score
-        feature_set.avg_test_score = avg_score
-        feature_set.score_improvement_rate = improvement_rate
-        feature_set.test_scores_std_dev = std_dev
-        feature_set.learn_guide_completed = learn_guide_completed
-    else:
-        print(f"Warning: No StudentFeatureSet found for student_id {student_id} during update. Creating one.")
-        feature_set = StudentFeatureSet(
-            student_id=student.student_id,
-            test_1_score=test_1_score, test_2_score=test_2_score, test_3_score=test_3_score,
-            avg_test_score=avg_score, score_improvement_rate=improvement_rate,
-            test_scores_std_dev=std_dev, learn_guide_completed=learn_guide_completed
-        )
-        db.add(feature_set)
+    features = dict(
+        test_1_score=test_1_score,
+        test_2_score=test_2_score,
+        test_3_score=test_3_score,
+        avg_test_score=avg_score,
+        score_improvement_rate=improvement_rate,
+        test_scores_std_dev=std_dev,
+        learn_guide_completed=learn_guide_completed,
+    )
     try:
+        student = db.execute(
+            update(Student)
+            .where(Student.student_id == student_id)
+            .values(first_name=first_name, last_name=last_name, dob=dob, program=program, section=section, **features)
+            .returning(Student)
+        ).scalar_one_or_none()
+        if student is None:
+            db.rollback()
+            return None
+
+        upsert = sqlite_insert(StudentFeatureSet).values(student_id=student_id, **features)
+        db.execute(upsert.on_conflict_do_update(
+            index_elements=[StudentFeatureSet.student_id],
+            set_={name: upsert.excluded[name] for name in features},
+        ))
+        db.expunge(student)
         db.commit()
-        db.refresh(student)
-        if feature_set:
-             db.refresh(feature_set)
     except Exception as e:
         db.rollback()
-        print(f"Error updating student and features: {e}")
+        logger.error("Error updating student and features: %s", e)
         raise
     return student
 
 def delete_student_and_features(db: Session, student_id: int) -> Optional[int]:
-    student = db.query(Student).filter(Student.student_id == student_id).first()
-    if not student:
-        return None
+    """
+    Deletes the student in one statement; feature sets, predictions (and their explanations),
+    the latest-prediction row and exam outcomes go with it through ON DELETE CASCADE.
+    """
     try:
-        # Cascade delete should handle StudentFeatureSet and Prediction due to model relationships
-        deleted_id = student.student_id
-        db.delete(student)
+        deleted_id = db.execute(
+            delete(Student).where(Student.student_id == student_id).returning(Student.student_id)
+        ).scalar_one_or_none()
         db.commit()
         return deleted_id
     except Exception as e:
         db.rollback()
-        print(f"Error deleting student and associated data: {e}")
+        logger.error("Error deleting student and associated data: %s", e)
         raise
@@ -1,10 +1,160 @@
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateTable
+from typing import Set
+import logging
+import os
+import sqlite3
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./main.db"
+logger = logging.getLogger(__name__)
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./main.db")
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
+
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys (and ON DELETE CASCADE) unless enabled per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def _foreign_key_actions(foreign_keys) -> Set[tuple]:
+    return {
+        (tuple(fk["constrained_columns"]), fk["referred_table"], (fk.get("options", {}).get("ondelete") or "").upper())
+        for fk in foreign_keys
+    }
+
+
+def _model_foreign_key_actions(table) -> Set[tuple]:
+    return {
+        (tuple(c.name for c in fk.columns), fk.referred_table.name, (fk.ondelete or "").upper())
+        for fk in table.foreign_key_constraints
+    }
+
+
+def _lacks_autoincrement(bind, table) -> bool:
+    if not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    with bind.connect() as conn:
+        sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+        ).scalar()
+    return sql is not None and "AUTOINCREMENT" not in sql.upper()
+
+
+def _rebuild_table(bind, table, existing_columns: Set[str]) -> bool:
+    """
+    Recreates `table` from the model and copies its rows, for changes SQLite cannot ALTER
+    (foreign key actions, AUTOINCREMENT). Follows SQLite's documented procedure: foreign keys
+    off, new table under a temporary name, copy, drop, rename. Indexes are recreated by
+    ensure_schema. Copying the ids starts an AUTOINCREMENT sequence at the current maximum.
+    """
+    extra = existing_columns - {column.name for column in table.columns}
+    if extra:
+        logger.warning("Not rebuilding %s: it has columns the model lacks (%s).", table.name, ", ".join(sorted(extra)))
+        return False
+    staging_metadata = MetaData()
+    for referred in {fk.column.table for fk in table.foreign_keys}:
+        referred.to_metadata(staging_metadata)  # Lets the copy resolve its foreign keys
+    staging = table.to_metadata(staging_metadata, name=f"{table.name}__rebuild")
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    with bind.connect() as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        conn.commit()
+        try:
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{staging.name}"')
+            conn.execute(CreateTable(staging))
+            conn.exec_driver_sql(f'INSERT INTO "{staging.name}" ({columns}) SELECT {columns} FROM "{table.name}"')
+            conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+            conn.exec_driver_sql(f'ALTER TABLE "{staging.name}" RENAME TO "{table.name}"')
+            orphans = conn.exec_driver_sql(f'PRAGMA foreign_key_check("{table.name}")').fetchall()
+            conn.commit()
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+    if orphans:
+        logger.warning("%s has %d rows whose referenced row no longer exists.", table.name, len(orphans))
+    logger.info("Rebuilt %s to match its model's table options.", table.name)
+    return True
+
+
+def _drop_duplicates_for_unique_index(bind, index) -> None:
+    # A unique index added to an existing table keeps the newest row (highest primary key) per key
+    table = index.table
+    primary_key = table.primary_key.columns.values()[0].name
+    key_columns = ", ".join(f'"{column.name}"' for column in index.columns)
+    with bind.begin() as conn:
+        result = conn.execute(text(
+            f'DELETE FROM "{table.name}" WHERE "{primary_key}" NOT IN '
+            f'(SELECT MAX("{primary_key}") FROM "{table.name}" GROUP BY {key_columns})'
+        ))
+    if result.rowcount:
+        logger.warning("Removed %d duplicate rows from %s before creating %s.", result.rowcount, table.name, index.name)
+
+
+def ensure_schema(bind=None) -> Set[str]:
+    """
+    Brings an existing database up to date with the models without a migration tool:
+    creates missing tables, adds missing (nullable) columns, rebuilds SQLite tables whose
+    foreign key actions or AUTOINCREMENT differ from the models, creates missing indexes,
+    the student search index and the dashboard aggregate triggers. Returns the names of
+    the tables that did not exist before the call.
+    """
+    import app.models  # noqa: F401  (registers every model on Base.metadata)
+
+    bind = bind or engine
+    existing_tables = set(inspect(bind).get_table_names())
+    Base.metadata.create_all(bind=bind)
+    created_tables = {name for name in Base.metadata.tables if name not in existing_tables}
+
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name in created_tables:
+                continue
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                logger.info("Added missing column %s.%s", table.name, column.name)
+
+    if bind.dialect.name == "sqlite":
+        for table in Base.metadata.sorted_tables:
+            if table.name in created_tables:
+                continue
+            if (_foreign_key_actions(inspector.get_foreign_keys(table.name)) != _model_foreign_key_actions(table)
+                    or _lacks_autoincrement(bind, table)):
+                existing_columns = {col["name"] for col in inspect(bind).get_columns(table.name)}
+                _rebuild_table(bind, table, existing_columns)
+
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if table.name in created_tables:
+            continue
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            if index.unique:
+                _drop_duplicates_for_unique_index(bind, index)
+            index.create(bind=bind)
+
+    # Full-text index over students, maintained by triggers (not an ORM model)
+    from app.services.search_service import SEARCH_TABLE, ensure_search_index
+    if ensure_search_index(bind):
+        created_tables.add(SEARCH_TABLE)
+
+    # Dashboard counters, maintained by triggers; new tables are backfilled by the caller
+    from app.crud.dashboard import ensure_dashboard_triggers
+    ensure_dashboard_triggers(bind)
+
+    return created_tables
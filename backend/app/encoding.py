@@ -0,0 +1,220 @@
+"""
+Response encodings: gzip/brotli compression and compact columnar bodies for list endpoints.
+
+CompressionMiddleware compresses complete (non-streamed) responses of at least
+COMPRESSION_MIN_BYTES when the client's Accept-Encoding allows it, preferring brotli
+when the optional `brotli` package is installed. The compressed bytes differ from the
+identity ones, so their ETag is made weak; cached_json_response compares ETags weakly
+and keeps answering 304.
+
+List endpoints can also send one array per column instead of one object per row, so
+keys such as model_type and category are sent once. Selected by the Accept header:
+- application/vnd.pof.columnar+json   always available
+- application/msgpack                 needs the optional `msgpack` package
+- application/vnd.apache.arrow.stream needs the optional `pyarrow` package; repeated
+                                      strings are dictionary-encoded
+Anything else, including */* and application/json, keeps the row-wise JSON. A columnar
+type whose package is missing is treated as not offered.
+"""
+from fastapi import Request, Response
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union
+import gzip
+import json
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Below this many bytes compression costs more time than it saves on the wire
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+# Brotli's quality 11 is meant for static assets; 4 compresses better than gzip -6 and is faster
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/vnd.pof.columnar+json", "application/msgpack")
+
+COLUMNAR_JSON = "application/vnd.pof.columnar+json"
+MSGPACK = "application/msgpack"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def _parse_header_qualities(header: Optional[str]) -> Dict[str, float]:
+    """'gzip, br;q=0.5' -> {'gzip': 1.0, 'br': 0.5}; values are lower-cased."""
+    qualities = {}
+    for part in (header or "").split(","):
+        value, _, params = part.strip().partition(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, raw = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(raw)
+                except ValueError:
+                    quality = 0.0
+        qualities[value] = quality
+    return qualities
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Content-codings this process can produce, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    qualities = _parse_header_qualities(accept_encoding)
+    best, best_quality = None, 0.0
+    for coding in available_encodings():
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete responses; streamed bodies (SSE, exports) pass through."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict((k.lower(), v) for k, v in scope.get("headers", []))
+        coding = choose_content_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough or start_message is None:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._should_compress(start_message, body):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            compressed = compress(body, coding)
+            response_headers = [
+                (k, v) for k, v in start_message["headers"]
+                if k.lower() not in (b"content-length", b"etag", b"vary")
+            ]
+            original = dict((k.lower(), v) for k, v in start_message["headers"])
+            etag = original.get(b"etag")
+            if etag is not None:
+                response_headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+            vary = original.get(b"vary")
+            vary_values = [v.strip() for v in vary.split(b",")] if vary else []
+            if b"accept-encoding" not in (v.lower() for v in vary_values):
+                vary_values.append(b"Accept-Encoding")
+            response_headers += [
+                (b"vary", b", ".join(vary_values)),
+                (b"content-encoding", coding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+            ]
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, start_message, body: bytes) -> bool:
+        if len(body) < self.minimum_size or start_message["status"] in (204, 206, 304):
+            return False
+        headers = dict((k.lower(), v) for k, v in start_message["headers"])
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+# --- Columnar list encodings ---
+
+def available_columnar_types() -> Tuple[str, ...]:
+    types = [COLUMNAR_JSON]
+    if msgpack is not None:
+        types.append(MSGPACK)
+    if pyarrow is not None:
+        types.append(ARROW_STREAM)
+    return tuple(types)
+
+
+def negotiate_columnar(request: Request) -> Optional[str]:
+    """The columnar media type the client prefers over row-wise JSON, or None."""
+    qualities = _parse_header_qualities(request.headers.get("accept"))
+    json_quality = max(qualities.get("application/json", 0.0), qualities.get("*/*", 0.0), qualities.get("application/*", 0.0))
+    best, best_quality = None, json_quality
+    for media_type in available_columnar_types():
+        quality = qualities.get(media_type, 0.0)
+        if quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+def _columns(model: Type[BaseModel], items: Sequence[Any], mode: str) -> Dict[str, List[Any]]:
+    # mode="json" turns dates into ISO strings in pydantic's serializer, far cheaper than jsonable_encoder
+    rows = [(item if isinstance(item, model) else model.model_validate(item)).model_dump(mode=mode) for item in items]
+    return {name: [row[name] for row in rows] for name in model.model_fields}
+
+
+def encode_columnar(model: Type[BaseModel], items: Sequence[Any], media_type: str) -> bytes:
+    """Serializes `items` (models, ORM objects or dicts) as one array per field of `model`."""
+    length = len(items)
+    if media_type == ARROW_STREAM:
+        columns = _columns(model, items, "python")
+        table = pyarrow.table({name: pyarrow.array(values) for name, values in columns.items()})
+        for index, field in enumerate(table.schema):
+            # Low-cardinality strings (program, category, model_type) become one dictionary + int32 codes
+            if pyarrow.types.is_string(field.type) and length and len(set(columns[field.name])) * 2 <= length:
+                table = table.set_column(index, field.name, table.column(index).dictionary_encode())
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    payload = {"length": length, "columns": _columns(model, items, "json")}
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def columnar_response(request: Request, response: Response, model: Type[BaseModel],
+                      items: Sequence[Any]) -> Union[Response, Sequence[Any]]:
+    """
+    For list endpoints: a columnar Response when the Accept header asks for one, otherwise
+    `items` unchanged so FastAPI serializes them with the endpoint's response_model.
+    `response` is the endpoint's injected Response; the JSON answer gets its Vary header
+    from it, since the body depends on Accept either way.
+    """
+    media_type = negotiate_columnar(request)
+    if media_type is None:
+        response.headers["Vary"] = "Accept"
+        return items
+    return Response(content=encode_columnar(model, items, media_type), media_type=media_type, headers={"Vary": "Accept"})
@@ -1,28 +1,84 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Form, Path
+from fastapi import FastAPI, Depends, HTTPException, status, Form, Path, Query, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from app.auth.auth import create_access_token, get_current_user, get_db
+from app.auth.auth import create_access_token, get_current_user, get_current_admin_user, get_db
 from app.crud.users import get_user_by_email, get_all_students, create_student_with_features, update_student_with_features, delete_student_and_features, get_student_by_id
 from app.crud import dashboard as crud_dashboard
+from app.crud import exam_outcomes as crud_exam_outcomes
+from app.crud import trends as crud_trends
 from app.models import User
-from app.schema import StudentOut, PredictionOut, DashboardStatsData, DashboardStatsResponse
+from app.schema import StudentOut, PredictionOut, DashboardStatsData, DashboardStatsResponse, StudentRiskRankingResponse, ScenarioRequest, ScenarioResponse, RetentionReport, PredictionJobOut, ProfileSummary, ProfilingStatus, ModelVersionOut, BatchPredictionRequest, BatchPredictionResponse, PredictionExplanationOut, RiskBandConfigIn, RiskBandConfigOut, ExamOutcomeIn, ExamOutcomeOut, DriftReport, StudentSearchResponse, ChallengerReport, TrendResponse
 from app.auth.utils import verify_password
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from datetime import date
 from typing import List, Optional
+import asyncio
+import json
+import logging
+import os
 
 # <<< START NEW IMPORTS >>>
 from app.crud import predictions as crud_predictions
 from app.services import prediction_service
-from app.services.prediction_service import PredictionError # Import custom exception
+from app.services.prediction_service import PredictionError, ClassPredictionInProgressError # Import custom exception
+from app.services import dashboard_service
+from app.services.dashboard_service import dashboard_broadcaster, DashboardStreamError
+from app.services import retention_service
+from app.services import risk_band_service
+from app.services import search_service
+from app.services.search_service import SearchError
+from app.services.risk_band_service import RiskBandError
+from app.services.retention_service import RetentionError
+from app.services.job_service import job_manager, JobNotFoundError
 from app.ml.model import load_ml_components as load_ml_model # Renamed to avoid conflict
+from app.ml import model as ml_model_module
+from app.ml.drift import drift_monitor
+from app.ml.shadow import shadow_scorer
+from app.coordination import coordination_store, WORKER_ID
+from app.database import SessionLocal, ensure_schema
+from app.replica import DataFreshnessMiddleware, analytics_replica, get_analytics_db
+from app.admission import admit, BULK
+from app.cache import cached_json_response
+from app.encoding import CompressionMiddleware, columnar_response
+from app.metrics import MetricsMiddleware, render_latest as render_metrics
+from app.query_profiler import QueryProfilerMiddleware, QUERY_PROFILER_ENABLED, query_budget
+from app.profiling import ProfilingMiddleware, ProfilingError, instrument_endpoints, profile_store, PROFILING_ENABLED
 # <<< END NEW IMPORTS >>>
 
+logger = logging.getLogger(__name__)
+
+
+def configure_logging() -> None:
+    """
+    Leveled logging for the served app; statements below LOG_LEVEL are not formatted at all.
+    Called when the app starts serving, not on import, and a no-op when the host process
+    already configured the root logger.
+    """
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+
+# Upper bound for one worker's schema sync at startup
+STARTUP_LOCK_TTL_SECONDS = 300
 
 app = FastAPI()
 
+app.add_middleware(MetricsMiddleware)
+if QUERY_PROFILER_ENABLED:
+    # Debug only: per-request SQL statistics, N+1 warnings and query budgets
+    app.add_middleware(QueryProfilerMiddleware)
+# On-demand sampling/cProfile of single requests; a flag check per request when idle
+app.add_middleware(ProfilingMiddleware)
+# gzip/brotli for complete responses above COMPRESSION_MIN_BYTES
+app.add_middleware(CompressionMiddleware)
+# X-Data-As-Of on responses read through get_analytics_db
+app.add_middleware(DataFreshnessMiddleware)
+
 # CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -35,11 +91,60 @@ app.add_middleware(
 # <<< START NEW CODE: STARTUP EVENT >>>
 @app.on_event("startup")
 async def startup_event():
-    print("Application startup: Loading ML model...")
-    load_ml_model()
+    configure_logging()
+    # With several workers, only one migrates and backfills at a time; the others wait
+    with coordination_store.lock("startup-schema", ttl_seconds=STARTUP_LOCK_TTL_SECONDS, wait_seconds=STARTUP_LOCK_TTL_SECONDS):
+        created_tables = ensure_schema()
+        if created_tables & {"student_latest_predictions", "risk_band_configs"}:
+            db = SessionLocal()
+            try:
+                if "student_latest_predictions" in created_tables:
+                    logger.info("Backfilling student_latest_predictions from prediction history...")
+                    crud_predictions.rebuild_latest_predictions(db)
+                # Predictions made before risk bands existed get theirs from the default thresholds
+                logger.info("Assigning risk bands to latest predictions...")
+                risk_band_service.reband_latest_predictions(db)
+                db.commit()
+            finally:
+                db.close()
+        if "prediction_trend_rollups" in created_tables:
+            db = SessionLocal()
+            try:
+                logger.info("Backfilling prediction_trend_rollups from prediction history...")
+                crud_trends.rebuild_trend_rollups(db)
+            finally:
+                db.close()
+        if created_tables & {"dashboard_class_aggregates", "dashboard_risk_band_counts"}:
+            db = SessionLocal()
+            try:
+                logger.info("Backfilling dashboard aggregates from students and latest predictions...")
+                crud_dashboard.rebuild_dashboard_aggregates(db)
+            finally:
+                db.close()
+    logger.info("Application startup: Loading ML model...")
+    if load_ml_model():
+        # The newest process to start defines the model version every worker serves
+        ml_model_module.publish_model_version()
+    # Copies main.db to ANALYTICS_REPLICA_PATH periodically; no-op when unset
+    analytics_replica.start()
+    # Every route is registered by now; cprofile mode profiles endpoints through these wrappers
+    instrument_endpoints(app)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    job_manager.shutdown()
+    shadow_scorer.shutdown()
+    analytics_replica.stop()
+    dashboard_broadcaster.stop()
 # <<< END NEW CODE: STARTUP EVENT >>>
 
 
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Monitoring"])
+def read_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 # Token response model
 class Token(BaseModel):
     access_token: str
@@ -59,13 +164,33 @@ def login(
 
 
 @app.get("/students", response_model=List[StudentOut], tags=["Students"])
+@query_budget(3)
 def read_students(
+    request: Request,
     db: Session = Depends(get_db),
 ):
-    return get_all_students(db)
+    return cached_json_response(
+        request, "students", ("students",),
+        lambda: [StudentOut.model_validate(s) for s in get_all_students(db)],
+        columnar_model=StudentOut,
+    )
+
+@app.get("/students/search", response_model=StudentSearchResponse, tags=["Students"], dependencies=[Depends(admit("read"))])
+@query_budget(2)
+def search_students(
+    q: str = Query(..., min_length=1, max_length=200, title="Words matched as prefixes of names, program and section"),
+    limit: int = Query(20, ge=1, le=search_service.MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0, le=search_service.SEARCH_CANDIDATE_LIMIT),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    try:
+        return search_service.search_students(db, q, limit=limit, offset=offset)
+    except SearchError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
-@app.post("/students", response_model=StudentOut, status_code=status.HTTP_201_CREATED, tags=["Students"])
+@app.post("/students", response_model=StudentOut, status_code=status.HTTP_201_CREATED, tags=["Students"], dependencies=[Depends(admit("write", per_user=False))])
 def create_student_endpoint(
     first_name: str = Form(...),
     last_name: str = Form(...),
@@ -104,11 +229,11 @@ def create_student_endpoint(
         raise
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"SQLAlchemyError creating student: {e}")
+        logger.error("SQLAlchemyError creating student: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error: Could not save student.")
     except Exception as e:
         db.rollback()
-        print(f"Unexpected error creating student: {e}")
+        logger.exception("Unexpected error creating student: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {str(e)}")
 
 # test
@@ -121,54 +246,63 @@ def read_dashboard(current_user: User = Depends(get_current_user)):
          }
      }
 
-@app.get("/dashboard-stats", response_model=DashboardStatsResponse, tags=["Dashboard"])
+@app.get("/dashboard-stats", response_model=DashboardStatsResponse, tags=["Dashboard"], dependencies=[Depends(admit("aggregate"))])
+@query_budget(7)
 async def get_dashboard_statistics(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_db), # Primary: /dashboard-stats/events sends deltas from it, so the snapshot must match
     current_user: User = Depends(get_current_user) # Protect this endpoint
 ):
-    try:
-        total_students = crud_dashboard.get_total_students(db)
-        total_programs = crud_dashboard.get_total_unique_programs(db)
-        total_sections = crud_dashboard.get_total_unique_sections(db)
-        overall_avg_score = crud_dashboard.get_overall_average_score(db)
-        learn_guide_rate = crud_dashboard.get_learn_guide_completion_rate(db)
-        at_risk_count = crud_dashboard.get_students_at_risk_count(db) # Default threshold 60
-        students_per_program = crud_dashboard.get_students_per_program(db)
-        students_per_section = crud_dashboard.get_students_per_section(db)
-        avg_score_per_program = crud_dashboard.get_average_score_per_program(db)
-        score_distribution = crud_dashboard.get_overall_score_distribution(db)
-        learn_guide_by_program = crud_dashboard.get_learn_guide_status_per_program(db)
-        recent_students_list = crud_dashboard.get_recent_students(db) # Default limit 5
-        low_performers_list = crud_dashboard.get_low_performing_students(db) # Default threshold 60, limit 5
-
-        dashboard_data = DashboardStatsData(
-            total_students=total_students,
-            total_programs=total_programs,
-            total_sections=total_sections,
-            overall_average_score=overall_avg_score,
-            learn_guide_completion_rate=learn_guide_rate,
-            students_at_risk_count=at_risk_count,
-            students_per_program=students_per_program,
-            students_per_section=students_per_section,
-            average_score_per_program=avg_score_per_program,
-            overall_score_distribution=score_distribution,
-            learn_guide_status_per_program=learn_guide_by_program,
-            recent_students=recent_students_list,
-            low_performing_students=low_performers_list,
-        )
-
+    def build_dashboard_statistics() -> DashboardStatsResponse:
+        # Sums of the per-class aggregates kept current by triggers; no scan of students
         return DashboardStatsResponse(
             message=f"Dashboard statistics for {current_user.email}", # Or just "Dashboard Data"
-            data=dashboard_data
+            data=dashboard_service.build_dashboard_data(db),
+        )
+
+    try:
+        # The message echoes the user's email, so the cache key is per user
+        return cached_json_response(
+            request, f"dashboard-stats|{current_user.email}",
+            dashboard_service.DASHBOARD_TABLES, build_dashboard_statistics
         )
     except SQLAlchemyError as e:
-        print(f"SQLAlchemyError fetching dashboard stats: {e}")
+        logger.error("SQLAlchemyError fetching dashboard stats: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error fetching dashboard statistics.")
     except Exception as e:
-        print(f"Unexpected error fetching dashboard stats: {e}")
+        logger.exception("Unexpected error fetching dashboard stats: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred while fetching dashboard statistics.")
 
-@app.put("/students/{student_id}", response_model=StudentOut, tags=["Students"])
+@app.get("/dashboard-stats/events", tags=["Dashboard"])
+async def stream_dashboard_events(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Server-Sent Events: a "snapshot" of the dashboard data, then a "delta" with only the
+    # fields that changed after each write (see app.services.dashboard_service)
+    db.close()  # Dependencies stay open until the stream ends; don't hold a pooled connection for hours
+    try:
+        queue, sequence, snapshot = await dashboard_broadcaster.subscribe()
+    except DashboardStreamError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    async def event_stream():
+        try:
+            yield f"id: {sequence}\nevent: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            while True:
+                try:
+                    name, event_id, payload = await asyncio.wait_for(queue.get(), dashboard_service.DASHBOARD_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: {name}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            dashboard_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.put("/students/{student_id}", response_model=StudentOut, tags=["Students"], dependencies=[Depends(admit("write", per_user=False))])
+@query_budget(2)
 def update_student_endpoint(
     student_id: int = Path(..., title="The ID of the student to update", ge=1),
     first_name: str = Form(...),
@@ -212,14 +346,15 @@ def update_student_endpoint(
         raise
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"SQLAlchemyError updating student: {e}")
+        logger.error("SQLAlchemyError updating student: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error: Could not update student.")
     except Exception as e:
         db.rollback()
-        print(f"Unexpected error updating student: {e}")
+        logger.exception("Unexpected error updating student: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {str(e)}")
 
-@app.delete("/students/{student_id}", status_code=status.HTTP_200_OK, tags=["Students"])
+@app.delete("/students/{student_id}", status_code=status.HTTP_200_OK, tags=["Students"], dependencies=[Depends(admit("write", per_user=False))])
+@query_budget(1)
 def delete_student_endpoint(
     student_id: int = Path(..., title="The ID of the student to delete", ge=1),
     db: Session = Depends(get_db),
@@ -235,91 +370,465 @@ def delete_student_endpoint(
         raise
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"SQLAlchemyError deleting student: {e}")
+        logger.error("SQLAlchemyError deleting student: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error: Could not delete student.")
     except Exception as e:
         db.rollback()
-        print(f"Unexpected error deleting student: {e}")
+        logger.exception("Unexpected error deleting student: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {str(e)}")
 
 
 # <<< START NEW PREDICTION ENDPOINTS >>>
-@app.post("/students/{student_id}/predict", response_model=PredictionOut, tags=["Predictions"])
+@app.post("/students/{student_id}/predict", response_model=PredictionOut, tags=["Predictions"], dependencies=[Depends(admit("inference"))])
+@query_budget(8)
 async def trigger_prediction_for_student(
     student_id: int = Path(..., title="The ID of the student", ge=1),
+    explain: bool = Query(False, title="Include and store per-feature contributions"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user) # Protected endpoint
 ):
     try:
-        prediction = prediction_service.generate_and_save_prediction_for_student(db, student_id)
+        prediction = prediction_service.generate_and_save_prediction_for_student(db, student_id, explain=explain)
         return prediction
     except PredictionError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"SQLAlchemyError during student prediction: {e}")
+        logger.error("SQLAlchemyError during student prediction: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during prediction.")
     except Exception as e:
         db.rollback()
-        print(f"Unexpected error during student prediction: {e}")
+        logger.exception("Unexpected error during student prediction: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred during prediction.")
 
-@app.get("/students/{student_id}/predictions", response_model=List[PredictionOut], tags=["Predictions"])
+@app.get("/students/{student_id}/predictions", response_model=List[PredictionOut], tags=["Predictions"], dependencies=[Depends(admit("read"))])
+@query_budget(4)
 async def get_student_prediction_history(
+    request: Request,
+    response: Response,
     student_id: int = Path(..., title="The ID of the student", ge=1),
-    db: Session = Depends(get_db),
+    start_date: Optional[date] = Query(None, title="Only predictions on or after this date"),
+    end_date: Optional[date] = Query(None, title="Only predictions on or before this date"),
+    db: Session = Depends(get_db), # Primary: a student's own history must show the prediction just made
     current_user: User = Depends(get_current_user) # Protected endpoint
 ):
     student = get_student_by_id(db, student_id) # from app.crud.users
     if not student:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found")
-    predictions = crud_predictions.get_predictions_by_student_id(db, student_id)
-    return predictions
+    predictions = crud_predictions.get_predictions_by_student_id(db, student_id, start_date=start_date, end_date=end_date)
+    return columnar_response(request, response, PredictionOut, predictions)
+
+
+@app.post("/students/{student_id}/exam-outcomes", response_model=ExamOutcomeOut, status_code=status.HTTP_201_CREATED, tags=["Students"], dependencies=[Depends(admit("write"))])
+@query_budget(4)
+def record_exam_outcome(
+    outcome: ExamOutcomeIn,
+    student_id: int = Path(..., title="The ID of the student", ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Actual exam results are the training labels for train_model.py
+    if not get_student_by_id(db, student_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found")
+    return crud_exam_outcomes.create_exam_outcome(db, student_id, outcome)
 
+@app.get("/students/{student_id}/exam-outcomes", response_model=List[ExamOutcomeOut], tags=["Students"], dependencies=[Depends(admit("read"))])
+@query_budget(3)
+def list_exam_outcomes(
+    request: Request,
+    response: Response,
+    student_id: int = Path(..., title="The ID of the student", ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    if not get_student_by_id(db, student_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found")
+    return columnar_response(request, response, ExamOutcomeOut, crud_exam_outcomes.get_exam_outcomes_for_student(db, student_id))
 
-@app.post("/predictions/class/{program}/{section}", response_model=List[PredictionOut], tags=["Predictions"])
+@app.post("/predictions/class/{program}/{section}", response_model=List[PredictionOut], tags=["Predictions"], dependencies=[Depends(admit("inference", BULK))])
+@query_budget(7)
 async def trigger_predictions_for_class(
     program: str = Path(..., title="Program name"),
     section: str = Path(..., title="Section name"),
+    explain: bool = Query(False, title="Include and store per-feature contributions"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user) # Protected endpoint
 ):
     try:
-        predictions = prediction_service.generate_and_save_predictions_for_class(db, program, section)
+        predictions = prediction_service.generate_and_save_predictions_for_class(db, program, section, explain=explain)
         if not predictions:
             pass
         return predictions
+    except ClassPredictionInProgressError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except PredictionError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"SQLAlchemyError during class prediction: {e}")
+        logger.error("SQLAlchemyError during class prediction: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during class prediction.")
     except Exception as e:
         db.rollback()
-        print(f"Unexpected error during class prediction: {e}")
+        logger.exception("Unexpected error during class prediction: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred during class prediction.")
 
 
-@app.get("/predictions/class/{program}/{section}/latest", response_model=List[PredictionOut], tags=["Predictions"])
+@app.post("/predictions/batch", response_model=BatchPredictionResponse, tags=["Predictions"], dependencies=[Depends(admit("inference", BULK))])
+@query_budget(7)
+def predict_batch(
+    request: BatchPredictionRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # A plain def: scoring up to MAX_BATCH_PREDICTION_ITEMS rows runs in the threadpool, off the event loop
+    try:
+        return prediction_service.predict_batch(db, request)
+    except PredictionError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("SQLAlchemyError during batch prediction: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during batch prediction.")
+    except Exception as e:
+        db.rollback()
+        logger.exception("Unexpected error during batch prediction: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred during batch prediction.")
+
+
+@app.get("/predictions/{prediction_id}/explanation", response_model=PredictionExplanationOut, tags=["Predictions"], dependencies=[Depends(admit("read"))])
+@query_budget(3)
+async def get_prediction_explanation(
+    prediction_id: int = Path(..., title="The ID of the prediction", ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    explanation = crud_predictions.get_prediction_explanation(db, prediction_id)
+    if explanation is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No explanation stored for prediction {prediction_id}.")
+    return prediction_service.explanation_from_row(explanation)
+
+
+@app.get("/predictions/class/{program}/{section}/latest", response_model=List[PredictionOut], tags=["Predictions"], dependencies=[Depends(admit("read"))])
+@query_budget(3)
 async def get_latest_predictions_for_class(
+    request: Request,
     program: str = Path(..., title="Program name"),
     section: str = Path(..., title="Section name"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user) # Protected endpoint
 ):
-    predictions = crud_predictions.get_latest_predictions_for_students_in_class(db, program, section)
-    return predictions
-
-@app.get("/predictions/class/{program}/{section}/history", response_model=List[PredictionOut], tags=["Predictions"])
+    return cached_json_response(
+        request, f"latest|{program}|{section}", ("students", "predictions", "student_latest_predictions"),
+        lambda: crud_predictions.get_latest_predictions_for_students_in_class(db, program, section),
+        columnar_model=PredictionOut,
+    )
+
+@app.get("/predictions/class/{program}/{section}/history", response_model=List[PredictionOut], tags=["Predictions"], dependencies=[Depends(admit("read"))])
+@query_budget(3)
 async def get_historical_predictions_for_class(
+    request: Request,
+    response: Response,
     program: str = Path(..., title="Program name"),
     section: str = Path(..., title="Section name"),
-    db: Session = Depends(get_db),
+    start_date: Optional[date] = Query(None, title="Only predictions on or after this date"),
+    end_date: Optional[date] = Query(None, title="Only predictions on or before this date"),
+    db: Session = Depends(get_analytics_db), # The analytics replica while it is fresh enough
     current_user: User = Depends(get_current_user) # Protected endpoint
 ):
     # This retrieves all historical predictions for students in that class.
-    predictions = crud_predictions.get_predictions_by_class(db, program, section)
-    return predictions
+    predictions = crud_predictions.get_predictions_by_class(db, program, section, start_date=start_date, end_date=end_date)
+    return columnar_response(request, response, PredictionOut, predictions)
+
+@app.get("/predictions/risk-ranking", response_model=StudentRiskRankingResponse, tags=["Predictions"], dependencies=[Depends(admit("aggregate"))])
+@query_budget(4)
+async def get_prediction_risk_ranking(
+    program: Optional[str] = Query(None, title="Only rank students in this program"),
+    section: Optional[str] = Query(None, title="Only rank students in this section"),
+    limit: int = Query(20, ge=1, le=crud_predictions.RISK_RANKING_MAX_LIMIT, title="Number of most at-risk students to return"),
+    percentile: Optional[float] = Query(None, gt=0, le=100, title="Return the bottom N percent instead of a fixed count (at most the limit cap)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Ranks by each student's latest predicted pass probability, lowest first.
+    total_ranked, students = crud_predictions.get_risk_ranking(
+        db, program=program, section=section, limit=limit, percentile=percentile
+    )
+    return StudentRiskRankingResponse(total_ranked=total_ranked, students=students)
+
+@app.post("/students/{student_id}/what-if", response_model=ScenarioResponse, tags=["Predictions"], dependencies=[Depends(admit("inference"))])
+@query_budget(3)
+def simulate_student_scenarios(
+    scenario: ScenarioRequest,
+    student_id: int = Path(..., title="The ID of the student", ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Hypothetical predictions only; nothing is saved. A plain def: model scoring runs in the threadpool, off the event loop
+    try:
+        return prediction_service.simulate_scenarios_for_student(db, student_id, scenario)
+    except PredictionError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during scenario simulation: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred during scenario simulation.")
+
+@app.post("/predictions/class/{program}/{section}/what-if", response_model=ScenarioResponse, tags=["Predictions"], dependencies=[Depends(admit("inference", BULK))])
+@query_budget(3)
+def simulate_class_scenarios(
+    scenario: ScenarioRequest,
+    program: str = Path(..., title="Program name"),
+    section: str = Path(..., title="Section name"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # A plain def like the student what-if: scoring a whole class's grid must not block the event loop
+    try:
+        return prediction_service.simulate_scenarios_for_class(db, program, section, scenario)
+    except PredictionError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.exception("Unexpected error during class scenario simulation: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred during scenario simulation.")
+
+@app.post("/predictions/retention", response_model=RetentionReport, tags=["Predictions"], dependencies=[Depends(admit("write", BULK))])
+def run_prediction_retention(
+    full_detail_days: int = Query(retention_service.RETENTION_FULL_DETAIL_DAYS, ge=0, title="Keep every prediction newer than this many days"),
+    granularity: str = Query(retention_service.RETENTION_GRANULARITY, title="Compact older history to one row per 'day' or 'week'"),
+    drop_unchanged: bool = Query(True, title="Also drop old rows identical to the previous prediction"),
+    archive: Optional[str] = Query(None, title="Archive removed rows to 'table' or 'file'"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    try:
+        return retention_service.run_retention(
+            db, full_detail_days=full_detail_days, granularity=granularity,
+            drop_unchanged=drop_unchanged, archive=archive,
+        )
+    except RetentionError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("SQLAlchemyError during prediction retention: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during prediction retention.")
+
+# --- Background prediction jobs ---
+JOB_EVENTS_POLL_SECONDS = 0.25
+
+def _job_viewer(user: User) -> Optional[int]:
+    # Admins see every job; anyone else only the jobs they submitted
+    return None if user.role == "admin" else user.id
+
+@app.post("/predictions/class/{program}/{section}/jobs", response_model=PredictionJobOut, status_code=status.HTTP_202_ACCEPTED, tags=["Jobs"], dependencies=[Depends(admit("write", BULK))])
+@query_budget(2)
+async def submit_class_prediction_job(
+    program: str = Path(..., title="Program name"),
+    section: str = Path(..., title="Section name"),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Returns immediately; follow progress via /jobs/{job_id} or /jobs/{job_id}/events
+    job, deduplicated = job_manager.submit_class_job(program, section, submitted_by=current_user.id)
+    return job.to_out(deduplicated=deduplicated)
+
+@app.get("/jobs/{job_id}", response_model=PredictionJobOut, tags=["Jobs"])
+async def get_prediction_job(
+    job_id: str = Path(..., title="Job ID"),
+    include_predictions: bool = Query(False, title="Include the predictions produced so far"),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    try:
+        return job_manager.get_job(job_id, _job_viewer(current_user)).to_out(include_predictions=include_predictions)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@app.delete("/jobs/{job_id}", response_model=PredictionJobOut, tags=["Jobs"])
+async def cancel_prediction_job(
+    job_id: str = Path(..., title="Job ID"),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Cancellation takes effect between chunks; predictions already saved are kept.
+    try:
+        return job_manager.cancel_job(job_id, _job_viewer(current_user)).to_out()
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@app.get("/jobs/{job_id}/events", tags=["Jobs"])
+async def stream_prediction_job_events(
+    job_id: str = Path(..., title="Job ID"),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Server-Sent Events: status, progress and each chunk's predictions as they are saved
+    viewer = _job_viewer(current_user)
+    try:
+        job_manager.get_job(job_id, viewer)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    async def event_stream():
+        cursor = 0
+        while True:
+            try:
+                events, finished = job_manager.events_since(job_id, cursor, viewer)
+            except JobNotFoundError:
+                return
+            for name, payload in events:
+                yield f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+            cursor += len(events)
+            if finished and not events:
+                return
+            if not events:
+                await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# --- Risk bands ---
+
+@app.get("/risk-bands", response_model=List[RiskBandConfigOut], tags=["Predictions"], dependencies=[Depends(admit("read"))])
+def list_risk_bands(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # "*" is the default used for every program without its own thresholds
+    return columnar_response(request, response, RiskBandConfigOut, risk_band_service.list_band_configs(db))
+
+@app.put("/risk-bands/{program}", response_model=RiskBandConfigOut, tags=["Predictions"], dependencies=[Depends(admit("write"))])
+def set_risk_band_config(
+    config: RiskBandConfigIn,
+    program: str = Path(..., title="Program, or * for the default thresholds"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    # Latest predictions are re-banded immediately; new predictions use the pass threshold
+    try:
+        return risk_band_service.set_band_config(db, program, config)
+    except RiskBandError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.delete("/risk-bands/{program}", status_code=status.HTTP_204_NO_CONTENT, tags=["Predictions"], dependencies=[Depends(admit("write"))])
+def delete_risk_band_config(
+    program: str = Path(..., title="Program"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    try:
+        deleted = risk_band_service.delete_band_config(db, program)
+    except RiskBandError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No risk band configuration for program '{program}'.")
+
+# --- Trend analytics ---
+
+@app.get("/analytics/trends", response_model=TrendResponse, tags=["Predictions"], dependencies=[Depends(admit("aggregate"))])
+@query_budget(3)
+def get_prediction_trends(
+    request: Request,
+    granularity: str = Query("week", pattern="^(day|week|month)$", title="Bucket size"),
+    program: Optional[str] = Query(None, title="Only this program"),
+    section: Optional[str] = Query(None, title="Only this section"),
+    start_date: Optional[date] = Query(None, title="First prediction date included"),
+    end_date: Optional[date] = Query(None, title="Last prediction date included"),
+    by_class: bool = Query(False, title="One series per program/section instead of one overall"),
+    db: Session = Depends(get_analytics_db), # The analytics replica while it is fresh enough
+    current_user: User = Depends(get_current_user) # Protected endpoint
+):
+    # Read from the per-class daily rollups kept current by every prediction write; no history scan
+    return cached_json_response(
+        request, f"trends|{granularity}|{program}|{section}|{start_date}|{end_date}|{by_class}",
+        ("prediction_trend_rollups",),
+        lambda: TrendResponse(
+            granularity=granularity,
+            points=crud_trends.get_trend_points(db, granularity, program, section, start_date, end_date, by_class),
+        ),
+    )
+
+@app.post("/analytics/trends/rebuild", tags=["Predictions"], dependencies=[Depends(admit("write", BULK))])
+def rebuild_prediction_trends(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    # Recomputes the rollups from the predictions table; history compacted by retention is counted as it is now
+    try:
+        return {"rollup_rows": crud_trends.rebuild_trend_rollups(db)}
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error("SQLAlchemyError rebuilding trend rollups: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error rebuilding trend rollups.")
 
 # <<< END NEW PREDICTION ENDPOINTS >>>
+
+
+@app.post("/model/reload", response_model=ModelVersionOut, tags=["Monitoring"])
+def reload_model(current_user: User = Depends(get_current_admin_user)):
+    # Reloads the artifacts from disk here and tells every other worker to follow
+    loaded = load_ml_model()
+    if loaded:
+        ml_model_module.publish_model_version()
+    return ModelVersionOut(loaded=loaded, model_version=ml_model_module.loaded_model_version)
+
+
+@app.get("/model/challengers", response_model=ChallengerReport, tags=["Monitoring"])
+def get_challenger_report(current_user: User = Depends(get_current_user)):
+    # Shadow-scored models (ML_CHALLENGER_BUNDLES); per-row scores are in challenger_predictions
+    return ChallengerReport(
+        champion_version=ml_model_module.loaded_model_version,
+        worker_id=WORKER_ID,
+        pending_batches=shadow_scorer.pending_batches,
+        dropped_batches=shadow_scorer.dropped_batches,
+        challengers=shadow_scorer.report(),
+    )
+
+
+@app.get("/monitoring/drift", response_model=DriftReport, tags=["Monitoring"])
+def get_drift_report(current_user: User = Depends(get_current_user)):
+    # Built from in-memory sketches of the batches this worker scored; no table scans
+    return DriftReport(model_version=ml_model_module.loaded_model_version, worker_id=WORKER_ID, **drift_monitor.report())
+
+@app.post("/monitoring/drift/reset", response_model=DriftReport, tags=["Monitoring"])
+def reset_drift_window(current_user: User = Depends(get_current_admin_user)):
+    # Starts a new window against the same reference, e.g. at the start of a term
+    drift_monitor.restart_window()
+    return DriftReport(model_version=ml_model_module.loaded_model_version, worker_id=WORKER_ID, **drift_monitor.report())
+
+# --- Profiling (admin only) ---
+
+def _profiling_status() -> ProfilingStatus:
+    return ProfilingStatus(
+        header_enabled=PROFILING_ENABLED,
+        armed=profile_store.armed(),
+        profiles=[ProfileSummary.model_validate(p) for p in profile_store.list()],
+    )
+
+@app.get("/debug/profiling", response_model=ProfilingStatus, tags=["Monitoring"])
+def get_profiling_status(current_user: User = Depends(get_current_admin_user)):
+    return _profiling_status()
+
+@app.post("/debug/profiling", response_model=ProfilingStatus, tags=["Monitoring"])
+def arm_profiling(
+    path_prefix: str = Query(..., title="Profile requests whose path starts with this, e.g. /dashboard-stats"),
+    mode: str = Query("sample", title="'sample' (collapsed stacks) or 'cprofile'"),
+    count: int = Query(1, title="Number of matching requests to profile"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    try:
+        profile_store.arm(path_prefix, mode, count)
+    except ProfilingError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _profiling_status()
+
+@app.delete("/debug/profiling", response_model=ProfilingStatus, tags=["Monitoring"])
+def disarm_profiling(current_user: User = Depends(get_current_admin_user)):
+    profile_store.disarm_all()
+    return _profiling_status()
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse, tags=["Monitoring"])
+def read_profile(
+    profile_id: str = Path(..., title="Value of a response's X-Profile-Id header"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    # Sampled profiles are collapsed stacks: pipe into flamegraph.pl or load into speedscope
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Profile {profile_id} not found.")
+    return PlainTextResponse(profile.output)
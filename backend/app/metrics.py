@@ -0,0 +1,253 @@
+"""
+In-process metrics with Prometheus text exposition, served on /metrics.
+
+Request latency and per-request DB statistics are recorded by MetricsMiddleware and the
+SQLAlchemy cursor hooks below; other modules record into the module-level metrics.
+"""
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from dataclasses import dataclass
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Dict, List, Optional, Sequence, Tuple
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """The exposition lines for every label combination seen so far."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self) -> None:
+        """Drops every series, for values that no longer mean anything (they reappear when set again)."""
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts incl. +Inf, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "pof_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")))
+HTTP_REQUEST_DB_QUERIES = registry.register(Histogram(
+    "pof_http_request_db_queries", "SQL statements executed per HTTP request.", ("method", "route"), buckets=COUNT_BUCKETS))
+HTTP_REQUEST_DB_SECONDS = registry.register(Histogram(
+    "pof_http_request_db_seconds", "Time spent in SQL statements per HTTP request.", ("method", "route")))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "pof_db_query_duration_seconds", "Latency of individual SQL statements."))
+INFERENCE_BATCH_SIZE = registry.register(Histogram(
+    "pof_inference_batch_size", "Rows per predict_pass_fail call.", buckets=BATCH_SIZE_BUCKETS))
+INFERENCE_STAGE_SECONDS = registry.register(Histogram(
+    "pof_inference_stage_duration_seconds", "predict_pass_fail time by stage.", ("stage",)))
+DRIFT_PSI = registry.register(Gauge(
+    "pof_drift_psi", "Population stability index of a model input or output against the reference profile.", ("column",)))
+CHALLENGER_INFERENCE_SECONDS = registry.register(Histogram(
+    "pof_challenger_inference_seconds", "Shadow scoring time of one batch by a challenger model (off the request path).", ("model",)))
+CHALLENGER_ROWS = registry.register(Counter(
+    "pof_challenger_rows_total", "Rows scored by a challenger model, by whether its category agreed with the champion's.", ("model", "agreement")))
+CHALLENGER_AGREEMENT = registry.register(Gauge(
+    "pof_challenger_agreement_ratio", "Share of rows where a challenger model's category matched the champion's.", ("model",)))
+SHADOW_DROPPED_BATCHES = registry.register(Counter(
+    "pof_shadow_dropped_batches_total", "Scored batches not shadow-scored because the challenger queue was full."))
+ADMISSION_REQUESTS = registry.register(Counter(
+    "pof_admission_requests_total", "Admission decisions by endpoint class, priority and outcome (admitted, rate_limited, rejected).", ("endpoint_class", "priority", "outcome")))
+ADMISSION_WAIT_SECONDS = registry.register(Histogram(
+    "pof_admission_wait_seconds", "Time admitted requests waited for a concurrency slot.", ("endpoint_class", "priority")))
+ADMISSION_QUEUE_DEPTH = registry.register(Gauge(
+    "pof_admission_queue_depth", "Requests waiting for a concurrency slot.", ("endpoint_class",)))
+ADMISSION_IN_FLIGHT = registry.register(Gauge(
+    "pof_admission_in_flight", "Admitted requests currently running.", ("endpoint_class",)))
+ANALYTICS_READS = registry.register(Counter(
+    "pof_analytics_reads_total", "Reporting requests by the database they read (replica, or primary when the replica is missing or stale).", ("source",)))
+ANALYTICS_REPLICA_AGE_SECONDS = registry.register(Gauge(
+    "pof_analytics_replica_age_seconds", "Seconds since the analytics replica was copied from the primary."))
+ANALYTICS_REPLICA_REFRESH_DURATION = registry.register(Histogram(
+    "pof_analytics_replica_refresh_seconds", "Time to copy, analyze and swap in the analytics replica.", buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)))
+DASHBOARD_STREAM_SUBSCRIBERS = registry.register(Gauge(
+    "pof_dashboard_stream_subscribers", "Open /dashboard-stats/events streams in this worker."))
+DASHBOARD_STREAM_EVENTS = registry.register(Counter(
+    "pof_dashboard_stream_events_total", "Dashboard stream events: snapshots sent, and deltas computed once for all streams.", ("event",)))
+RESPONSE_CACHE_REQUESTS = registry.register(Counter(
+    "pof_response_cache_requests_total", "Conditional/cached read lookups by result (hit, miss, not_modified).", ("result",)))
+
+
+# --- Per-request DB statistics ---
+
+@dataclass
+class RequestDbStats:
+    query_count: int = 0
+    total_seconds: float = 0.0
+
+
+current_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("current_request_db_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_times")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    DB_QUERY_SECONDS.observe(elapsed)
+    stats = current_request_db_stats.get()
+    if stats is not None:
+        stats.query_count += 1
+        stats.total_seconds += elapsed
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and DB statistics per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDbStats()
+        token = current_request_db_stats.set(stats)
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request_db_stats.reset(token)
+            route = scope.get("route")
+            # Template (e.g. /students/{student_id}) keeps label cardinality bounded
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route_label, status=str(status_holder["status"]))
+            HTTP_REQUEST_DB_QUERIES.observe(stats.query_count, method=method, route=route_label)
+            HTTP_REQUEST_DB_SECONDS.observe(stats.total_seconds, method=method, route=route_label)
+
+
+def render_latest() -> str:
+    return registry.render()
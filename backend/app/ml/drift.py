@@ -0,0 +1,272 @@
+"""
+Streaming drift and data-quality monitoring for the model inputs and outputs.
+
+Every batch scored by predict_pass_fail updates one sketch per monitored column: a
+histogram over the reference profile's bin edges, a null count, and mean/variance
+merged in with Welford's (Chan's parallel) update. Nothing is kept per row and the
+tables are never rescanned; a report costs O(columns x bins).
+
+The reference is the training profile stored in a model bundle (reference_profile.json,
+written by train_model.py). The files shipped without a profile fall back to a baseline:
+the first DRIFT_BASELINE_ROWS rows observed after loading the model become the reference.
+
+Drift per column:
+- PSI over the reference bins (< 0.1 stable, 0.1-0.25 moderate, > 0.25 significant).
+- KS distance between the two binned CDFs, i.e. the KS statistic evaluated at the bin
+  edges (a lower bound of the exact statistic).
+
+Sketches are per process; with several workers each reports the traffic it scored.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app.metrics import DRIFT_PSI
+
+# Raw inputs monitored besides the model features (not a model feature, but it drifts)
+MONITORED_INPUTS = ['learn_guide_completed']
+PROBABILITY_COLUMN = 'predicted_probability'
+DRIFT_BINS = 10
+DRIFT_BASELINE_ROWS = 1000
+# Below this many current rows PSI is too noisy to act on
+DRIFT_MIN_ROWS = 100
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+# Null-rate increase (absolute) flagged as a data-quality problem
+NULL_RATE_ALERT = 0.05
+# Keeps empty bins from making PSI infinite
+PSI_EPSILON = 1e-4
+
+
+class ColumnSketch:
+    """Histogram over fixed edges plus null count, min/max and Welford mean/variance."""
+
+    def __init__(self, edges: np.ndarray):
+        self.edges = np.asarray(edges, dtype=float)  # Interior edges; bins are (-inf, e0], (e0, e1], ..., (ek, inf)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.rows = 0
+        self.nulls = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def non_null(self) -> int:
+        return self.rows - self.nulls
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=float)
+        finite = np.isfinite(values)
+        present = values[finite]
+        self.rows += values.size
+        self.nulls += int(values.size - present.size)
+        if present.size == 0:
+            return
+        self.counts += np.bincount(np.searchsorted(self.edges, present, side="left"), minlength=self.counts.size)
+        # Chan et al.: merge the batch's (n, mean, M2) into the running one
+        n_a, n_b = self.non_null - present.size, present.size
+        batch_mean = float(present.mean())
+        batch_m2 = float(((present - batch_mean) ** 2).sum())
+        delta = batch_mean - self.mean
+        total = n_a + n_b
+        self.mean += delta * n_b / total
+        self.m2 += batch_m2 + delta * delta * n_a * n_b / total
+        self.min = min(self.min, float(present.min()))
+        self.max = max(self.max, float(present.max()))
+
+    @property
+    def std(self) -> Optional[float]:
+        return math.sqrt(self.m2 / (self.non_null - 1)) if self.non_null > 1 else None
+
+    @property
+    def null_rate(self) -> Optional[float]:
+        return self.nulls / self.rows if self.rows else None
+
+    def shares(self) -> np.ndarray:
+        total = self.counts.sum()
+        return self.counts / total if total else np.zeros_like(self.counts, dtype=float)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "edges": self.edges.tolist(), "counts": self.counts.tolist(), "rows": self.rows, "nulls": self.nulls,
+            "mean": self.mean, "m2": self.m2,
+            "min": self.min if self.non_null else None, "max": self.max if self.non_null else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ColumnSketch":
+        sketch = cls(np.asarray(data["edges"], dtype=float))
+        sketch.counts = np.asarray(data["counts"], dtype=np.int64)
+        sketch.rows, sketch.nulls = int(data["rows"]), int(data["nulls"])
+        sketch.mean, sketch.m2 = float(data["mean"]), float(data["m2"])
+        sketch.min = math.inf if data.get("min") is None else float(data["min"])
+        sketch.max = -math.inf if data.get("max") is None else float(data["max"])
+        return sketch
+
+
+def monitored_columns(raw_df: pd.DataFrame, features_df: pd.DataFrame, probabilities: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+    """The values monitored for a batch: model features before imputation, raw inputs and the output."""
+    columns = {name: pd.to_numeric(features_df[name], errors="coerce").to_numpy(dtype=float) for name in features_df.columns}
+    for name in MONITORED_INPUTS:
+        if name in raw_df.columns:
+            columns[name] = raw_df[name].map({True: 1.0, False: 0.0}).to_numpy(dtype=float)
+        else:
+            columns[name] = np.full(len(raw_df), np.nan)
+    if probabilities is not None:
+        columns[PROBABILITY_COLUMN] = np.asarray(probabilities, dtype=float)
+    return columns
+
+
+def _reference_edges(name: str, values: np.ndarray, bins: int = DRIFT_BINS) -> np.ndarray:
+    if name == PROBABILITY_COLUMN:
+        return np.linspace(0.0, 1.0, bins + 1)[1:-1]
+    present = values[np.isfinite(values)]
+    if present.size == 0:
+        return np.empty(0)
+    # Quantile edges give roughly equal-mass reference bins; ties collapse (e.g. booleans -> one edge)
+    return np.unique(np.quantile(present, np.linspace(0.0, 1.0, bins + 1)[1:-1]))
+
+
+def build_reference_profile(columns: Dict[str, np.ndarray], source: str) -> Dict[str, Any]:
+    """Reference sketches for `columns` (name -> values), as stored in reference_profile.json."""
+    sketches = {}
+    for name, values in columns.items():
+        sketch = ColumnSketch(_reference_edges(name, values))
+        sketch.update(values)
+        sketches[name] = sketch.to_dict()
+    return {"source": source, "created_at": datetime.utcnow().isoformat() + "Z", "columns": sketches}
+
+
+def population_stability_index(reference: np.ndarray, current: np.ndarray) -> float:
+    ref = np.clip(reference, PSI_EPSILON, None)
+    cur = np.clip(current, PSI_EPSILON, None)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+
+def binned_ks(reference: np.ndarray, current: np.ndarray) -> float:
+    return float(np.max(np.abs(np.cumsum(reference) - np.cumsum(current)))) if reference.size else 0.0
+
+
+def _status(psi: Optional[float], null_rate_increase: Optional[float]) -> str:
+    if psi is None:
+        return "insufficient_data"
+    if psi >= PSI_SIGNIFICANT or (null_rate_increase is not None and null_rate_increase >= NULL_RATE_ALERT):
+        return "drift"
+    if psi >= PSI_MODERATE:
+        return "warning"
+    return "stable"
+
+
+class DriftMonitor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset(None)
+
+    def reset(self, reference_profile: Optional[Dict[str, Any]] = None) -> None:
+        """Starts a new window; a None profile means the first DRIFT_BASELINE_ROWS rows become the reference."""
+        with self._lock:
+            self._reference: Optional[Dict[str, ColumnSketch]] = None
+            self._reference_source: Optional[str] = None
+            self._baseline: List[Dict[str, np.ndarray]] = []
+            self._baseline_rows = 0
+            self._current: Dict[str, ColumnSketch] = {}
+            self._window_started_at = datetime.utcnow()
+            # PSI against the discarded reference and window is meaningless until the next batch
+            DRIFT_PSI.clear()
+            if reference_profile is not None:
+                self._set_reference(reference_profile)
+
+    def restart_window(self) -> None:
+        """Clears the current sketches but keeps the reference (e.g. at the start of a term)."""
+        with self._lock:
+            self._current = {name: ColumnSketch(sketch.edges) for name, sketch in (self._reference or {}).items()}
+            self._window_started_at = datetime.utcnow()
+            DRIFT_PSI.clear()
+
+    def _set_reference(self, profile: Dict[str, Any]) -> None:
+        self._reference = {name: ColumnSketch.from_dict(data) for name, data in profile["columns"].items()}
+        self._reference_source = profile.get("source", "training")
+        self._current = {name: ColumnSketch(sketch.edges) for name, sketch in self._reference.items()}
+
+    def observe(self, raw_df: pd.DataFrame, features_df: pd.DataFrame, probabilities: Optional[np.ndarray]) -> None:
+        columns = monitored_columns(raw_df, features_df, probabilities)
+        with self._lock:
+            if self._reference is None:
+                self._collect_baseline(columns)
+                return
+            for name, values in columns.items():
+                sketch = self._current.get(name)
+                if sketch is not None:
+                    sketch.update(values)
+            # Under the lock, so a reset in between cannot be overwritten with the old window's values
+            for name in self._current:
+                psi = self._column_psi(name)
+                if psi is not None:
+                    DRIFT_PSI.set(psi, column=name)
+
+    def _collect_baseline(self, columns: Dict[str, np.ndarray]) -> None:
+        take = DRIFT_BASELINE_ROWS - self._baseline_rows
+        batch = {name: values[:take] for name, values in columns.items()}
+        self._baseline.append(batch)
+        self._baseline_rows += len(next(iter(batch.values()), ()))
+        if self._baseline_rows >= DRIFT_BASELINE_ROWS:
+            merged = {name: np.concatenate([b[name] for b in self._baseline if name in b]) for name in batch}
+            self._set_reference(build_reference_profile(merged, source="baseline"))
+            self._baseline = []
+            # Rows past the baseline belong to the first window
+            for name, values in columns.items():
+                if name in self._current:
+                    self._current[name].update(values[take:])
+
+    def _column_psi(self, name: str) -> Optional[float]:
+        current = self._current[name]
+        if current.non_null < DRIFT_MIN_ROWS:
+            return None
+        return population_stability_index(self._reference[name].shares(), current.shares())
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            columns = []
+            if self._reference is not None:
+                for name, reference in self._reference.items():
+                    current = self._current[name]
+                    psi = self._column_psi(name)
+                    null_increase = None
+                    if current.null_rate is not None and reference.null_rate is not None:
+                        null_increase = current.null_rate - reference.null_rate
+                    ref_shares, cur_shares = reference.shares(), current.shares()
+                    upper_edges = current.edges.tolist() + [None]
+                    columns.append({
+                        "column": name,
+                        "status": _status(psi, null_increase),
+                        "psi": None if psi is None else round(psi, 4),
+                        "ks": round(binned_ks(ref_shares, cur_shares), 4) if current.non_null else None,
+                        "rows": current.rows,
+                        "null_rate": current.null_rate,
+                        "reference_null_rate": reference.null_rate,
+                        "mean": current.mean if current.non_null else None,
+                        "reference_mean": reference.mean if reference.non_null else None,
+                        "std": current.std,
+                        "reference_std": reference.std,
+                        "min": current.min if current.non_null else None,
+                        "max": current.max if current.non_null else None,
+                        "histogram": [
+                            {"upper_edge": edge, "reference_share": round(float(r), 4), "current_share": round(float(c), 4)}
+                            for edge, r, c in zip(upper_edges, ref_shares, cur_shares)
+                        ],
+                    })
+            return {
+                "reference_source": self._reference_source,
+                "baseline_rows_collected": self._baseline_rows if self._reference is None else None,
+                "window_started_at": self._window_started_at,
+                "columns": columns,
+                "drifted_columns": [c["column"] for c in columns if c["status"] == "drift"],
+            }
+
+
+drift_monitor = DriftMonitor()
@@ -2,127 +2,349 @@ import joblib
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Tuple, List, Any, Dict
+from typing import Tuple, List, Any, Dict, Optional, Union
+import hashlib
+import json
+import logging
+import os
+import time
+
+from app.coordination import coordination_store
+from app.ml.drift import drift_monitor
+from app.ml.explain import ExplanationBatch, ExplanationError, explain_estimator
+from app.ml.shadow import ChallengerModel, shadow_scorer
+from app.metrics import INFERENCE_BATCH_SIZE, INFERENCE_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration: Paths to your friend's exported files ---
 BASE_ML_DIR = Path(__file__).parent
 MODEL_FILENAME = 'course_pass_predictor_model.joblib'
 SCALER_FILENAME = 'course_pass_scaler.joblib'
 FEATURE_NAMES_FILENAME = 'course_pass_feature_names.joblib'
+# Optional training distribution of the inputs and outputs, used by the drift monitor
+REFERENCE_PROFILE_FILENAME = 'reference_profile.json'
 
 MODEL_PATH = BASE_ML_DIR / MODEL_FILENAME
 SCALER_PATH = BASE_ML_DIR / SCALER_FILENAME
 FEATURE_NAMES_PATH = BASE_ML_DIR / FEATURE_NAMES_FILENAME
 
+# Bundles written by train_model.py; CURRENT names the one to serve when ML_BUNDLE_DIR is unset
+BUNDLES_DIR = BASE_ML_DIR / 'bundles'
+CURRENT_BUNDLE_POINTER = BUNDLES_DIR / 'CURRENT'
+ML_BUNDLE_DIR = os.getenv("ML_BUNDLE_DIR")
+# Bundles scored in shadow next to the champion (see app.ml.shadow); names under BUNDLES_DIR or paths
+ML_CHALLENGER_BUNDLES = [b.strip() for b in os.getenv("ML_CHALLENGER_BUNDLES", "").split(",") if b.strip()]
+
+# Pass probability at or above which a prediction is "Pass", unless a program configures its own
+DEFAULT_PASS_THRESHOLD = 0.5
+
+# Key under which the active model version is published to every worker
+MODEL_VERSION_KEY = "model_version"
+# Workers compare their loaded version with the published one at most this often
+MODEL_VERSION_CHECK_SECONDS = 1.0
+
 # --- Global variables to hold loaded ML components ---
 loaded_model: Any = None
 loaded_scaler: Any = None
 expected_feature_names: List[str] = []
+# Content digest of the loaded artifacts; identical files give identical versions on every worker
+loaded_model_version: Optional[str] = None
+# Directory the loaded artifacts came from
+loaded_bundle_dir: Optional[Path] = None
+_last_version_check = 0.0
+_last_synced_published_version: Optional[str] = None
+
+def resolve_bundle_dir(bundle_dir: Optional[Union[str, Path]] = None) -> Path:
+    """
+    Directory holding the three artifacts: `bundle_dir` if given, else ML_BUNDLE_DIR, else
+    the bundle named in bundles/CURRENT, else the files shipped next to this module.
+    """
+    if bundle_dir is not None:
+        return Path(bundle_dir)
+    if ML_BUNDLE_DIR:
+        return Path(ML_BUNDLE_DIR)
+    if CURRENT_BUNDLE_POINTER.exists():
+        name = CURRENT_BUNDLE_POINTER.read_text().strip()
+        if name:
+            return BUNDLES_DIR / name
+    return BASE_ML_DIR
+
+def _artifact_paths(bundle_dir: Path) -> Tuple[Path, Path, Path]:
+    return bundle_dir / MODEL_FILENAME, bundle_dir / SCALER_FILENAME, bundle_dir / FEATURE_NAMES_FILENAME
 
-def load_ml_components():
-    """Loads the ML model, scaler, and feature names from disk."""
-    global loaded_model, loaded_scaler, expected_feature_names
+def load_ml_components(bundle_dir: Optional[Union[str, Path]] = None):
+    """Loads the ML model, scaler, and feature names from disk (see resolve_bundle_dir)."""
+    global loaded_model, loaded_scaler, expected_feature_names, loaded_model_version, loaded_bundle_dir
     all_loaded_successfully = True
+    source_dir = resolve_bundle_dir(bundle_dir)
+    model_path, scaler_path, feature_names_path = _artifact_paths(source_dir)
 
     try:
-        if MODEL_PATH.exists():
-            loaded_model = joblib.load(MODEL_PATH)
-            print(f"ML Model loaded successfully from {MODEL_PATH}")
+        if model_path.exists():
+            loaded_model = joblib.load(model_path)
+            logger.info("ML Model loaded successfully from %s", model_path)
         else:
-            print(f"Error: Model file not found at {MODEL_PATH}")
+            logger.error("Model file not found at %s", model_path)
             all_loaded_successfully = False; loaded_model = None
 
-        if SCALER_PATH.exists():
-            loaded_scaler = joblib.load(SCALER_PATH)
-            print(f"Scaler loaded successfully from {SCALER_PATH}")
+        if scaler_path.exists():
+            loaded_scaler = joblib.load(scaler_path)
+            logger.info("Scaler loaded successfully from %s", scaler_path)
         else:
-            print(f"Error: Scaler file not found at {SCALER_PATH}")
+            logger.error("Scaler file not found at %s", scaler_path)
             all_loaded_successfully = False; loaded_scaler = None
 
-        if FEATURE_NAMES_PATH.exists():
-            expected_feature_names = joblib.load(FEATURE_NAMES_PATH)
-            print(f"Feature names loaded successfully from {FEATURE_NAMES_PATH}: {expected_feature_names}")
+        if feature_names_path.exists():
+            expected_feature_names = joblib.load(feature_names_path)
+            logger.info("Feature names loaded successfully from %s: %s", feature_names_path, expected_feature_names)
         else:
-            print(f"Error: Feature names file not found at {FEATURE_NAMES_PATH}")
+            logger.error("Feature names file not found at %s", feature_names_path)
             all_loaded_successfully = False; expected_feature_names = []
 
         if not all_loaded_successfully:
-            print("One or more ML components failed to load. Prediction service will be impaired.")
+            logger.error("One or more ML components failed to load. Prediction service will be impaired.")
+            loaded_model_version = None; loaded_bundle_dir = None
             return False
-        print("All ML components loaded successfully.")
+        loaded_model_version = artifacts_digest(source_dir)
+        loaded_bundle_dir = source_dir
+        drift_monitor.reset(_load_reference_profile(source_dir))
+        shadow_scorer.set_challengers(load_challengers(ML_CHALLENGER_BUNDLES))
+        logger.info("All ML components loaded successfully (version %s).", loaded_model_version)
         return True
     except Exception as e:
-        print(f"Critical error loading ML components: {e}")
-        loaded_model = None; loaded_scaler = None; expected_feature_names = []
+        logger.exception("Critical error loading ML components: %s", e)
+        loaded_model = None; loaded_scaler = None; expected_feature_names = []; loaded_model_version = None; loaded_bundle_dir = None
         return False
 
-def predict_pass_fail(data_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+def load_challengers(bundles: List[str]) -> List[ChallengerModel]:
+    """Loads challenger bundles; ones that fail to load or equal the champion are skipped with a warning."""
+    challengers = []
+    for bundle in bundles:
+        bundle_dir = Path(bundle) if Path(bundle).is_absolute() or Path(bundle).exists() else BUNDLES_DIR / bundle
+        try:
+            model_path, scaler_path, feature_names_path = _artifact_paths(bundle_dir)
+            version = artifacts_digest(bundle_dir)
+            if version == loaded_model_version:
+                logger.warning("Challenger %s is the served model; not shadow-scoring it.", bundle_dir)
+                continue
+            challengers.append(ChallengerModel(
+                name=bundle_dir.name, version=version, bundle_dir=bundle_dir,
+                model=joblib.load(model_path), scaler=joblib.load(scaler_path),
+                feature_names=list(joblib.load(feature_names_path)),
+            ))
+            logger.info("Challenger model %s loaded (version %s).", bundle_dir.name, version)
+        except Exception as e:
+            logger.warning("Could not load challenger bundle %s: %s", bundle_dir, e)
+    return challengers
+
+def _load_reference_profile(bundle_dir: Path) -> Optional[Dict[str, Any]]:
+    profile_path = bundle_dir / REFERENCE_PROFILE_FILENAME
+    if not profile_path.exists():
+        logger.info("No reference profile in %s; drift is measured against the first requests served.", bundle_dir)
+        return None
+    try:
+        return json.loads(profile_path.read_text())
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read reference profile %s: %s", profile_path, e)
+        return None
+
+def artifacts_digest(bundle_dir: Path) -> str:
+    """Content digest of a bundle's artifacts; also the served model version."""
+    digest = hashlib.sha256()
+    for path in _artifact_paths(bundle_dir):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+def publish_model_version() -> Optional[str]:
+    """Announces the version loaded in this process; other workers reload on their next check."""
+    if loaded_model_version:
+        coordination_store.set_value(MODEL_VERSION_KEY, loaded_model_version)
+    return loaded_model_version
+
+def sync_model_version() -> None:
     """
-    Makes predictions using the loaded ML model, scaler, and feature engineering logic.
-    Args:
-        data_df (pd.DataFrame): DataFrame with raw student data (e.g., test scores, learn_guide_completed).
-    Returns:
-        Tuple[np.ndarray, np.ndarray]: (predicted_probabilities_pass, predicted_categories)
+    Reloads the artifacts when another worker published a different model version.
+    Throttled to one store lookup per MODEL_VERSION_CHECK_SECONDS, so it is cheap on hot paths.
     """
-    if not loaded_model or not loaded_scaler or not expected_feature_names:
-        print("Warning: ML components not fully loaded. Returning dummy/error predictions.")
-        num_samples = len(data_df)
-        return np.full(num_samples, 0.01), np.zeros(num_samples, dtype=int)
+    global _last_version_check, _last_synced_published_version
+    now = time.monotonic()
+    if now - _last_version_check < MODEL_VERSION_CHECK_SECONDS:
+        return
+    _last_version_check = now
+    published = coordination_store.get_value(MODEL_VERSION_KEY)
+    # Reload once per published version, even if the files on disk turn out to differ
+    if published is None or published in (loaded_model_version, _last_synced_published_version):
+        return
+    _last_synced_published_version = published
+    logger.info("Model version %s was published (loaded: %s); reloading.", published, loaded_model_version)
+    load_ml_components()
+    if loaded_model_version != published:
+        logger.warning("Artifacts on disk have version %s, expected published version %s.", loaded_model_version, published)
 
-    try:
-        X = data_df.copy()
+def get_feature_training_range(feature_name: str) -> Optional[Tuple[float, float]]:
+    """Returns the (min, max) the scaler saw for a model feature during training, if known."""
+    if not loaded_scaler or feature_name not in expected_feature_names:
+        return None
+    if not hasattr(loaded_scaler, 'data_min_') or not hasattr(loaded_scaler, 'data_max_'):
+        return None
+    idx = expected_feature_names.index(feature_name)
+    return float(loaded_scaler.data_min_[idx]), float(loaded_scaler.data_max_[idx])
 
-        # --- 1. Feature Engineering (as per friend's Flask app logic) ---
-        raw_features_needed = ['test_1_score', 'test_2_score', 'test_3_score', 'learn_guide_completed']
-        for f_name in raw_features_needed:
-            if f_name not in X.columns:
-                X[f_name] = np.nan
+def engineer_features(data_df: pd.DataFrame, feature_names: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Turns raw student rows (test scores, learn_guide_completed) into the model's input columns,
+    in `feature_names` order (default: the loaded model's), with missing values imputed as 0.
+    Shared by inference and training, so both see exactly the same features.
+    """
+    return derive_features(data_df, feature_names).fillna(0) # Impute NaNs with 0
 
-        # Convert 'learn_guide_completed' (boolean from DB) to int (0 or 1)
-        if 'learn_guide_completed' in X.columns:
-            X['learn_guide_completed'] = X['learn_guide_completed'].fillna(0).astype(int)
+def derive_features(data_df: pd.DataFrame, feature_names: Optional[List[str]] = None) -> pd.DataFrame:
+    """engineer_features before imputation: missing or non-finite values stay NaN."""
+    if feature_names is None:
+        feature_names = expected_feature_names
+    X = data_df.copy()
 
+    # --- 1. Feature Engineering (as per friend's Flask app logic) ---
+    raw_features_needed = ['test_1_score', 'test_2_score', 'test_3_score', 'learn_guide_completed']
+    for f_name in raw_features_needed:
+        if f_name not in X.columns:
+            X[f_name] = np.nan
 
-        # Calculate 'score_improvement_rate' if it's an expected feature by the model
-        if 'score_improvement_rate' in expected_feature_names:
-            t1 = pd.to_numeric(X.get('test_1_score'), errors='coerce')
-            t3 = pd.to_numeric(X.get('test_3_score'), errors='coerce')
-            X['score_improvement_rate'] = (t3 - t1) / 2.0
+    # Convert 'learn_guide_completed' (boolean from DB) to int (0 or 1)
+    if 'learn_guide_completed' in X.columns:
+        X['learn_guide_completed'] = X['learn_guide_completed'].fillna(0).astype(int)
 
 
-        # Calculate 'test_scores_std_dev' if it's an expected feature
-        if 'test_scores_std_dev' in expected_feature_names:
-            score_cols_for_std = ['test_1_score', 'test_2_score', 'test_3_score']
-            # Convert relevant columns to numeric, coercing errors to NaN
-            numeric_scores_df = X[score_cols_for_std].apply(pd.to_numeric, errors='coerce')
-            X['test_scores_std_dev'] = numeric_scores_df.std(axis=1, skipna=True, ddof=1) # ddof=1 for sample std dev
+    # Calculate 'score_improvement_rate' if it's an expected feature by the model
+    if 'score_improvement_rate' in feature_names:
+        t1 = pd.to_numeric(X.get('test_1_score'), errors='coerce')
+        t3 = pd.to_numeric(X.get('test_3_score'), errors='coerce')
+        X['score_improvement_rate'] = (t3 - t1) / 2.0
 
-        # --- 2. Handle Missing Values and Prepare features in the correct order ---
-        X.replace([np.inf, -np.inf], np.nan, inplace=True)
 
-        features_for_model_dict: Dict[str, pd.Series] = {}
-        for feature_name in expected_feature_names:
-            if feature_name in X.columns:
-                features_for_model_dict[feature_name] = X[feature_name].fillna(0) # Impute NaNs with 0
-            else:
-                print(f"Warning: Expected feature '{feature_name}' not in input or engineered. Adding as zeros.")
-                features_for_model_dict[feature_name] = pd.Series([0] * len(X))
+    # Calculate 'test_scores_std_dev' if it's an expected feature
+    if 'test_scores_std_dev' in feature_names:
+        score_cols_for_std = ['test_1_score', 'test_2_score', 'test_3_score']
+        # Convert relevant columns to numeric, coercing errors to NaN
+        numeric_scores_df = X[score_cols_for_std].apply(pd.to_numeric, errors='coerce')
+        X['test_scores_std_dev'] = numeric_scores_df.std(axis=1, skipna=True, ddof=1) # ddof=1 for sample std dev
 
-        student_features_for_model_df = pd.DataFrame(features_for_model_dict, columns=expected_feature_names)
+    # --- 2. Prepare features in the correct order ---
+    X.replace([np.inf, -np.inf], np.nan, inplace=True)
+
+    features_for_model_dict: Dict[str, pd.Series] = {}
+    for feature_name in feature_names:
+        if feature_name in X.columns:
+            features_for_model_dict[feature_name] = X[feature_name]
+        else:
+            logger.warning("Expected feature '%s' not in input or engineered. Adding as zeros.", feature_name)
+            features_for_model_dict[feature_name] = pd.Series([0] * len(X))
+
+    return pd.DataFrame(features_for_model_dict, columns=feature_names)
+
+def predict_pass_fail(
+    data_df: pd.DataFrame,
+    pass_threshold: Union[float, np.ndarray] = DEFAULT_PASS_THRESHOLD,
+    monitor: bool = True,
+    student_ids: Optional[List[Optional[int]]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Makes predictions using the loaded ML model, scaler, and feature engineering logic.
+    Args:
+        data_df (pd.DataFrame): DataFrame with raw student data (e.g., test scores, learn_guide_completed).
+        pass_threshold: Cut-off for the category; a scalar or one value per row (per-program thresholds).
+        monitor: Feed the batch to the drift monitor and the challenger models; False for
+            synthetic inputs such as what-if grids.
+        student_ids: Student of each row (None for inline rows), stored with challenger scores.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (predicted_probabilities_pass, predicted_categories)
+    """
+    probabilities, categories, _ = _predict(data_df, explain=False, pass_threshold=pass_threshold, monitor=monitor,
+                                            student_ids=student_ids)
+    return probabilities, categories
+
+def predict_pass_fail_explained(
+    data_df: pd.DataFrame,
+    pass_threshold: Union[float, np.ndarray] = DEFAULT_PASS_THRESHOLD,
+    student_ids: Optional[List[Optional[int]]] = None
+) -> Tuple[np.ndarray, np.ndarray, Optional[ExplanationBatch]]:
+    """
+    Like predict_pass_fail, plus per-feature contributions for every row from the same
+    engineered and scaled batch. The explanation is None if the model type is unsupported.
+    """
+    return _predict(data_df, explain=True, pass_threshold=pass_threshold, student_ids=student_ids)
+
+def _predict(
+    data_df: pd.DataFrame,
+    explain: bool,
+    pass_threshold: Union[float, np.ndarray] = DEFAULT_PASS_THRESHOLD,
+    monitor: bool = True,
+    student_ids: Optional[List[Optional[int]]] = None
+) -> Tuple[np.ndarray, np.ndarray, Optional[ExplanationBatch]]:
+    sync_model_version()
+    if not loaded_model or not loaded_scaler or not expected_feature_names:
+        logger.warning("ML components not fully loaded. Returning dummy/error predictions.")
+        num_samples = len(data_df)
+        return np.full(num_samples, 0.01), np.zeros(num_samples, dtype=int), None
+
+    try:
+        stage_start = time.perf_counter()
+        derived_features_df = derive_features(data_df)
+        student_features_for_model_df = derived_features_df.fillna(0) # Same imputation as engineer_features
+
+        scaling_start = time.perf_counter()
 
         # --- 3. Scale the features ---
         student_features_scaled_np = loaded_scaler.transform(student_features_for_model_df.to_numpy())
+        predict_start = time.perf_counter()
 
         # --- 4. Predict ---
         probabilities = loaded_model.predict_proba(student_features_scaled_np)
+        predict_end = time.perf_counter()
+
+        INFERENCE_BATCH_SIZE.observe(len(data_df))
+        INFERENCE_STAGE_SECONDS.observe(scaling_start - stage_start, stage="feature_engineering")
+        INFERENCE_STAGE_SECONDS.observe(predict_start - scaling_start, stage="scaling")
+        INFERENCE_STAGE_SECONDS.observe(predict_end - predict_start, stage="predict_proba")
         predicted_score_pass_probability = probabilities[:, 1]  # Prob for 'Pass' (class 1)
-        predicted_categories_numeric = (predicted_score_pass_probability >= 0.5).astype(int) # Threshold at 0.5
+        predicted_categories_numeric = (predicted_score_pass_probability >= pass_threshold).astype(int)
+
+        # --- 5. Drift monitoring; never fails the prediction ---
+        if monitor:
+            try:
+                drift_monitor.observe(data_df, derived_features_df, predicted_score_pass_probability)
+            except Exception as me:
+                logger.warning("Drift monitor update failed: %s", me)
+            INFERENCE_STAGE_SECONDS.observe(time.perf_counter() - predict_end, stage="drift_monitor")
+            # Challengers score the same batch on the shadow thread; here it is only queued
+            try:
+                shadow_scorer.submit(data_df, predicted_score_pass_probability, pass_threshold, loaded_model_version, student_ids)
+            except Exception as se:
+                logger.warning("Queueing the batch for challenger models failed: %s", se)
+        explain_start = time.perf_counter()
+
+        # --- 6. Explain (opt-in) ---
+        explanation = None
+        if explain:
+            try:
+                space, base_values, contributions = explain_estimator(loaded_model, student_features_scaled_np)
+                explanation = ExplanationBatch(
+                    feature_names=list(expected_feature_names),
+                    space=space,
+                    base_values=base_values,
+                    contributions=contributions,
+                    feature_values=student_features_for_model_df.to_numpy(dtype=float),
+                )
+            except ExplanationError as ee:
+                logger.warning("Explanations unavailable: %s", ee)
+            INFERENCE_STAGE_SECONDS.observe(time.perf_counter() - explain_start, stage="explain")
 
-        return predicted_score_pass_probability, predicted_categories_numeric
+        return predicted_score_pass_probability, predicted_categories_numeric, explanation
 
     except ValueError as ve:
-        print(f"ValueError during prediction: {ve}")
-        num_samples = len(data_df); return np.full(num_samples, 0.02), np.zeros(num_samples, dtype=int)
+        logger.error("ValueError during prediction: %s", ve)
+        num_samples = len(data_df); return np.full(num_samples, 0.02), np.zeros(num_samples, dtype=int), None
     except Exception as e:
-        print(f"General error during prediction: {e}")
-        num_samples = len(data_df); return np.full(num_samples, 0.03), np.zeros(num_samples, dtype=int)
+        logger.exception("General error during prediction: %s", e)
+        num_samples = len(data_df); return np.full(num_samples, 0.03), np.zeros(num_samples, dtype=int), None
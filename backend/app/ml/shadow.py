@@ -0,0 +1,258 @@
+"""
+Champion/challenger evaluation on live traffic.
+
+Challenger bundles (ML_CHALLENGER_BUNDLES: comma-separated bundle names under
+app/ml/bundles/ or directories) are loaded next to the served champion. Every batch the
+champion scores for real traffic is queued here with the champion's probabilities; a
+background thread scores it with each challenger, from the same raw rows through the
+challenger's own feature list and scaler, and appends one compact row per scored row to
+challenger_predictions. The thread scores every batch already waiting before it writes,
+so a burst becomes one transaction of at most SHADOW_MAX_ROWS_PER_COMMIT rows rather than
+one per request, and the write lock is only held for the insert. Requests only pay for the
+enqueue; when the queue is full the batch is dropped (and counted) rather than slowing
+users down.
+
+Per challenger, latency, scored rows and category agreement with the champion are
+exported as metrics and summarized by GET /model/challengers. Statistics are per worker;
+the table holds every worker's rows.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+
+from app.database import SessionLocal
+from app.metrics import CHALLENGER_AGREEMENT, CHALLENGER_INFERENCE_SECONDS, CHALLENGER_ROWS, SHADOW_DROPPED_BATCHES
+from app.models import ChallengerPrediction
+
+logger = logging.getLogger(__name__)
+
+# Batches waiting for shadow scoring; beyond this new batches are dropped
+SHADOW_QUEUE_SIZE = 64
+# Seconds flush() waits for the queue to drain
+SHADOW_FLUSH_TIMEOUT_SECONDS = 30.0
+# Rows written per transaction; the writer shares the database's single write lock with requests
+SHADOW_MAX_ROWS_PER_COMMIT = 5000
+
+
+@dataclass
+class ChallengerModel:
+    name: str                 # Bundle directory name
+    version: str              # Artifact digest, as for the champion
+    bundle_dir: Path
+    model: Any
+    scaler: Any
+    feature_names: List[str]
+
+
+@dataclass
+class _ChallengerStats:
+    batches: int = 0
+    rows: int = 0
+    agreeing_rows: int = 0
+    abs_probability_diff_sum: float = 0.0
+    seconds: float = 0.0
+    max_batch_seconds: float = 0.0
+
+
+@dataclass
+class _ShadowBatch:
+    raw: pd.DataFrame
+    champion_probabilities: np.ndarray
+    pass_thresholds: np.ndarray
+    champion_version: str
+    student_ids: List[Optional[int]]
+    scored_at: datetime = field(default_factory=datetime.utcnow)
+
+
+class ShadowScorer:
+    def __init__(self, max_pending: int = SHADOW_QUEUE_SIZE):
+        self._queue: "queue.Queue[Optional[_ShadowBatch]]" = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._challengers: List[ChallengerModel] = []
+        self._stats: Dict[str, _ChallengerStats] = {}
+        self._dropped_batches = 0
+
+    @property
+    def challengers(self) -> List[ChallengerModel]:
+        return list(self._challengers)
+
+    def set_challengers(self, challengers: List[ChallengerModel]) -> None:
+        with self._lock:
+            self._challengers = list(challengers)
+            self._stats = {c.version: self._stats.get(c.version, _ChallengerStats()) for c in challengers}
+
+    def submit(
+        self,
+        raw_df: pd.DataFrame,
+        champion_probabilities: np.ndarray,
+        pass_threshold: Union[float, np.ndarray],
+        champion_version: Optional[str],
+        student_ids: Optional[Sequence[Optional[int]]] = None,
+    ) -> bool:
+        """Queues a scored batch for the challengers; returns False if there are none or the queue is full."""
+        if not self._challengers or champion_version is None or len(raw_df) == 0:
+            return False
+        n = len(raw_df)
+        batch = _ShadowBatch(
+            raw=raw_df,
+            champion_probabilities=np.asarray(champion_probabilities, dtype=float),
+            pass_thresholds=np.broadcast_to(np.asarray(pass_threshold, dtype=float), (n,)).copy(),
+            champion_version=champion_version,
+            student_ids=list(student_ids) if student_ids is not None else [None] * n,
+        )
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            with self._lock:
+                self._dropped_batches += 1
+            SHADOW_DROPPED_BATCHES.inc()
+            return False
+        return True
+
+    @property
+    def dropped_batches(self) -> int:
+        with self._lock:
+            return self._dropped_batches
+
+    def flush(self, timeout: float = SHADOW_FLUSH_TIMEOUT_SECONDS) -> bool:
+        """Waits until every queued batch is scored and stored (tests, training scripts)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def shutdown(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batches = [self._queue.get()]
+            # Everything already waiting is scored now and written together
+            while batches[-1] is not None and len(batches) < self._queue.maxsize:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows: List[Dict[str, Any]] = []
+            try:
+                for batch in batches:
+                    if batch is None:
+                        break
+                    try:
+                        rows.extend(self._score(batch))
+                    except Exception as e:
+                        logger.warning("Shadow scoring failed: %s", e)
+                for start in range(0, len(rows), SHADOW_MAX_ROWS_PER_COMMIT):
+                    self._store(rows[start:start + SHADOW_MAX_ROWS_PER_COMMIT])
+            except Exception as e:
+                logger.warning("Storing shadow predictions failed: %s", e)
+            finally:
+                for _ in batches:
+                    self._queue.task_done()
+            if batches[-1] is None:
+                return
+
+    def _score(self, batch: _ShadowBatch) -> List[Dict[str, Any]]:
+        # Imported here: app.ml.model imports this module
+        from app.ml.model import derive_features
+
+        champion_pass = batch.champion_probabilities >= batch.pass_thresholds
+        rows = []
+        for challenger in self.challengers:
+            start = time.perf_counter()
+            try:
+                features = derive_features(batch.raw, challenger.feature_names).fillna(0)
+                scaled = challenger.scaler.transform(features.to_numpy())
+                probabilities = challenger.model.predict_proba(scaled)[:, 1]
+            except Exception as e:
+                logger.warning("Challenger %s could not score a batch: %s", challenger.name, e)
+                continue
+            elapsed = time.perf_counter() - start
+            agrees = (probabilities >= batch.pass_thresholds) == champion_pass
+            self._record(challenger, elapsed, probabilities, batch.champion_probabilities, agrees)
+            rows.extend(
+                {
+                    "scored_at": batch.scored_at, "challenger_version": challenger.version,
+                    "champion_version": batch.champion_version, "student_id": student_id,
+                    "champion_probability": float(champion), "challenger_probability": float(prob),
+                    "agrees": bool(agree),
+                }
+                for student_id, champion, prob, agree in zip(batch.student_ids, batch.champion_probabilities, probabilities, agrees)
+            )
+        return rows
+
+    def _record(self, challenger: ChallengerModel, elapsed: float, probabilities: np.ndarray,
+                champion_probabilities: np.ndarray, agrees: np.ndarray) -> None:
+        agreeing = int(agrees.sum())
+        with self._lock:
+            stats = self._stats.setdefault(challenger.version, _ChallengerStats())
+            stats.batches += 1
+            stats.rows += len(agrees)
+            stats.agreeing_rows += agreeing
+            stats.abs_probability_diff_sum += float(np.abs(probabilities - champion_probabilities).sum())
+            stats.seconds += elapsed
+            stats.max_batch_seconds = max(stats.max_batch_seconds, elapsed)
+            agreement_rate = stats.agreeing_rows / stats.rows
+        CHALLENGER_INFERENCE_SECONDS.observe(elapsed, model=challenger.name)
+        CHALLENGER_ROWS.inc(agreeing, model=challenger.name, agreement="agree")
+        CHALLENGER_ROWS.inc(len(agrees) - agreeing, model=challenger.name, agreement="disagree")
+        CHALLENGER_AGREEMENT.set(agreement_rate, model=challenger.name)
+
+    def _store(self, rows: List[Dict[str, Any]]) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(insert(ChallengerPrediction), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def report(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            summaries = []
+            for challenger in self._challengers:
+                stats = self._stats.get(challenger.version, _ChallengerStats())
+                summaries.append({
+                    "name": challenger.name,
+                    "model_version": challenger.version,
+                    "batches_scored": stats.batches,
+                    "rows_scored": stats.rows,
+                    "agreement_rate": stats.agreeing_rows / stats.rows if stats.rows else None,
+                    "mean_abs_probability_diff": stats.abs_probability_diff_sum / stats.rows if stats.rows else None,
+                    "mean_batch_latency_ms": 1000 * stats.seconds / stats.batches if stats.batches else None,
+                    "max_batch_latency_ms": 1000 * stats.max_batch_seconds if stats.batches else None,
+                    "microseconds_per_row": 1e6 * stats.seconds / stats.rows if stats.rows else None,
+                })
+            return summaries
+
+    @property
+    def pending_batches(self) -> int:
+        return self._queue.qsize()
+
+
+shadow_scorer = ShadowScorer()
@@ -0,0 +1,315 @@
+"""
+Offline retraining of the pass/fail model from our own students and exam outcomes.
+
+- Export: students joined to their latest ExamOutcome are read in chunks with
+  yield_per (or from a CSV written by export_training_data), so memory holds the
+  engineered feature matrix only, never the raw rows of the whole table.
+- Features: every chunk goes through app.ml.model.engineer_features, the function the
+  inference path uses, so training and serving cannot drift apart.
+- Evaluation: stratified k-fold out-of-fold probabilities with the folds fitted in
+  parallel (n_jobs), scaler included in each fold so no statistics leak across folds.
+- Output: a versioned bundle directory with the three joblib artifacts under their usual
+  names plus metadata.json (metrics, calibration table, inference latency) and the
+  drift monitor's reference_profile.json. Any bundle can be served with load_ml_components(bundle_dir), ML_BUNDLE_DIR or bundles/CURRENT.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import os
+import shutil
+import time
+import uuid
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from sklearn.metrics import accuracy_score, brier_score_loss, confusion_matrix, log_loss, roc_auc_score
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler
+from sklearn.tree import DecisionTreeClassifier
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.ml import model as ml_model_module
+from app.ml.drift import PROBABILITY_COLUMN, build_reference_profile, monitored_columns
+from app.models import ExamOutcome, Student
+
+# Model inputs, in the order the artifacts expect them
+TRAINING_FEATURE_NAMES = ['test_1_score', 'test_2_score', 'test_3_score', 'score_improvement_rate', 'test_scores_std_dev']
+RAW_COLUMNS = ['test_1_score', 'test_2_score', 'test_3_score', 'learn_guide_completed']
+LABEL_COLUMN = 'passed'
+
+EXPORT_CHUNK_SIZE = 10_000
+DEFAULT_CV_FOLDS = 5
+# Fewer labelled students than this gives meaningless metrics
+MIN_TRAINING_ROWS = 50
+RANDOM_STATE = 42
+CALIBRATION_METHODS = ("none", "sigmoid", "isotonic")
+CALIBRATION_BINS = 10
+LATENCY_BATCH_SIZES = (1, 100, 1000)
+LATENCY_REPEATS = 30
+METADATA_FILENAME = 'metadata.json'
+
+
+class TrainingError(Exception):
+    """Raised when there is not enough usable labelled data to train or evaluate."""
+    pass
+
+
+# --- Export ---
+
+def _labelled_students_query():
+    """Every student with at least one exam outcome, labelled with the latest attempt."""
+    ranked = select(
+        ExamOutcome.student_id,
+        ExamOutcome.passed,
+        func.row_number().over(
+            partition_by=ExamOutcome.student_id,
+            order_by=(ExamOutcome.exam_date.desc(), ExamOutcome.outcome_id.desc()),
+        ).label("rn"),
+    ).subquery()
+    return select(
+        Student.student_id, Student.program, *[getattr(Student, column) for column in RAW_COLUMNS],
+        ranked.c.passed.label(LABEL_COLUMN),
+    ).join(ranked, ranked.c.student_id == Student.student_id)\
+     .where(ranked.c.rn == 1)\
+     .order_by(Student.student_id)
+
+
+def iter_training_chunks(db: Session, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Streams the labelled students from the database as DataFrames of at most `chunk_size` rows."""
+    result = db.execute(_labelled_students_query().execution_options(yield_per=chunk_size))
+    columns = list(result.keys())
+    for partition in result.partitions():
+        yield pd.DataFrame.from_records(partition, columns=columns)
+
+
+def iter_training_chunks_from_csv(path: Path, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def export_training_data(db: Session, path: Path, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Writes the labelled students to CSV chunk by chunk. Returns the number of rows written."""
+    written = 0
+    for i, chunk in enumerate(iter_training_chunks(db, chunk_size)):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        written += len(chunk)
+    if written == 0:
+        pd.DataFrame(columns=["student_id", "program", *RAW_COLUMNS, LABEL_COLUMN]).to_csv(path, index=False)
+    return written
+
+
+def build_training_set(chunks: Iterable[pd.DataFrame], latency_sample_rows: int = max(LATENCY_BATCH_SIZES)
+                       ) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame, Dict[str, np.ndarray]]:
+    """
+    Engineers each chunk as it arrives. Returns (X, y, raw sample, monitored columns): X is
+    exactly engineer_features' output, the monitored columns are the drift monitor's view
+    of the same rows (before imputation), and the raw rows are kept only up to
+    `latency_sample_rows` for the latency measurement.
+    """
+    feature_blocks: List[np.ndarray] = []
+    label_blocks: List[np.ndarray] = []
+    monitored_blocks: List[Dict[str, np.ndarray]] = []
+    sample_blocks: List[pd.DataFrame] = []
+    sampled = 0
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        derived = ml_model_module.derive_features(chunk[RAW_COLUMNS], TRAINING_FEATURE_NAMES)
+        feature_blocks.append(derived.fillna(0).to_numpy(dtype=float))  # == engineer_features
+        label_blocks.append(chunk[LABEL_COLUMN].astype(bool).astype(int).to_numpy())
+        monitored_blocks.append(monitored_columns(chunk, derived, None))
+        if sampled < latency_sample_rows:
+            sample_blocks.append(chunk[RAW_COLUMNS].head(latency_sample_rows - sampled))
+            sampled += len(sample_blocks[-1])
+    if not feature_blocks:
+        return np.empty((0, len(TRAINING_FEATURE_NAMES))), np.empty(0, dtype=int), pd.DataFrame(columns=RAW_COLUMNS), {}
+    monitored = {name: np.concatenate([block[name] for block in monitored_blocks]) for name in monitored_blocks[0]}
+    return np.vstack(feature_blocks), np.concatenate(label_blocks), pd.concat(sample_blocks, ignore_index=True), monitored
+
+
+# --- Model ---
+
+def build_model(random_state: int = RANDOM_STATE) -> VotingClassifier:
+    """Same architecture and hyper-parameters as the model originally shipped with the app."""
+    return VotingClassifier(
+        estimators=[
+            ('rf', RandomForestClassifier(n_estimators=100, max_depth=10, random_state=random_state)),
+            ('dt', DecisionTreeClassifier(max_depth=5, random_state=random_state)),
+        ],
+        voting='soft',
+    )
+
+
+def build_pipeline(calibration: str = "none", random_state: int = RANDOM_STATE) -> Pipeline:
+    """
+    Scaler + classifier. With calibration the classifier is wrapped in CalibratedClassifierCV;
+    calibrated models serve fine but have no per-feature explanations.
+    """
+    if calibration not in CALIBRATION_METHODS:
+        raise TrainingError(f"Unknown calibration '{calibration}'. Expected one of {CALIBRATION_METHODS}.")
+    classifier: Any = build_model(random_state)
+    if calibration != "none":
+        classifier = CalibratedClassifierCV(classifier, method=calibration, cv=3)
+    return Pipeline([("scaler", MinMaxScaler()), ("model", classifier)])
+
+
+# --- Evaluation ---
+
+def _calibration_table(y: np.ndarray, proba: np.ndarray, bins: int = CALIBRATION_BINS) -> List[Dict[str, float]]:
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    bucket = np.clip(np.digitize(proba, edges[1:-1]), 0, bins - 1)
+    table = []
+    for b in range(bins):
+        in_bucket = bucket == b
+        count = int(in_bucket.sum())
+        if count:
+            table.append({
+                "bin": f"{edges[b]:.1f}-{edges[b + 1]:.1f}",
+                "count": count,
+                "mean_predicted": round(float(proba[in_bucket].mean()), 4),
+                "observed_pass_rate": round(float(y[in_bucket].mean()), 4),
+            })
+    return table
+
+
+def _classification_metrics(y: np.ndarray, proba: np.ndarray, threshold: float) -> Dict[str, Any]:
+    predicted = (proba >= threshold).astype(int)
+    tn, fp, fn, tp = confusion_matrix(y, predicted, labels=[0, 1]).ravel()
+    return {
+        "roc_auc": round(float(roc_auc_score(y, proba)), 4),
+        "accuracy": round(float(accuracy_score(y, predicted)), 4),
+        "brier_score": round(float(brier_score_loss(y, proba)), 4),
+        "log_loss": round(float(log_loss(y, proba, labels=[0, 1])), 4),
+        "confusion_matrix": {"tn": int(tn), "fp": int(fp), "fn": int(fn), "tp": int(tp)},
+    }
+
+
+def cross_validate_model(pipeline: Pipeline, X: np.ndarray, y: np.ndarray, folds: int = DEFAULT_CV_FOLDS,
+                         n_jobs: Optional[int] = -1, threshold: float = ml_model_module.DEFAULT_PASS_THRESHOLD
+                         ) -> Tuple[Dict[str, Any], np.ndarray]:
+    """
+    Out-of-fold probabilities for every row with the folds fitted in parallel. Returns the
+    metrics (overall and per-fold AUC) and the probabilities themselves.
+    """
+    minority = int(min(np.bincount(y, minlength=2)))
+    if minority < folds:
+        raise TrainingError(f"Both outcomes need at least {folds} students for {folds}-fold cross-validation; the smaller class has {minority}.")
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE).split(X, y))
+    start = time.perf_counter()
+    oof_proba = cross_val_predict(pipeline, X, y, cv=splits, method="predict_proba", n_jobs=n_jobs)[:, 1]
+    elapsed = time.perf_counter() - start
+
+    report = _classification_metrics(y, oof_proba, threshold)
+    report["folds"] = folds
+    report["fold_roc_auc"] = [round(float(roc_auc_score(y[test], oof_proba[test])), 4) for _, test in splits]
+    report["pass_threshold"] = threshold
+    report["calibration"] = _calibration_table(y, oof_proba)
+    report["cv_seconds"] = round(elapsed, 3)
+    return report, oof_proba
+
+
+def measure_inference_latency(model, scaler, raw_sample: pd.DataFrame, batch_sizes=LATENCY_BATCH_SIZES,
+                              repeats: int = LATENCY_REPEATS) -> Dict[str, Dict[str, float]]:
+    """Times the serving path (engineer_features, scale, predict_proba) on raw rows at each batch size."""
+    report = {}
+    if raw_sample.empty:
+        return report
+    for batch_size in batch_sizes:
+        batch = raw_sample.iloc[np.arange(batch_size) % len(raw_sample)].reset_index(drop=True)
+        samples = []
+        for _ in range(repeats + 1):  # The first run warms caches and is discarded
+            start = time.perf_counter()
+            features = ml_model_module.engineer_features(batch, TRAINING_FEATURE_NAMES)
+            model.predict_proba(scaler.transform(features.to_numpy()))
+            samples.append(time.perf_counter() - start)
+        samples_ms = np.asarray(samples[1:]) * 1000.0
+        report[str(batch_size)] = {
+            "p50_ms": round(float(np.percentile(samples_ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(samples_ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(samples_ms, 99)), 3),
+            "rows_per_s": round(batch_size / (samples_ms.mean() / 1000.0), 1),
+        }
+    return report
+
+
+# --- Bundles ---
+
+def write_bundle(model, scaler, feature_names: List[str], metadata: Dict[str, Any],
+                 bundles_dir: Path = ml_model_module.BUNDLES_DIR, reference_profile: Optional[Dict[str, Any]] = None) -> Path:
+    """
+    Writes the artifacts into bundles_dir/<timestamp>-<model version>. The directory appears
+    only once complete, so a worker never loads half a bundle.
+    """
+    bundles_dir.mkdir(parents=True, exist_ok=True)
+    staging = bundles_dir / f".staging-{uuid.uuid4().hex[:8]}"
+    staging.mkdir()
+    try:
+        joblib.dump(model, staging / ml_model_module.MODEL_FILENAME)
+        joblib.dump(scaler, staging / ml_model_module.SCALER_FILENAME)
+        joblib.dump(list(feature_names), staging / ml_model_module.FEATURE_NAMES_FILENAME)
+        version = ml_model_module.artifacts_digest(staging)
+        metadata = {"model_version": version, **metadata}
+        (staging / METADATA_FILENAME).write_text(json.dumps(metadata, indent=2))
+        if reference_profile is not None:
+            (staging / ml_model_module.REFERENCE_PROFILE_FILENAME).write_text(json.dumps(reference_profile))
+        bundle_dir = bundles_dir / f"{datetime.utcnow():%Y%m%dT%H%M%SZ}-{version}"
+        staging.rename(bundle_dir)
+        return bundle_dir
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def activate_bundle(bundle_dir: Path, pointer: Path = ml_model_module.CURRENT_BUNDLE_POINTER) -> None:
+    """Makes `bundle_dir` the one served after the next load (POST /model/reload or restart)."""
+    # Bundles outside the default directory are recorded by absolute path
+    target = bundle_dir.name if bundle_dir.resolve().parent == pointer.resolve().parent else str(bundle_dir.resolve())
+    pointer.parent.mkdir(parents=True, exist_ok=True)
+    staging = pointer.with_name(pointer.name + ".tmp")
+    staging.write_text(target + "\n")
+    os.replace(staging, pointer)
+
+
+# --- Entry point ---
+
+def train(chunks: Iterable[pd.DataFrame], *, folds: int = DEFAULT_CV_FOLDS, n_jobs: Optional[int] = -1,
+          calibration: str = "none", min_rows: int = MIN_TRAINING_ROWS,
+          bundles_dir: Path = ml_model_module.BUNDLES_DIR) -> Tuple[Path, Dict[str, Any]]:
+    """Builds the training set, cross-validates, fits on all rows and writes a bundle. Returns (bundle dir, metadata)."""
+    started = time.perf_counter()
+    X, y, raw_sample, monitored = build_training_set(chunks)
+    if len(y) < min_rows:
+        raise TrainingError(f"Only {len(y)} students have an exam outcome; at least {min_rows} are needed.")
+
+    pipeline = build_pipeline(calibration)
+    evaluation, oof_proba = cross_validate_model(pipeline, X, y, folds=folds, n_jobs=n_jobs)
+    # Out-of-fold probabilities are what the model outputs on students it has not seen
+    monitored[PROBABILITY_COLUMN] = oof_proba
+
+    fit_start = time.perf_counter()
+    pipeline.fit(X, y)
+    fit_seconds = time.perf_counter() - fit_start
+    scaler, model = pipeline.named_steps["scaler"], pipeline.named_steps["model"]
+
+    metadata = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "sklearn_version": sklearn.__version__,
+        "feature_names": TRAINING_FEATURE_NAMES,
+        "model": repr(model),
+        "calibration": calibration,
+        "training_rows": int(len(y)),
+        "pass_rate": round(float(y.mean()), 4),
+        "evaluation": evaluation,
+        "fit_seconds": round(fit_seconds, 3),
+        "inference_latency": measure_inference_latency(model, scaler, raw_sample),
+        "total_seconds": round(time.perf_counter() - started, 3),
+    }
+    bundle_dir = write_bundle(model, scaler, TRAINING_FEATURE_NAMES, metadata, bundles_dir,
+                              reference_profile=build_reference_profile(monitored, source="training"))
+    return bundle_dir, json.loads((bundle_dir / METADATA_FILENAME).read_text())
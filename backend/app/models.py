@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -29,15 +29,22 @@ class Student(Base):
     learn_guide_completed = Column(Boolean)
 
     # ✅ Add reverse relationships here
-    features = relationship("StudentFeatureSet", back_populates="student", cascade="all, delete-orphan")
-    predictions = relationship("Prediction", back_populates="student", cascade="all, delete-orphan")
+    # Child rows are removed by ON DELETE CASCADE in the database; passive_deletes keeps the
+    # ORM from loading them first
+    features = relationship("StudentFeatureSet", back_populates="student", cascade="all, delete-orphan", passive_deletes=True)
+    predictions = relationship("Prediction", back_populates="student", cascade="all, delete-orphan", passive_deletes=True)
+    latest_prediction = relationship("StudentLatestPrediction", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_students_program_section", "program", "section"),
+    )
 
 
 class StudentFeatureSet(Base):
     __tablename__ = "student_feature_sets"
 
     feature_id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("students.student_id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), nullable=False)
     test_1_score = Column(Float, nullable=False)
     test_2_score = Column(Float, nullable=False)
     test_3_score = Column(Float, nullable=False)
@@ -48,16 +55,202 @@ class StudentFeatureSet(Base):
 
     student = relationship("Student", back_populates="features")
 
+    __table_args__ = (
+        # One feature set per student; lets updates upsert it in a single statement
+        Index("ux_student_feature_sets_student", "student_id", unique=True),
+    )
+
 
 class Prediction(Base):
     __tablename__ = "predictions"
 
     prediction_id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("students.student_id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), nullable=False)
     date = Column(Date, nullable=False)
     predicted_score = Column(Float, nullable=False)  # Probability of passing
     category = Column(String, nullable=False)        # e.g., "Pass" or "Fail"
     model_type = Column(String, nullable=False)      # e.g., "LogisticRegression"
+    risk_band = Column(String, nullable=True)        # "High", "Medium" or "Low"; set at inference time
 
     student = relationship("Student", back_populates="predictions")
 
+    __table_args__ = (
+        # Serves per-student history and "latest prediction" lookups without a table scan
+        Index("ix_predictions_student_date", "student_id", "date", "prediction_id"),
+        Index("ix_predictions_risk_band_date", "risk_band", "date"),
+        # Ids are never reused after deletes, so incremental exports can use them as a watermark
+        {"sqlite_autoincrement": True},
+    )
+
+
+class PredictionExplanation(Base):
+    """
+    Per-feature contributions for one Prediction, stored only when an explanation was
+    requested. Vectors are float32 blobs in `feature_names` order (see app.ml.explain).
+    """
+    __tablename__ = "prediction_explanations"
+
+    prediction_id = Column(Integer, ForeignKey("predictions.prediction_id", ondelete="CASCADE"), primary_key=True)
+    space = Column(String, nullable=False)           # "probability" or "log_odds"
+    base_value = Column(Float, nullable=False)
+    feature_names = Column(String, nullable=False)   # Comma-separated
+    contributions = Column(LargeBinary, nullable=False)
+    feature_values = Column(LargeBinary, nullable=False)
+
+
+class PredictionArchive(Base):
+    """
+    Cold storage for prediction rows removed from `predictions` by history compaction.
+    No foreign key to students so archived history outlives deleted students.
+    """
+    __tablename__ = "predictions_archive"
+
+    prediction_id = Column(Integer, primary_key=True)  # Original Prediction.prediction_id
+    student_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    predicted_score = Column(Float, nullable=False)
+    category = Column(String, nullable=False)
+    model_type = Column(String, nullable=False)
+    risk_band = Column(String, nullable=True)
+    archived_on = Column(Date, nullable=False)
+
+    __table_args__ = (
+        Index("ix_predictions_archive_student_date", "student_id", "date"),
+    )
+
+
+class StudentLatestPrediction(Base):
+    """
+    One row per student mirroring their most recent Prediction (by date, then prediction_id).
+    Maintained on every prediction insert so rankings can walk the score index
+    instead of grouping the whole predictions history.
+    """
+    __tablename__ = "student_latest_predictions"
+
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), primary_key=True)
+    prediction_id = Column(Integer, ForeignKey("predictions.prediction_id", ondelete="CASCADE"), nullable=False)
+    date = Column(Date, nullable=False)
+    predicted_score = Column(Float, nullable=False)
+    category = Column(String, nullable=False)
+    risk_band = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_student_latest_predictions_score", "predicted_score", "student_id"),
+        # Dashboard at-risk counts and lists read one band, lowest probability first
+        Index("ix_student_latest_predictions_band_score", "risk_band", "predicted_score"),
+        # Foreign key lookups when predictions are deleted (ON DELETE CASCADE)
+        Index("ix_student_latest_predictions_prediction", "prediction_id"),
+    )
+
+
+class ExamOutcome(Base):
+    """
+    A student's actual certification exam result; the label the model is trained on.
+    A student may sit the exam more than once, the latest attempt is the training label.
+    """
+    __tablename__ = "exam_outcomes"
+
+    outcome_id = Column(Integer, primary_key=True)
+    student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), nullable=False)
+    exam_date = Column(Date, nullable=False)
+    passed = Column(Boolean, nullable=False)
+    exam_score = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_exam_outcomes_student_date", "student_id", "exam_date", "outcome_id"),
+    )
+
+
+class RiskBandConfig(Base):
+    """
+    Decision threshold and risk bands for one program; program "*" is the default.
+    A pass probability below high_risk_below is "High" risk, below medium_risk_below
+    "Medium", otherwise "Low".
+    """
+    __tablename__ = "risk_band_configs"
+
+    program = Column(String, primary_key=True)
+    pass_threshold = Column(Float, nullable=False)
+    high_risk_below = Column(Float, nullable=False)
+    medium_risk_below = Column(Float, nullable=False)
+
+
+class PredictionTrendRollup(Base):
+    """
+    Per class and day aggregates of the predictions history, maintained on every prediction
+    insert so trend charts never scan `predictions`; weeks and months are sums of days.
+    A flip is a prediction whose category differs from the student's previous one; flips are
+    counted as events, not distinct students, which keeps days summable into weeks and months.
+    Rows outlive retention compaction and student deletes: they summarize history as scored.
+    """
+    __tablename__ = "prediction_trend_rollups"
+
+    program = Column(String, primary_key=True)          # "" for students without one
+    section = Column(String, primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    prediction_count = Column(Integer, nullable=False)
+    probability_sum = Column(Float, nullable=False)
+    pass_count = Column(Integer, nullable=False)
+    fail_count = Column(Integer, nullable=False)
+    flips_to_pass = Column(Integer, nullable=False)
+    flips_to_fail = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # Trends across every class read a date range
+        Index("ix_prediction_trend_rollups_date", "bucket_date"),
+    )
+
+
+class DashboardClassAggregate(Base):
+    """
+    Per class counters behind the dashboard statistics, kept current by triggers on
+    `students` (see app.services.dashboard_service), so every write costs one row update
+    and the dashboard sums a few dozen rows instead of scanning students.
+    """
+    __tablename__ = "dashboard_class_aggregates"
+
+    program = Column(String, primary_key=True)          # "" for students without one, see program_is_null
+    section = Column(String, primary_key=True)
+    # Tell a NULL program or section (stored as "") apart from a real empty string
+    program_is_null = Column(Boolean, primary_key=True)
+    section_is_null = Column(Boolean, primary_key=True)
+    student_count = Column(Integer, nullable=False)
+    score_count = Column(Integer, nullable=False)       # Students with an avg_test_score
+    score_sum = Column(Float, nullable=False)
+    learn_guide_completed = Column(Integer, nullable=False)
+    learn_guide_not_completed = Column(Integer, nullable=False)
+    # Students per dashboard score distribution bucket (crud.dashboard.SCORE_BUCKETS)
+    score_90_100 = Column(Integer, nullable=False)
+    score_80_89 = Column(Integer, nullable=False)
+    score_70_79 = Column(Integer, nullable=False)
+    score_60_69 = Column(Integer, nullable=False)
+    score_0_59 = Column(Integer, nullable=False)
+
+
+class DashboardRiskBandCount(Base):
+    """Students per latest-prediction risk band, kept current by triggers on student_latest_predictions."""
+    __tablename__ = "dashboard_risk_band_counts"
+
+    risk_band = Column(String, primary_key=True)        # "" for latest predictions without a band
+    student_count = Column(Integer, nullable=False)
+
+
+class ChallengerPrediction(Base):
+    """
+    A challenger model's shadow score for one row the champion scored, for offline
+    comparison; never shown to users. No foreign key to students, like the archive.
+    """
+    __tablename__ = "challenger_predictions"
+
+    id = Column(Integer, primary_key=True)
+    scored_at = Column(DateTime, nullable=False)
+    challenger_version = Column(String, nullable=False)   # Artifact digest of the challenger bundle
+    champion_version = Column(String, nullable=False)
+    student_id = Column(Integer, nullable=True)            # None for inline feature rows
+    champion_probability = Column(Float, nullable=False)
+    challenger_probability = Column(Float, nullable=False)
+    agrees = Column(Boolean, nullable=False)               # Same category at the row's pass threshold
+
+    __table_args__ = (
+        Index("ix_challenger_predictions_version_time", "challenger_version", "scored_at"),
+    )
@@ -0,0 +1,332 @@
+"""
+On-demand request profiling for the dashboard and prediction hot paths.
+
+A request is profiled when an admin armed profiling for its path (POST /debug/profiling)
+or, with PROFILING_ENABLED=1, when it carries an `X-Profile: sample|cprofile` header
+together with an admin's bearer token. Two modes are available:
+
+- sample: a background thread snapshots every thread's stack with sys._current_frames()
+  at a fixed interval while the request runs. Overhead is bounded by the interval and
+  the output is in collapsed-stack format (flamegraph.pl, speedscope, inferno).
+- cprofile: deterministic cProfile of the endpoint function. instrument_endpoints()
+  wraps every route's endpoint so the profiler runs only while that endpoint's code
+  does: in the threadpool thread for sync endpoints, and for async endpoints only
+  between the coroutine's suspensions, so other requests served by the event loop in
+  the meantime are not attributed to it. Dependencies and response serialization are
+  not covered. Precise call counts, but slows the endpoint down noticeably.
+
+Finished profiles are kept in a small in-memory ring and returned with an X-Profile-Id
+response header. When nothing is armed and the header is not allowed, the middleware
+costs a single flag check per request.
+"""
+from collections import Counter as TallyCounter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+import asyncio
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+from app.auth.auth import is_admin_token
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_HEADER = b"x-profile"
+PROFILE_MODES = ("sample", "cprofile")
+# Sampling period; 5 ms keeps the sampler well under 5% of one core
+PROFILE_SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_STACK_DEPTH = 128
+# Finished profiles kept in memory
+PROFILE_STORE_MAX_ENTRIES = 20
+# Upper bound for POST /debug/profiling `count`
+PROFILE_MAX_ARMED_REQUESTS = 20
+PROFILE_STATS_MAX_ROWS = 60
+
+# Leaf frames in these files mean the thread is idle (waiting on a lock, queue or socket)
+_IDLE_LEAF_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+class ProfilingError(Exception):
+    """Raised for invalid profiling requests."""
+    pass
+
+
+@dataclass
+class Profile:
+    profile_id: str
+    mode: str
+    method: str
+    path: str
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    status: Optional[int] = None
+    duration_ms: Optional[float] = None
+    sample_count: int = 0
+    # Collapsed stacks ("root;child;leaf count" per line) or a pstats report
+    output: str = ""
+
+
+# --- Stack sampling ---
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, thread_name: str) -> Optional[str]:
+    if os.path.basename(frame.f_code.co_filename) in _IDLE_LEAF_FILES:
+        return None
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class StackSampler(threading.Thread):
+    """Collects collapsed stacks of all busy threads until stop() is called."""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL_SECONDS):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: TallyCounter = TallyCounter()
+        self.sample_count = 0
+        self._stop_requested = threading.Event()
+
+    def run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop_requested.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = _collapse(frame, names.get(ident, f"thread-{ident}"))
+                if stack is not None:
+                    self.stacks[stack] += 1
+            self.sample_count += 1
+
+    def stop(self) -> None:
+        self._stop_requested.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+# --- Endpoint cProfile ---
+
+# The profiler of the request being cProfiled, seen by its endpoint (also in the threadpool)
+_active_profiler: ContextVar[Optional[cProfile.Profile]] = ContextVar("active_profiler", default=None)
+
+
+class _ProfiledSteps:
+    """Awaits `coro` with `profiler` enabled while the coroutine runs and disabled while it is suspended."""
+
+    def __init__(self, coro, profiler: cProfile.Profile):
+        self.coro = coro
+        self.profiler = profiler
+
+    def __await__(self):
+        step, value = self.coro.send, None
+        while True:
+            self.profiler.enable()
+            try:
+                yielded = step(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profiler.disable()
+            try:
+                step, value = self.coro.send, (yield yielded)
+            except BaseException as e:
+                step, value = self.coro.throw, e
+
+
+def _profiled_endpoint(call: Callable) -> Callable:
+    if inspect.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def run_async(*args, **kwargs):
+            profiler = _active_profiler.get()
+            if profiler is None:
+                return await call(*args, **kwargs)
+            return await _ProfiledSteps(call(*args, **kwargs), profiler)
+        run_async.profiled = True
+        return run_async
+
+    @functools.wraps(call)
+    def run_sync(*args, **kwargs):
+        profiler = _active_profiler.get()
+        if profiler is None:
+            return call(*args, **kwargs)
+        # cProfile hooks the calling thread: the threadpool thread running this endpoint
+        profiler.enable()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            profiler.disable()
+    run_sync.profiled = True
+    return run_sync
+
+
+def instrument_endpoints(app) -> None:
+    """Lets cprofile mode profile each route's endpoint; costs a context variable lookup per request."""
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is None or dependant.call is None or getattr(dependant.call, "profiled", False):
+            continue
+        # FastAPI calls dependant.call per request and decided sync/async when the route was
+        # built; the wrapper keeps the endpoint's kind
+        dependant.call = _profiled_endpoint(dependant.call)
+
+
+def _pstats_report(profiler: cProfile.Profile) -> str:
+    if not profiler.getstats():
+        return "No endpoint code ran (the request was answered before reaching its endpoint).\n"
+    buffer = io.StringIO()
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS_MAX_ROWS)
+    return buffer.getvalue()
+
+
+# --- Arming and storage ---
+
+class ProfileStore:
+    """Bounded ring of finished profiles plus the per-path arm counters."""
+
+    def __init__(self, max_entries: int = PROFILE_STORE_MAX_ENTRIES):
+        self._profiles: Deque[Profile] = deque(maxlen=max_entries)
+        self._armed: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+        # Only one request is profiled at a time; concurrent profiles would see each other
+        self.active = threading.Lock()
+
+    def arm(self, path_prefix: str, mode: str, count: int) -> None:
+        if mode not in PROFILE_MODES:
+            raise ProfilingError(f"Unknown profiling mode '{mode}'. Expected one of {PROFILE_MODES}.")
+        if not 1 <= count <= PROFILE_MAX_ARMED_REQUESTS:
+            raise ProfilingError(f"count must be between 1 and {PROFILE_MAX_ARMED_REQUESTS}.")
+        with self._lock:
+            self._armed[path_prefix] = {"mode": mode, "remaining": count}
+
+    def disarm_all(self) -> None:
+        with self._lock:
+            self._armed.clear()
+
+    def armed(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            return {prefix: dict(entry) for prefix, entry in self._armed.items()}
+
+    @property
+    def is_armed(self) -> bool:
+        return bool(self._armed)
+
+    def take_armed_mode(self, path: str) -> Optional[str]:
+        """Consumes one armed request for the longest matching prefix and returns its mode."""
+        with self._lock:
+            matches = [prefix for prefix in self._armed if path.startswith(prefix)]
+            if not matches:
+                return None
+            prefix = max(matches, key=len)
+            entry = self._armed[prefix]
+            entry["remaining"] -= 1
+            if entry["remaining"] <= 0:
+                del self._armed[prefix]
+            return entry["mode"]
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.profile_id == profile_id), None)
+
+    def list(self) -> List[Profile]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+
+profile_store = ProfileStore()
+
+
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    return None
+
+
+async def _requested_mode(scope) -> Optional[str]:
+    if PROFILING_ENABLED:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER:
+                mode = value.decode("latin-1").strip().lower()
+                if mode not in PROFILE_MODES:
+                    return None
+                # Profiling costs the server noticeably: only admins may ask for it
+                token = _bearer_token(scope)
+                if token is None or not await asyncio.to_thread(is_admin_token, token):
+                    return None
+                return mode
+    if profile_store.is_armed:
+        return profile_store.take_armed_mode(scope.get("path", ""))
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that were armed or asked for it with X-Profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (PROFILING_ENABLED or profile_store.is_armed):
+            await self.app(scope, receive, send)
+            return
+
+        mode = await _requested_mode(scope)
+        if mode is None or not profile_store.active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(profile_id=uuid.uuid4().hex[:16], mode=mode,
+                          method=scope.get("method", ""), path=scope.get("path", ""))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.profile_id.encode())]
+            await send(message)
+
+        sampler = profiler = profiler_token = None
+        start = time.perf_counter()
+        try:
+            if mode == "sample":
+                sampler = StackSampler()
+                sampler.start()
+            else:
+                # Enabled by the endpoint wrapper (instrument_endpoints) while the endpoint runs
+                profiler = cProfile.Profile()
+                profiler_token = _active_profiler.set(profiler)
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                _active_profiler.reset(profiler_token)
+                profile.output = _pstats_report(profiler)
+            if sampler is not None:
+                sampler.stop()
+                profile.sample_count = sampler.sample_count
+                profile.output = sampler.collapsed()
+            profile.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            profile_store.active.release()
+            profile_store.add(profile)
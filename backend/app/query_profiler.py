@@ -0,0 +1,168 @@
+"""
+Opt-in per-request SQL profiler and N+1 detector.
+
+Enabled with QUERY_PROFILER_ENABLED=1. Every statement executed while a request is being
+handled is recorded; responses get a Server-Timing header plus an X-Query-Profile summary,
+and statement shapes repeated more than QUERY_PROFILER_REPEAT_THRESHOLD times are logged
+as likely N+1 patterns. Endpoints declare their expected query count with @query_budget(n);
+with QUERY_PROFILER_STRICT=1 (test mode) a request exceeding its budget fails with a 500.
+"""
+from collections import Counter as TallyCounter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import List, Optional, Tuple
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILER_ENABLED = os.getenv("QUERY_PROFILER_ENABLED", "0") == "1"
+QUERY_PROFILER_STRICT = os.getenv("QUERY_PROFILER_STRICT", "0") == "1"
+# Identical statement shapes executed more often than this in one request are flagged
+QUERY_PROFILER_REPEAT_THRESHOLD = int(os.getenv("QUERY_PROFILER_REPEAT_THRESHOLD", "5"))
+QUERY_PROFILER_SLOWEST_REPORTED = 3
+# Statement text in headers is truncated to keep header sizes sane
+SHAPE_MAX_LENGTH = 160
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"IN \((?:\?|__\[POSTCOMPILE_\w+\])(?:, ?\?)*\)", re.IGNORECASE)
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+def statement_shape(statement: str) -> str:
+    """Normalizes a statement so repeats differing only in literals or IN-list length compare equal."""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _IN_LIST.sub("IN (?...)", shape)
+    return _NUMBER.sub("N", shape)
+
+
+def query_budget(max_queries: int):
+    """Declares how many SQL statements one request to the decorated endpoint may execute."""
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+@dataclass
+class RequestQueryLog:
+    statements: List[Tuple[str, float]] = field(default_factory=list)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated_shapes(self, threshold: int) -> List[Tuple[str, int]]:
+        tally = TallyCounter(shape for shape, _ in self.statements)
+        return [(shape, count) for shape, count in tally.most_common() if count > threshold]
+
+    def slowest(self, limit: int) -> List[Tuple[str, float]]:
+        return sorted(self.statements, key=lambda item: item[1], reverse=True)[:limit]
+
+
+_current_log: ContextVar[Optional[RequestQueryLog]] = ContextVar("current_query_log", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_log.get() is not None:
+        conn.info.setdefault("profiler_start_times", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _current_log.get()
+    start_times = conn.info.get("profiler_start_times")
+    if log is None or not start_times:
+        return
+    log.statements.append((statement_shape(statement), time.perf_counter() - start_times.pop()))
+
+
+_installed = False
+
+
+def install() -> None:
+    """Registers the engine hooks. Only called when the profiler is enabled, so disabled processes pay nothing."""
+    global _installed
+    if not _installed:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _installed = True
+
+
+def _summary(log: RequestQueryLog, budget: Optional[int]) -> dict:
+    return {
+        "query_count": len(log.statements),
+        "db_ms": round(log.total_seconds * 1000, 2),
+        "budget": budget,
+        "repeated": [
+            {"shape": shape[:SHAPE_MAX_LENGTH], "count": count}
+            for shape, count in log.repeated_shapes(QUERY_PROFILER_REPEAT_THRESHOLD)
+        ],
+        "slowest": [
+            {"shape": shape[:SHAPE_MAX_LENGTH], "ms": round(seconds * 1000, 2)}
+            for shape, seconds in log.slowest(QUERY_PROFILER_SLOWEST_REPORTED)
+        ],
+    }
+
+
+class QueryProfilerMiddleware:
+    """
+    ASGI middleware attaching query statistics to each response. Statistics are taken when
+    the response starts, i.e. after the endpoint returned (streamed bodies are not covered).
+    """
+
+    def __init__(self, app, strict: bool = QUERY_PROFILER_STRICT):
+        self.app = app
+        self.strict = strict
+        install()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = RequestQueryLog()
+        token = _current_log.set(log)
+        state = {"suppress_body": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                route_label = getattr(route, "path", scope.get("path", ""))
+                budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+                summary = _summary(log, budget)
+
+                if summary["repeated"]:
+                    logger.warning("Possible N+1 in %s %s: %s", scope.get("method"), route_label, summary["repeated"])
+                over_budget = budget is not None and summary["query_count"] > budget
+                if over_budget:
+                    logger.warning("%s %s executed %d queries, budget is %d",
+                                   scope.get("method"), route_label, summary["query_count"], budget)
+
+                headers = [
+                    (b"server-timing", f'db;dur={summary["db_ms"]};desc="{summary["query_count"]} queries"'.encode()),
+                    (b"x-query-profile", json.dumps(summary, separators=(",", ":")).encode()),
+                ]
+                if over_budget and self.strict:
+                    body = json.dumps({"detail": f"Query budget exceeded: {summary['query_count']} > {budget}",
+                                       "query_profile": summary}).encode()
+                    state["suppress_body"] = True
+                    await send({"type": "http.response.start", "status": 500,
+                                "headers": [(b"content-type", b"application/json"),
+                                            (b"content-length", str(len(body)).encode())] + headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + headers
+            elif message["type"] == "http.response.body" and state["suppress_body"]:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_log.reset(token)
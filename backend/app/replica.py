@@ -0,0 +1,267 @@
+"""
+Optional read-only analytics replica of the primary SQLite database.
+
+With ANALYTICS_REPLICA_PATH set, a background thread copies main.db to that file every
+ANALYTICS_REPLICA_REFRESH_SECONDS with SQLite's online backup API, in steps so writers to the
+primary are not locked out for the whole copy, and refreshes the
+copy's planner statistics. The finished copy replaces the replica with an atomic rename, so
+readers never see a half-built file; open connections keep the copy they started on.
+With several workers, a coordination lease lets one of them refresh for all.
+
+Class history and trend endpoints read through get_analytics_db. One student's history
+stays on the primary, so a prediction shows up as soon as it is made, and so do the dashboard
+statistics, whose live updates (/dashboard-stats/events) are diffed against the primary. While the
+replica is at most ANALYTICS_REPLICA_MAX_STALENESS_SECONDS old they read the replica,
+otherwise they fall back to the primary. Either way the response carries X-Data-As-Of, the time its data
+was read from the primary (DataFreshnessMiddleware), and cached responses are keyed by the
+replica snapshot so a refresh changes their ETag.
+"""
+from datetime import datetime, timezone
+from fastapi import Depends, Request
+from pathlib import Path
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+from typing import Iterator, Optional, Tuple
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.auth.auth import get_db
+from app.coordination import coordination_store
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.metrics import ANALYTICS_READS, ANALYTICS_REPLICA_AGE_SECONDS, ANALYTICS_REPLICA_REFRESH_DURATION
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_REPLICA_PATH = os.getenv("ANALYTICS_REPLICA_PATH", "")
+ANALYTICS_REPLICA_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REPLICA_REFRESH_SECONDS", "30"))
+# Older replicas are not used: reads go to the primary until the next refresh
+ANALYTICS_REPLICA_MAX_STALENESS_SECONDS = float(os.getenv("ANALYTICS_REPLICA_MAX_STALENESS_SECONDS", "120"))
+# Pages copied per backup step; -1 copies in one step. The primary is only read-locked during
+# a step, and writers get ANALYTICS_REPLICA_BACKUP_PAUSE_SECONDS between steps.
+ANALYTICS_REPLICA_BACKUP_PAGES = int(os.getenv("ANALYTICS_REPLICA_BACKUP_PAGES", "1024"))
+ANALYTICS_REPLICA_BACKUP_PAUSE_SECONDS = float(os.getenv("ANALYTICS_REPLICA_BACKUP_PAUSE_SECONDS", "0.005"))
+# A write to the primary between steps restarts the copy; after this many restarts the
+# refresh copies in one step instead, so constant writes cannot starve it
+ANALYTICS_REPLICA_BACKUP_MAX_RESTARTS = 3
+REFRESH_LOCK_NAME = "analytics-replica-refresh"
+META_TABLE = "analytics_replica_meta"
+FRESHNESS_HEADER = "X-Data-As-Of"
+
+class _BackupRestartedTooOften(Exception):
+    pass
+
+
+def _stepped_backup(source: sqlite3.Connection, target: sqlite3.Connection) -> None:
+    """Copies `source` into `target` ANALYTICS_REPLICA_BACKUP_PAGES pages at a time."""
+    progress_state = {"remaining": None, "restarts": 0}
+
+    def pause_between_steps(status: int, remaining: int, total: int) -> None:
+        if progress_state["remaining"] is not None and remaining > progress_state["remaining"]:
+            progress_state["restarts"] += 1
+            if progress_state["restarts"] > ANALYTICS_REPLICA_BACKUP_MAX_RESTARTS:
+                raise _BackupRestartedTooOften()
+        progress_state["remaining"] = remaining
+        if remaining:
+            # The step has released the primary's read lock; let queued writers commit
+            time.sleep(ANALYTICS_REPLICA_BACKUP_PAUSE_SECONDS)
+
+    if ANALYTICS_REPLICA_BACKUP_PAGES <= 0:
+        source.backup(target)
+        return
+    try:
+        source.backup(target, pages=ANALYTICS_REPLICA_BACKUP_PAGES, progress=pause_between_steps)
+    except _BackupRestartedTooOften:
+        logger.info("Analytics replica copy kept restarting under writes; copying in one step.")
+        source.backup(target)
+
+
+def primary_database_path() -> Optional[str]:
+    prefix = "sqlite:///"
+    if not SQLALCHEMY_DATABASE_URL.startswith(prefix):
+        return None
+    return SQLALCHEMY_DATABASE_URL[len(prefix):].split("?", 1)[0]
+
+
+class AnalyticsReplica:
+    def __init__(self, path: str = ANALYTICS_REPLICA_PATH,
+                 refresh_seconds: float = ANALYTICS_REPLICA_REFRESH_SECONDS,
+                 max_staleness_seconds: float = ANALYTICS_REPLICA_MAX_STALENESS_SECONDS):
+        self.path = Path(path) if path else None
+        self.refresh_seconds = refresh_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot: Optional[Tuple[Tuple[int, int], datetime]] = None  # (file identity, snapshot time)
+        self._lock = threading.Lock()
+        # The staging file is per process: one refresh at a time in it
+        self._refresh_lock = threading.Lock()
+        self.engine = None
+        self.SessionLocal = None
+        if self.path is not None:
+            # NullPool: every session opens the file anew, so it sees the latest renamed-in copy
+            self.engine = create_engine(
+                f"sqlite:///file:{self.path.resolve()}?mode=ro&uri=true",
+                connect_args={"check_same_thread": False}, poolclass=NullPool,
+            )
+            self.SessionLocal = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    # --- Refresh ---
+
+    def refresh(self, source_path: Optional[str] = None) -> datetime:
+        """Copies the primary into a new replica file and swaps it in. Returns the snapshot time."""
+        source_path = source_path or primary_database_path()
+        if not self.enabled or source_path is None:
+            raise RuntimeError("The analytics replica needs ANALYTICS_REPLICA_PATH and a SQLite primary database.")
+        with self._refresh_lock:
+            started = time.perf_counter()
+            staging = self.path.with_name(f".{self.path.name}.{os.getpid()}.refresh")
+            staging.unlink(missing_ok=True)
+            source = sqlite3.connect(source_path)
+            target = sqlite3.connect(staging)
+            try:
+                snapshot_at = datetime.now(timezone.utc)
+                _stepped_backup(source, target)
+                target.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                target.execute(f"INSERT OR REPLACE INTO {META_TABLE} VALUES ('snapshot_at', ?)", (snapshot_at.isoformat(),))
+                target.execute("ANALYZE")
+                target.commit()
+            except Exception:
+                target.close()
+                staging.unlink(missing_ok=True)
+                raise
+            finally:
+                source.close()
+            target.close()
+            os.replace(staging, self.path)
+            elapsed = time.perf_counter() - started
+            ANALYTICS_REPLICA_REFRESH_DURATION.observe(elapsed)
+            logger.info("Analytics replica refreshed in %.2fs.", elapsed)
+            return snapshot_at
+
+    def refresh_if_due(self) -> bool:
+        """Refreshes when the replica is older than the refresh interval and no other worker is at it."""
+        snapshot_at = self.snapshot_time()
+        if snapshot_at is not None and self._age(snapshot_at) < self.refresh_seconds:
+            return False
+        if not coordination_store.try_acquire(REFRESH_LOCK_NAME, ttl_seconds=max(60.0, 4 * self.refresh_seconds)):
+            return False
+        try:
+            self.refresh()
+        finally:
+            coordination_store.release(REFRESH_LOCK_NAME)
+        return True
+
+    def start(self) -> None:
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analytics-replica", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh_if_due()
+            except Exception as e:
+                logger.warning("Analytics replica refresh failed: %s", e)
+            snapshot_at = self.snapshot_time()
+            if snapshot_at is not None:
+                ANALYTICS_REPLICA_AGE_SECONDS.set(self._age(snapshot_at))
+            self._stop.wait(min(self.refresh_seconds, 5.0))
+
+    # --- Reads ---
+
+    def _age(self, snapshot_at: datetime) -> float:
+        return (datetime.now(timezone.utc) - snapshot_at).total_seconds()
+
+    def snapshot_time(self) -> Optional[datetime]:
+        """When the current replica file was copied from the primary; None without a replica."""
+        if not self.enabled:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if self._snapshot is not None and self._snapshot[0] == identity:
+                return self._snapshot[1]
+        # Read once per replica file, outside SQLAlchemy so it never counts against query budgets
+        try:
+            conn = sqlite3.connect(f"file:{self.path.resolve()}?mode=ro", uri=True)
+            try:
+                row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = 'snapshot_at'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        snapshot_at = datetime.fromisoformat(row[0]) if row else None
+        with self._lock:
+            self._snapshot = (identity, snapshot_at)
+        return snapshot_at
+
+    def fresh_snapshot_time(self) -> Optional[datetime]:
+        """The replica's snapshot time if it is within the staleness bound, else None."""
+        snapshot_at = self.snapshot_time()
+        if snapshot_at is None or self._age(snapshot_at) > self.max_staleness_seconds:
+            return None
+        return snapshot_at
+
+
+analytics_replica = AnalyticsReplica()
+
+
+def get_analytics_db(request: Request, db: Session = Depends(get_db)) -> Iterator[Session]:
+    """
+    Session for reporting reads: the replica while it is fresh enough, otherwise the request's
+    primary session (the one get_current_user uses; a second pooled session per request can
+    exhaust the pool under load). Records the data's as-of time (and the replica snapshot,
+    for cache keys) on request.state.
+    """
+    snapshot_at = analytics_replica.fresh_snapshot_time()
+    if snapshot_at is None:
+        request.state.data_as_of = datetime.now(timezone.utc)
+        ANALYTICS_READS.inc(source="primary")
+        yield db
+        return
+    request.state.data_as_of = snapshot_at
+    request.state.replica_snapshot = snapshot_at.isoformat()
+    ANALYTICS_READS.inc(source="replica")
+    replica_db = analytics_replica.SessionLocal()
+    try:
+        yield replica_db
+    finally:
+        replica_db.close()
+
+
+class DataFreshnessMiddleware:
+    """ASGI middleware adding X-Data-As-Of to responses of requests that read through get_analytics_db."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                data_as_of = scope.get("state", {}).get("data_as_of")
+                if data_as_of is not None:
+                    value = data_as_of.isoformat().replace("+00:00", "Z").encode()
+                    message = {**message, "headers": list(message["headers"]) + [(FRESHNESS_HEADER.lower().encode(), value)]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict
-from datetime import date
-from typing import Optional, List, Dict # Added List, Dict
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import date, datetime
+from typing import Any, Optional, List, Dict # Added List, Dict
 
 # --- Student Schemas ---
 class StudentBase(BaseModel):
@@ -32,16 +32,231 @@ class PredictionBase(BaseModel):
     predicted_score: float  # Probability of passing
     category: str           # "Pass" or "Fail"
     model_type: str
+    risk_band: Optional[str] = None  # "High", "Medium" or "Low"
 
     model_config = ConfigDict(protected_namespaces=())
 
 class PredictionCreate(PredictionBase):
     pass
 
+class FeatureContribution(BaseModel):
+    feature: str
+    value: float            # Engineered (unscaled) input value
+    contribution: float     # Signed effect on the pass probability (or log-odds for linear models)
+
+class PredictionExplanationOut(BaseModel):
+    space: str              # "probability" or "log_odds"
+    base_value: float       # Model output before any feature is considered
+    contributions: List[FeatureContribution]
+
 class PredictionOut(PredictionBase):
     prediction_id: int
+    explanation: Optional[PredictionExplanationOut] = None  # Only when requested
     model_config = ConfigDict(from_attributes=True, protected_namespaces=())
 
+class RetentionReport(BaseModel):
+    cutoff_date: date                 # Rows dated before this were eligible for compaction
+    granularity: str                  # "day" or "week"
+    compacted_count: int              # Rows removed by per-bucket compaction
+    deduplicated_count: int           # Rows removed for repeating the previous prediction
+    archived_count: int
+    archive_target: Optional[str] = None  # "table", or the file rows were appended to
+    affected_students: int
+
+# --- Risk Band Schemas ---
+class RiskBandConfigIn(BaseModel):
+    pass_threshold: float = Field(..., ge=0, le=1)     # Pass probability at or above this is "Pass"
+    high_risk_below: float = Field(..., ge=0, le=1)    # Pass probability below this is "High" risk
+    medium_risk_below: float = Field(..., ge=0, le=1)  # ...below this (and not High) is "Medium"; else "Low"
+
+class RiskBandConfigOut(RiskBandConfigIn):
+    program: str                                       # "*" is the default for unconfigured programs
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Exam Outcome Schemas ---
+class ExamOutcomeIn(BaseModel):
+    exam_date: date
+    passed: bool
+    exam_score: Optional[float] = None
+
+class ExamOutcomeOut(ExamOutcomeIn):
+    outcome_id: int
+    student_id: int
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Batch Prediction Schemas ---
+class BatchPredictionItem(BaseModel):
+    # Either a student_id (features are read from the database) or inline raw features
+    student_id: Optional[int] = Field(None, ge=1)
+    reference: Optional[str] = None     # Caller's own id for inline records, echoed back
+    program: Optional[str] = None       # Selects the thresholds for inline records
+    test_1_score: Optional[float] = None
+    test_2_score: Optional[float] = None
+    test_3_score: Optional[float] = None
+    learn_guide_completed: Optional[bool] = None
+
+class BatchPredictionRequest(BaseModel):
+    items: List[BatchPredictionItem]
+    persist: bool = False               # Save predictions for items that reference a student
+    explain: bool = False               # Include (and, with persist, store) per-feature contributions
+
+class BatchPredictionResult(BaseModel):
+    index: int                          # Position in the request's items
+    student_id: Optional[int] = None
+    reference: Optional[str] = None
+    predicted_score: Optional[float] = None
+    category: Optional[str] = None
+    risk_band: Optional[str] = None
+    prediction_id: Optional[int] = None # Set when the prediction was persisted
+    explanation: Optional[PredictionExplanationOut] = None
+    error: Optional[str] = None
+
+class BatchPredictionResponse(BaseModel):
+    model_type: str
+    date: date
+    succeeded: int
+    failed: int
+    results: List[BatchPredictionResult]
+    model_config = ConfigDict(protected_namespaces=())
+
+# --- Scenario (what-if) Schemas ---
+class ScenarioRequest(BaseModel):
+    # Either an explicit list of hypothetical test_3 scores or a min/max/step range.
+    # Unset range bounds default to the test_3 range the model was trained on.
+    test_3_scores: Optional[List[float]] = None
+    test_3_min: Optional[float] = None
+    test_3_max: Optional[float] = None
+    test_3_step: Optional[float] = Field(None, gt=0)
+    # Learn-guide statuses to simulate; defaults to each student's current status
+    learn_guide_completed: Optional[List[bool]] = None
+    target_probability: float = Field(0.7, gt=0, le=1)
+
+class ScenarioPoint(BaseModel):
+    test_3_score: float
+    predicted_score: float  # Probability of passing
+    category: str
+
+class ScenarioCurve(BaseModel):
+    learn_guide_completed: bool
+    points: List[ScenarioPoint]
+    min_test_3_score_for_target: Optional[float] = None  # None if no simulated score reaches the target
+
+class StudentScenarioResult(BaseModel):
+    student_id: int
+    current_test_3_score: Optional[float] = None
+    curves: List[ScenarioCurve]
+
+class ScenarioResponse(BaseModel):
+    target_probability: float
+    model_type: str
+    results: List[StudentScenarioResult]
+
+    model_config = ConfigDict(protected_namespaces=())
+
+# --- Background Job Schemas ---
+class PredictionJobOut(BaseModel):
+    job_id: str
+    program: str
+    section: str
+    status: str                       # queued, running, completed, failed or cancelled
+    total_students: Optional[int] = None
+    processed_students: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    deduplicated: bool = False        # True if an identical in-flight job was returned
+    predictions: Optional[List[PredictionOut]] = None
+
+class ModelVersionOut(BaseModel):
+    loaded: bool
+    model_version: Optional[str] = None   # Digest of the loaded artifacts
+    model_config = ConfigDict(protected_namespaces=())
+
+class TrendPoint(BaseModel):
+    bucket_start: date                    # First day of the day/week (Monday)/month bucket
+    program: Optional[str] = None         # None when the series spans every program
+    section: Optional[str] = None
+    predictions: int
+    mean_probability: Optional[float] = None
+    pass_count: int
+    fail_count: int
+    # Flip events, not students: predictions whose category differs from the student's previous
+    # one, so a student flipping back and forth in one bucket counts once per flip
+    flips_to_pass: int
+    flips_to_fail: int
+    flips: int
+
+class TrendResponse(BaseModel):
+    granularity: str                      # "day", "week" or "month"
+    points: List[TrendPoint]
+
+class ChallengerSummary(BaseModel):
+    name: str                                          # Bundle directory name
+    model_version: str
+    batches_scored: int
+    rows_scored: int
+    agreement_rate: Optional[float] = None             # Share of rows with the champion's category
+    mean_abs_probability_diff: Optional[float] = None
+    mean_batch_latency_ms: Optional[float] = None      # Shadow scoring time, off the request path
+    max_batch_latency_ms: Optional[float] = None
+    microseconds_per_row: Optional[float] = None
+    model_config = ConfigDict(protected_namespaces=())
+
+class ChallengerReport(BaseModel):
+    champion_version: Optional[str] = None
+    worker_id: str                                     # Statistics are per worker
+    pending_batches: int
+    dropped_batches: int
+    challengers: List[ChallengerSummary]
+
+class DriftHistogramBin(BaseModel):
+    upper_edge: Optional[float] = None  # None for the open-ended last bin
+    reference_share: float
+    current_share: float
+
+class ColumnDrift(BaseModel):
+    column: str                     # Model feature, raw input or "predicted_probability"
+    status: str                     # "stable", "warning", "drift" or "insufficient_data"
+    psi: Optional[float] = None
+    ks: Optional[float] = None      # Max CDF distance at the bin edges
+    rows: int
+    null_rate: Optional[float] = None
+    reference_null_rate: Optional[float] = None
+    mean: Optional[float] = None
+    reference_mean: Optional[float] = None
+    std: Optional[float] = None
+    reference_std: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    histogram: List[DriftHistogramBin]
+
+class DriftReport(BaseModel):
+    model_version: Optional[str] = None
+    worker_id: str                  # Sketches are per process
+    reference_source: Optional[str] = None  # "training", "baseline", or None while the baseline fills
+    baseline_rows_collected: Optional[int] = None
+    window_started_at: datetime
+    columns: List[ColumnDrift]
+    drifted_columns: List[str]
+    model_config = ConfigDict(protected_namespaces=())
+
+class ProfileSummary(BaseModel):
+    profile_id: str
+    mode: str                       # "sample" or "cprofile"
+    method: str
+    path: str
+    created_at: datetime
+    status: Optional[int] = None
+    duration_ms: Optional[float] = None
+    sample_count: int = 0
+    model_config = ConfigDict(from_attributes=True)
+
+class ProfilingStatus(BaseModel):
+    header_enabled: bool            # X-Profile is honoured (PROFILING_ENABLED=1)
+    armed: Dict[str, Dict[str, Any]]  # path prefix -> {"mode", "remaining"}
+    profiles: List[ProfileSummary]
+
 class UserBase(BaseModel):
     email: str
 
@@ -90,6 +305,25 @@ class DashboardStudentSummary(BaseModel):
     avg_test_score: Optional[float] = None
     model_config = ConfigDict(from_attributes=True) # Added for ORM mode
 
+class StudentRiskSummary(DashboardStudentSummary):
+    predicted_score: float  # Latest probability of passing
+    category: str
+    risk_band: Optional[str] = None
+    prediction_date: date
+    rank: int               # 1 = most at risk
+    percentile: float       # Position within the ranked population, in percent
+
+class StudentRiskRankingResponse(BaseModel):
+    total_ranked: int
+    students: List[StudentRiskSummary]
+
+class StudentSearchResponse(BaseModel):
+    query: str
+    limit: int
+    offset: int
+    has_more: bool          # Another page exists at offset + limit
+    results: List[DashboardStudentSummary]  # Best match first
+
 class DashboardStatsData(BaseModel):
     total_students: int
     total_programs: int
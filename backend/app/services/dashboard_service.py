@@ -0,0 +1,228 @@
+"""
+Dashboard statistics from the trigger-maintained aggregates, and live updates over SSE.
+
+Every student write adjusts one dashboard_class_aggregates row and every latest-prediction
+write one dashboard_risk_band_counts row (app.crud.dashboard), so building the dashboard
+sums a few dozen rows plus two indexed top-5 lookups, whatever the number of students.
+
+/dashboard-stats/events subscribers share one DashboardBroadcaster per worker. While any
+are connected it polls the data versions of the tables the dashboard reads (cheap, and
+they move on commits in any worker). When they move, it rebuilds the dashboard once,
+diffs it against the previous one, and queues only the changed fields to every
+subscriber. A subscriber that falls DASHBOARD_EVENTS_QUEUE_SIZE events behind gets a
+fresh snapshot instead of the missed deltas.
+
+Delta format: top-level fields that changed, with their new value. The per-program,
+per-section and score distribution lists only carry the items that changed, matched by
+their "program", "section" or "range" key; an item that disappeared is sent as
+{"program": ..., "removed": true}. recent_students and low_performing_students are sent
+whole when they change.
+"""
+from sqlalchemy.orm import Session
+from app.cache import get_versions
+from app.crud import dashboard as crud_dashboard
+from app.database import SessionLocal
+from app.metrics import DASHBOARD_STREAM_EVENTS, DASHBOARD_STREAM_SUBSCRIBERS
+from app.schema import (
+    DashboardStatsData, LearnGuideStatusByProgram, ProgramAverageScore,
+    ProgramStudentCount, ScoreDistributionBucket, SectionStudentCount,
+)
+from app.services import risk_band_service
+
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables whose commits can change the dashboard; the same ones key its response cache. Trigger
+# writes to the aggregate tables ride on commits to students and student_latest_predictions;
+# a rebuild bumps the aggregate tables themselves.
+DASHBOARD_TABLES = (
+    "students", "student_latest_predictions", "risk_band_configs",
+    "dashboard_class_aggregates", "dashboard_risk_band_counts",
+)
+DASHBOARD_EVENTS_POLL_SECONDS = 0.5
+# Comment lines sent on idle streams so proxies do not close them
+DASHBOARD_EVENTS_KEEPALIVE_SECONDS = 15.0
+DASHBOARD_EVENTS_QUEUE_SIZE = 32
+# Open streams per worker
+DASHBOARD_STREAM_MAX_SUBSCRIBERS = 1000
+
+# List fields diffed item by item, and the field identifying an item
+_KEYED_LISTS = {
+    "students_per_program": "program",
+    "students_per_section": "section",
+    "average_score_per_program": "program",
+    "overall_score_distribution": "range",
+    "learn_guide_status_per_program": "program",
+}
+
+
+class DashboardStreamError(Exception):
+    """Raised when a worker already serves DASHBOARD_STREAM_MAX_SUBSCRIBERS dashboard streams."""
+    pass
+
+
+def build_dashboard_data(db: Session) -> DashboardStatsData:
+    classes = crud_dashboard.get_class_aggregates(db)
+    band_counts = crud_dashboard.get_risk_band_counts(db)
+
+    programs: Dict[str, Dict[str, float]] = {}
+    sections: Dict[str, int] = {}
+    totals = dict.fromkeys(("student_count", "score_count", "score_sum", "learn_guide_completed"), 0)
+    buckets = dict.fromkeys((column for _, column, _, _ in crud_dashboard.SCORE_BUCKETS), 0)
+    for row in classes:
+        for name in totals:
+            totals[name] += getattr(row, name)
+        for column in buckets:
+            buckets[column] += getattr(row, column)
+        # Students without a program or section are left out of the per-class lists; a "" one is a class like any other
+        if not row.program_is_null:
+            program = programs.setdefault(row.program, dict.fromkeys(
+                ("student_count", "score_count", "score_sum", "learn_guide_completed", "learn_guide_not_completed"), 0))
+            for name in program:
+                program[name] += getattr(row, name)
+        if not row.section_is_null:
+            sections[row.section] = sections.get(row.section, 0) + row.student_count
+
+    total_students = totals["student_count"]
+    return DashboardStatsData(
+        total_students=total_students,
+        total_programs=len(programs),
+        total_sections=len(sections),
+        overall_average_score=crud_dashboard.safe_round(totals["score_sum"] / totals["score_count"]) if totals["score_count"] else None,
+        learn_guide_completion_rate=crud_dashboard.safe_round(totals["learn_guide_completed"] / total_students * 100) if total_students else 0.0,
+        students_at_risk_count=sum(band_counts.get(band, 0) for band in risk_band_service.AT_RISK_BANDS),
+        students_per_program=[ProgramStudentCount(program=name, count=p["student_count"]) for name, p in sorted(programs.items())],
+        students_per_section=[SectionStudentCount(section=name, count=count) for name, count in sorted(sections.items())],
+        average_score_per_program=[
+            ProgramAverageScore(program=name, average_score=crud_dashboard.safe_round(p["score_sum"] / p["score_count"]))
+            for name, p in sorted(programs.items()) if p["score_count"]
+        ],
+        overall_score_distribution=[
+            ScoreDistributionBucket(range=label, count=buckets[column]) for label, column, _, _ in crud_dashboard.SCORE_BUCKETS
+        ],
+        learn_guide_status_per_program=[
+            LearnGuideStatusByProgram(program=name, completed=p["learn_guide_completed"], not_completed=p["learn_guide_not_completed"])
+            for name, p in sorted(programs.items())
+        ],
+        recent_students=crud_dashboard.get_recent_students(db), # Default limit 5
+        low_performing_students=crud_dashboard.get_low_performing_students(db, risk_band_service.AT_RISK_BANDS), # Default limit 5
+    )
+
+
+def dashboard_delta(previous: dict, current: dict) -> dict:
+    """The fields of `current` (a dumped DashboardStatsData) that differ from `previous`; see the module docstring."""
+    delta = {}
+    for name, value in current.items():
+        old = previous.get(name)
+        if value == old:
+            continue
+        key = _KEYED_LISTS.get(name)
+        if key is None or old is None:
+            delta[name] = value
+            continue
+        old_items = {item[key]: item for item in old}
+        changed: List[dict] = [item for item in value if old_items.get(item[key]) != item]
+        new_keys = {item[key] for item in value}
+        changed += [{key: item_key, "removed": True} for item_key in old_items if item_key not in new_keys]
+        delta[name] = changed
+    return delta
+
+
+class DashboardBroadcaster:
+    """Computes dashboard deltas once per change and fans them out to this worker's streams."""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 poll_seconds: float = DASHBOARD_EVENTS_POLL_SECONDS,
+                 max_subscribers: int = DASHBOARD_STREAM_MAX_SUBSCRIBERS):
+        self.session_factory = session_factory
+        self.poll_seconds = poll_seconds
+        self.max_subscribers = max_subscribers
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._state: Optional[dict] = None
+        self._versions: Optional[Tuple[int, ...]] = None
+        self._sequence = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _read(self) -> Tuple[Tuple[int, ...], dict]:
+        # Versions first: a commit landing during the read moves them again, so it is never missed
+        versions = get_versions(DASHBOARD_TABLES)
+        db = self.session_factory()
+        try:
+            return versions, build_dashboard_data(db).model_dump(mode="json")
+        finally:
+            db.close()
+
+    async def _update(self) -> Optional[dict]:
+        """Rebuilds the dashboard if its tables changed; returns the delta, or None if nothing changed."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._state is not None and await asyncio.to_thread(get_versions, DASHBOARD_TABLES) == self._versions:
+                return None
+            versions, state = await asyncio.to_thread(self._read)
+            previous, self._state, self._versions = self._state, state, versions
+            if previous is None:
+                self._sequence += 1
+                return None
+            delta = dashboard_delta(previous, state)
+            if delta:
+                self._sequence += 1
+            return delta or None
+
+    async def _poll(self) -> None:
+        delta = await self._update()
+        if delta is None:
+            return
+        DASHBOARD_STREAM_EVENTS.inc(event="delta")
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(("delta", self._sequence, delta))
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self._sequence, self._state))
+                DASHBOARD_STREAM_EVENTS.inc(event="snapshot")
+
+    async def _run(self) -> None:
+        while self._subscribers:
+            try:
+                await self._poll()
+            except Exception as e:
+                logger.warning("Dashboard stream update failed: %s", e)
+            await asyncio.sleep(self.poll_seconds)
+        self._task = None
+
+    async def subscribe(self) -> Tuple[asyncio.Queue, int, dict]:
+        """Registers a stream; returns its event queue and the current (sequence, snapshot)."""
+        if len(self._subscribers) >= self.max_subscribers:
+            raise DashboardStreamError(f"This worker already serves {self.max_subscribers} dashboard streams.")
+        # Brings the state up to date, sending any pending delta to the existing streams first
+        await self._poll()
+        # Other streams may have subscribed during the await
+        if len(self._subscribers) >= self.max_subscribers:
+            raise DashboardStreamError(f"This worker already serves {self.max_subscribers} dashboard streams.")
+        queue: asyncio.Queue = asyncio.Queue(maxsize=DASHBOARD_EVENTS_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        DASHBOARD_STREAM_SUBSCRIBERS.set(len(self._subscribers))
+        DASHBOARD_STREAM_EVENTS.inc(event="snapshot")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return queue, self._sequence, self._state
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        DASHBOARD_STREAM_SUBSCRIBERS.set(len(self._subscribers))
+
+    def stop(self) -> None:
+        self._subscribers.clear()
+        DASHBOARD_STREAM_SUBSCRIBERS.set(0)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+dashboard_broadcaster = DashboardBroadcaster()
@@ -0,0 +1,305 @@
+"""
+Point-in-time snapshots of students, student_feature_sets and predictions for offline analysis.
+
+Every table is read inside one SQLite read transaction, so the three tables agree with each
+other, and streamed in chunks straight into the writer, so memory holds a few chunks rather
+than a table.
+Snapshots are written under <output dir>/<UTC timestamp>/ with a manifest.json, and the
+directory appears only once complete.
+
+Formats (both need the optional `pyarrow` package):
+- "parquet": hive-partitioned datasets, students and feature sets by program=, predictions by
+  program= and month= (or day=). Partition columns live in the paths.
+- "arrow": one Arrow IPC file per table, read back memory-mapped without copying.
+
+Incremental snapshots re-export students and feature sets in full (rows are updated in
+place and carry no change tracking) and only the predictions inserted since the previous
+snapshot, by prediction_id watermark (prediction ids are AUTOINCREMENT, never reused).
+open_snapshot_table() follows the chain back to the last full snapshot to return the whole
+predictions history.
+
+An increment cannot express deletes. Each manifest records how many predictions its chain
+holds; when fewer remain at or below the watermark (retention compaction, deleted students),
+the incremental export is refused and a full snapshot is needed to start a new chain.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import shutil
+import uuid
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, func, select
+from sqlalchemy.engine import Connection, Engine
+
+from app.models import Prediction, Student, StudentFeatureSet
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Default location for snapshots, relative to the backend working directory
+EXPORT_DIR = Path("./exports")
+# Rows fetched and written per chunk
+EXPORT_CHUNK_SIZE = 50_000
+MANIFEST_FILENAME = "manifest.json"
+VALID_FORMATS = ("parquet", "arrow")
+# Size of the predictions' date partitions in Parquet snapshots
+VALID_DATE_PARTITIONS = ("day", "month")
+EXPORT_DATE_PARTITION = "month"
+EXPORT_TABLES = ("students", "student_feature_sets", "predictions")
+
+
+class ExportError(Exception):
+    """Raised when a snapshot cannot be written or read (missing pyarrow, bad settings, no usable base snapshot)."""
+    pass
+
+
+def _require_pyarrow() -> None:
+    if pyarrow is None:
+        raise ExportError("Snapshot export needs the optional pyarrow package (pip install pyarrow).")
+
+
+def _arrow_type(column):
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, Float):
+        return pyarrow.float64()
+    if isinstance(column.type, DateTime):
+        return pyarrow.timestamp("us")
+    if isinstance(column.type, Date):
+        return pyarrow.date32()
+    return pyarrow.string()  # String columns and the month/day partition value
+
+
+def _period_expression(date_partition: str):
+    # Partition value per prediction: "2024-05" for months, "2024-05-17" for days
+    return func.strftime("%Y-%m" if date_partition == "month" else "%Y-%m-%d", Prediction.date)
+
+
+def _table_queries(after_prediction_id: int, up_to_prediction_id: int, date_partition: str) -> Dict[str, Any]:
+    """One SELECT per exported table; `program` (and `month`/`day`) are the Parquet partition columns."""
+    student_columns = [c for c in Student.__table__.columns]
+    feature_columns = [c for c in StudentFeatureSet.__table__.columns]
+    prediction_columns = [c for c in Prediction.__table__.columns]
+    return {
+        "students": select(*student_columns).order_by(Student.student_id),
+        "student_feature_sets": (
+            select(*feature_columns, Student.program)
+            .join(Student, Student.student_id == StudentFeatureSet.student_id)
+            .order_by(StudentFeatureSet.student_id)
+        ),
+        # Predictions carry the student's program at export time
+        "predictions": (
+            select(*prediction_columns, Student.program, _period_expression(date_partition).label(date_partition))
+            .join(Student, Student.student_id == Prediction.student_id)
+            .where(Prediction.prediction_id > after_prediction_id, Prediction.prediction_id <= up_to_prediction_id)
+            .order_by(Prediction.prediction_id)
+        ),
+    }
+
+
+def _schema_for(query):
+    return pyarrow.schema([pyarrow.field(column.name, _arrow_type(column)) for column in query.selected_columns])
+
+
+def _arrow_array(values, arrow_type):
+    # Raw SQLite values: dates and timestamps arrive as ISO strings and booleans as 0/1,
+    # so they are converted column-wise by Arrow rather than row by row in Python
+    if pyarrow.types.is_date(arrow_type) or pyarrow.types.is_timestamp(arrow_type):
+        return pyarrow.array(values, type=pyarrow.string()).cast(arrow_type)
+    if pyarrow.types.is_boolean(arrow_type):
+        return pyarrow.array(values, type=pyarrow.int8()).cast(arrow_type)
+    return pyarrow.array(values, type=arrow_type)
+
+
+def _record_batches(conn: Connection, query, schema, chunk_size: int, counter: Dict[str, int]) -> Iterator[Any]:
+    # Executed as driver SQL: SQLAlchemy's per-row type processing would cost more than the Arrow conversion
+    compiled = query.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    result = conn.execution_options(stream_results=True).exec_driver_sql(str(compiled), params)
+    for rows in result.partitions(chunk_size):
+        counter["rows"] += len(rows)
+        columns = list(zip(*rows))
+        yield pyarrow.RecordBatch.from_arrays(
+            [_arrow_array(values, field.type) for values, field in zip(columns, schema)], schema=schema,
+        )
+
+
+def _write_parquet(batches: Iterator[Any], schema, directory: Path, partition_columns: List[str]) -> List[str]:
+    files: List[str] = []
+    pyarrow.dataset.write_dataset(
+        pyarrow.RecordBatchReader.from_batches(schema, batches),
+        directory,
+        format="parquet",
+        partitioning=pyarrow.dataset.partitioning(
+            pyarrow.schema([schema.field(name) for name in partition_columns]), flavor="hive",
+        ),
+        basename_template="part-{i}.parquet",
+        max_partitions=100_000,
+        file_visitor=lambda written: files.append(written.path),
+    )
+    return sorted(str(Path(path).relative_to(directory.parent)) for path in files)
+
+
+def _write_arrow(batches: Iterator[Any], schema, path: Path) -> List[str]:
+    # The IPC file format (not the stream format) is what can be memory-mapped
+    with pyarrow.OSFile(str(path), "wb") as sink, pyarrow.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    return [path.name]
+
+
+def list_snapshots(output_dir: Path = EXPORT_DIR) -> List[Path]:
+    """Completed snapshot directories, oldest first."""
+    if not output_dir.is_dir():
+        return []
+    return sorted(p for p in output_dir.iterdir() if not p.name.startswith(".") and (p / MANIFEST_FILENAME).is_file())
+
+
+def read_manifest(snapshot_dir: Path) -> Dict[str, Any]:
+    return json.loads((snapshot_dir / MANIFEST_FILENAME).read_text())
+
+
+def export_snapshot(
+    engine: Engine,
+    output_dir: Path = EXPORT_DIR,
+    fmt: str = "parquet",
+    incremental: bool = False,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    date_partition: str = EXPORT_DATE_PARTITION,
+) -> Path:
+    """
+    Writes one snapshot and returns its directory. With `incremental`, only predictions newer
+    than the latest snapshot's watermark are written, in that snapshot's format and date
+    partitioning.
+    """
+    _require_pyarrow()
+    if fmt not in VALID_FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'; expected one of {', '.join(VALID_FORMATS)}.")
+    if date_partition not in VALID_DATE_PARTITIONS:
+        raise ExportError(f"Unknown date partition '{date_partition}'; expected one of {', '.join(VALID_DATE_PARTITIONS)}.")
+    if chunk_size < 1:
+        raise ExportError("chunk_size must be at least 1.")
+
+    base_snapshot: Optional[str] = None
+    after_prediction_id = 0
+    base_chain_rows: Optional[int] = None
+    if incremental:
+        snapshots = list_snapshots(output_dir)
+        if not snapshots:
+            raise ExportError(f"No previous snapshot in {output_dir} to export incrementally from.")
+        base = read_manifest(snapshots[-1])
+        if base["format"] != fmt or base.get("date_partition", date_partition) != date_partition:
+            raise ExportError(
+                f"Snapshot {base['snapshot_id']} is {base['format']} partitioned by {base.get('date_partition')}; "
+                "an incremental snapshot must use the same format and partitioning."
+            )
+        base_snapshot = base["snapshot_id"]
+        after_prediction_id = base["tables"]["predictions"]["up_to_prediction_id"]
+        base_chain_rows = base["tables"]["predictions"].get("chain_rows")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    staging = output_dir / f".staging-{uuid.uuid4().hex[:8]}"
+    staging.mkdir()
+    try:
+        with engine.connect() as conn:
+            # pysqlite only opens transactions before writes; BEGIN makes every read below see the same snapshot
+            conn.exec_driver_sql("BEGIN")
+            started_at = datetime.utcnow()
+            up_to_prediction_id = conn.execute(select(func.coalesce(func.max(Prediction.prediction_id), 0))).scalar_one()
+            if base_chain_rows is not None:
+                remaining = conn.execute(
+                    select(func.count()).select_from(Prediction).where(Prediction.prediction_id <= after_prediction_id)
+                ).scalar_one()
+                if remaining < base_chain_rows:
+                    raise ExportError(
+                        f"{base_chain_rows - remaining} predictions in snapshot {base_snapshot} or its base snapshots "
+                        "have since been deleted or compacted; take a full snapshot."
+                    )
+            tables: Dict[str, Dict[str, Any]] = {}
+            for name, query in _table_queries(after_prediction_id, up_to_prediction_id, date_partition).items():
+                schema = _schema_for(query)
+                counter = {"rows": 0}
+                batches = _record_batches(conn, query, schema, chunk_size, counter)
+                if fmt == "parquet":
+                    partition_columns = ["program", date_partition] if name == "predictions" else ["program"]
+                    files = _write_parquet(batches, schema, staging / name, partition_columns)
+                else:
+                    files = _write_arrow(batches, schema, staging / f"{name}.arrow")
+                tables[name] = {
+                    "mode": "incremental" if name == "predictions" and incremental else "full",
+                    "rows": counter["rows"],
+                    "files": files,
+                    "schema": {field.name: str(field.type) for field in schema},
+                }
+            conn.rollback()  # Read-only; ends the read transaction
+        tables["predictions"].update(
+            after_prediction_id=after_prediction_id,
+            up_to_prediction_id=up_to_prediction_id,
+            # Predictions open_snapshot_table() returns for this snapshot, increments included
+            chain_rows=(base_chain_rows or 0) + tables["predictions"]["rows"] if incremental else tables["predictions"]["rows"],
+        )
+
+        snapshot_id = f"{started_at:%Y%m%dT%H%M%S%fZ}"
+        manifest = {
+            "snapshot_id": snapshot_id,
+            "created_at": started_at.isoformat() + "Z",
+            "format": fmt,
+            "date_partition": date_partition,
+            "base_snapshot": base_snapshot,
+            "tables": tables,
+        }
+        (staging / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2))
+        snapshot_dir = output_dir / snapshot_id
+        staging.rename(snapshot_dir)
+        return snapshot_dir
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _read_one(snapshot_dir: Path, manifest: Dict[str, Any], table: str, memory_map: bool):
+    if manifest["format"] == "arrow":
+        path = snapshot_dir / f"{table}.arrow"
+        source = pyarrow.memory_map(str(path), "r") if memory_map else pyarrow.OSFile(str(path), "rb")
+        # Batches reference the mapped pages directly; nothing is copied until a column is touched
+        return pyarrow.ipc.open_file(source).read_all()
+    partition_columns = ["program", manifest["date_partition"]] if table == "predictions" else ["program"]
+    schema = _schema_for(_table_queries(0, 0, manifest["date_partition"])[table])
+    if not manifest["tables"][table]["files"]:
+        return schema.empty_table()
+    # An explicit schema keeps partition values such as "2024-05-17" strings, as they were exported
+    partitioning = pyarrow.dataset.partitioning(pyarrow.schema([schema.field(name) for name in partition_columns]), flavor="hive")
+    return pyarrow.parquet.read_table(str(snapshot_dir / table), schema=schema, partitioning=partitioning, memory_map=memory_map)
+
+
+def open_snapshot_table(snapshot_dir: Path, table: str, memory_map: bool = True, follow_increments: bool = True):
+    """
+    Reads one table of a snapshot as a pyarrow.Table, memory-mapped by default. For the
+    predictions of an incremental snapshot, the increments back to the last full snapshot are
+    concatenated, oldest first, unless `follow_increments` is False.
+    """
+    _require_pyarrow()
+    if table not in EXPORT_TABLES:
+        raise ExportError(f"Unknown table '{table}'; expected one of {', '.join(EXPORT_TABLES)}.")
+    snapshot_dir = Path(snapshot_dir)
+    parts = []
+    manifest = read_manifest(snapshot_dir)
+    while True:
+        parts.append(_read_one(snapshot_dir, manifest, table, memory_map))
+        if not follow_increments or manifest["tables"][table]["mode"] == "full":
+            break
+        snapshot_dir = snapshot_dir.parent / manifest["base_snapshot"]
+        if not (snapshot_dir / MANIFEST_FILENAME).is_file():
+            raise ExportError(f"Base snapshot {manifest['base_snapshot']} of an incremental snapshot is missing.")
+        manifest = read_manifest(snapshot_dir)
+    if len(parts) == 1:
+        return parts[0]
+    return pyarrow.concat_tables(reversed(parts))
@@ -0,0 +1,266 @@
+from app.database import SessionLocal
+from app.models import Student
+from app.schema import PredictionOut, PredictionJobOut
+from app.services import prediction_service
+from app.ml import model as ml_model_module
+from app.coordination import coordination_store, WORKER_ID
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import logging
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Worker threads shared by all class prediction jobs
+JOB_WORKER_COUNT = 4
+# Jobs of the same program allowed to run at once; the rest wait in that program's queue
+JOB_MAX_CONCURRENT_PER_PROGRAM = 1
+# Students predicted and committed per chunk
+JOB_CHUNK_SIZE = 200
+# Finished jobs are kept this long so clients can still read their results
+JOB_RETENTION_SECONDS = 3600
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+TERMINAL_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobNotFoundError(Exception):
+    """Raised when a job id is unknown, has expired or belongs to another user."""
+    pass
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class PredictionJob:
+    job_id: str
+    program: str
+    section: str
+    status: str = JOB_QUEUED
+    total_students: Optional[int] = None
+    processed_students: int = 0
+    predictions: List[PredictionOut] = field(default_factory=list)
+    error: Optional[str] = None
+    # Users who submitted the job; an identical submission joins the in-flight job
+    submitters: Set[int] = field(default_factory=set)
+    created_at: datetime = field(default_factory=_utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event)
+    # Append-only event log streamed to clients; (event name, payload)
+    events: List[Tuple[str, dict]] = field(default_factory=list)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def visible_to(self, user_id: Optional[int]) -> bool:
+        """None stands for a caller allowed to see every job (admins)."""
+        return user_id is None or user_id in self.submitters
+
+    def to_out(self, include_predictions: bool = False, deduplicated: bool = False) -> PredictionJobOut:
+        return PredictionJobOut(
+            job_id=self.job_id,
+            program=self.program,
+            section=self.section,
+            status=self.status,
+            total_students=self.total_students,
+            processed_students=self.processed_students,
+            error=self.error,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            deduplicated=deduplicated,
+            predictions=list(self.predictions) if include_predictions else None,
+        )
+
+
+class PredictionJobManager:
+    """
+    Runs class prediction jobs on a bounded thread pool.
+    Identical in-flight jobs (same program and section) are de-duplicated, and at most
+    JOB_MAX_CONCURRENT_PER_PROGRAM jobs per program run at once.
+    """
+
+    def __init__(self, worker_count: int = JOB_WORKER_COUNT, max_per_program: int = JOB_MAX_CONCURRENT_PER_PROGRAM):
+        self._executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="prediction-job")
+        self._max_per_program = max_per_program
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, PredictionJob] = {}
+        self._active_by_class: Dict[Tuple[str, str], str] = {}
+        self._running_by_program: Dict[str, int] = {}
+        self._pending_by_program: Dict[str, Deque[PredictionJob]] = {}
+
+    # --- Public API ---
+
+    def submit_class_job(self, program: str, section: str, submitted_by: int) -> Tuple[PredictionJob, bool]:
+        """
+        Returns (job, deduplicated). An identical queued/running job is returned instead of a
+        new one, and `submitted_by` may then read, cancel and follow it like its first submitter.
+        """
+        with self._lock:
+            self._prune_finished_jobs()
+            existing_id = self._active_by_class.get((program, section))
+            if existing_id is not None:
+                job = self._jobs[existing_id]
+                job.submitters.add(submitted_by)
+                return job, True
+
+            job = PredictionJob(job_id=uuid.uuid4().hex, program=program, section=section, submitters={submitted_by})
+            self._jobs[job.job_id] = job
+            self._active_by_class[(program, section)] = job.job_id
+            self._record_event(job, "status", {"status": job.status})
+
+            if self._running_by_program.get(program, 0) < self._max_per_program:
+                self._start(job)
+            else:
+                self._pending_by_program.setdefault(program, deque()).append(job)
+            return job, False
+
+    def get_job(self, job_id: str, user_id: Optional[int] = None) -> PredictionJob:
+        """
+        `user_id` restricts the lookup to jobs that user submitted (None: any job). Other users'
+        jobs are reported as not found, so job ids cannot be probed.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.visible_to(user_id):
+                raise JobNotFoundError(f"Job {job_id} not found.")
+        return job
+
+    def cancel_job(self, job_id: str, user_id: Optional[int] = None) -> PredictionJob:
+        job = self.get_job(job_id, user_id)
+        with self._lock:
+            if job.is_finished:
+                return job
+            job.cancel_requested.set()
+            pending = self._pending_by_program.get(job.program)
+            if pending and job in pending:
+                # Never started; finish it right away
+                pending.remove(job)
+                self._finish(job, JOB_CANCELLED)
+        return job
+
+    def events_since(self, job_id: str, cursor: int, user_id: Optional[int] = None) -> Tuple[List[Tuple[str, dict]], bool]:
+        """Returns the events after `cursor` and whether the job has finished."""
+        job = self.get_job(job_id, user_id)
+        with self._lock:
+            return job.events[cursor:], job.is_finished
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                if not job.is_finished:
+                    job.cancel_requested.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Internals (callers hold self._lock unless noted) ---
+
+    def _start(self, job: PredictionJob) -> None:
+        self._running_by_program[job.program] = self._running_by_program.get(job.program, 0) + 1
+        self._executor.submit(self._run, job)
+
+    def _finish(self, job: PredictionJob, status: str, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = _utcnow()
+        if self._active_by_class.get((job.program, job.section)) == job.job_id:
+            del self._active_by_class[(job.program, job.section)]
+        self._record_event(job, "status", {"status": status, "error": error})
+
+    def _record_event(self, job: PredictionJob, name: str, payload: dict) -> None:
+        job.events.append((name, payload))
+
+    def _prune_finished_jobs(self) -> None:
+        now = _utcnow()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished and (now - job.finished_at).total_seconds() > JOB_RETENTION_SECONDS
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _on_job_done(self, job: PredictionJob) -> None:
+        self._running_by_program[job.program] -= 1
+        pending = self._pending_by_program.get(job.program)
+        while pending and self._running_by_program[job.program] < self._max_per_program:
+            self._start(pending.popleft())
+
+    def _run(self, job: PredictionJob) -> None:
+        # Runs on a worker thread; takes self._lock only for state changes
+        db = SessionLocal()
+        lock_name = prediction_service.class_prediction_lock_name(job.program, job.section)
+        lock_owner = f"{WORKER_ID}:{job.job_id}"
+        try:
+            with self._lock:
+                if job.cancel_requested.is_set():
+                    self._finish(job, JOB_CANCELLED)
+                    return
+                job.status = JOB_RUNNING
+                job.started_at = _utcnow()
+                self._record_event(job, "status", {"status": JOB_RUNNING})
+
+            if not ml_model_module.loaded_model:
+                raise prediction_service.PredictionError("ML model components are not loaded. Cannot make predictions.")
+            if not coordination_store.try_acquire(lock_name, prediction_service.CLASS_PREDICTION_LEASE_SECONDS, owner=lock_owner):
+                raise prediction_service.ClassPredictionInProgressError(
+                    f"Predictions for {job.program}-{job.section} are already running in another worker.")
+
+            student_ids = [
+                row.student_id for row in db.query(Student.student_id)
+                .filter(Student.program == job.program, Student.section == job.section)
+                .order_by(Student.student_id).all()
+            ]
+            with self._lock:
+                job.total_students = len(student_ids)
+                self._record_event(job, "progress", {"processed": 0, "total": job.total_students})
+
+            for start in range(0, len(student_ids), JOB_CHUNK_SIZE):
+                if job.cancel_requested.is_set():
+                    with self._lock:
+                        self._finish(job, JOB_CANCELLED)
+                    return
+                # Renew the lease; losing it means it expired and another worker took over
+                if not coordination_store.try_acquire(lock_name, prediction_service.CLASS_PREDICTION_LEASE_SECONDS, owner=lock_owner):
+                    raise prediction_service.ClassPredictionInProgressError(
+                        f"Lost the lease for {job.program}-{job.section} to another worker.")
+                chunk_ids = student_ids[start:start + JOB_CHUNK_SIZE]
+                students = db.query(Student).filter(Student.student_id.in_(chunk_ids)).order_by(Student.student_id).all()
+                chunk_predictions = prediction_service.predict_and_save_for_students(db, students)
+                db.expunge_all()  # Keep the session from accumulating every student of a large program
+
+                with self._lock:
+                    job.predictions.extend(chunk_predictions)
+                    job.processed_students += len(chunk_ids)
+                    self._record_event(job, "predictions", {
+                        "predictions": [p.model_dump(mode="json") for p in chunk_predictions],
+                    })
+                    self._record_event(job, "progress", {"processed": job.processed_students, "total": job.total_students})
+
+            with self._lock:
+                self._finish(job, JOB_COMPLETED)
+        except Exception as e:
+            db.rollback()
+            logger.error("Prediction job %s for %s-%s failed: %s", job.job_id, job.program, job.section, e)
+            with self._lock:
+                self._finish(job, JOB_FAILED, error=str(e))
+        finally:
+            coordination_store.release(lock_name, owner=lock_owner)
+            db.close()
+            with self._lock:
+                self._on_job_done(job)
+
+
+job_manager = PredictionJobManager()
+
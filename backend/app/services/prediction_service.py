@@ -1,19 +1,80 @@
 from sqlalchemy.orm import Session
 from app.crud import users as crud_users
 from app.crud import predictions as crud_predictions
-from app.schema import PredictionCreate, PredictionOut
-from app.models import Student
+from app.schema import (
+    PredictionCreate, PredictionOut, ScenarioRequest, ScenarioPoint, ScenarioCurve,
+    StudentScenarioResult, ScenarioResponse, BatchPredictionRequest, BatchPredictionResult,
+    BatchPredictionResponse, FeatureContribution, PredictionExplanationOut
+)
+from app.models import Student, PredictionExplanation
 from app.ml import model as ml_model_module
+from app.ml.explain import ExplanationBatch, decode_vector
+from app.services import risk_band_service
+from app.coordination import coordination_store, LockNotAcquiredError, WORKER_ID
 
 from datetime import date as dt_date
 import pandas as pd
+import numpy as np
 from typing import List, Optional
+import logging
 import math
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds for one what-if request, so a single call can't build an unbounded grid
+MAX_SCENARIO_GRID_POINTS = 201
+DEFAULT_SCENARIO_GRID_POINTS = 50
+MAX_SCENARIO_ROWS = 250_000
+# Items accepted by one POST /predictions/batch call
+MAX_BATCH_PREDICTION_ITEMS = 1000
+# Lease held while a class is being predicted, so two workers never run the same class at once
+CLASS_PREDICTION_LEASE_SECONDS = 120
 
 class PredictionError(Exception):
     """Custom exception for prediction failures."""
     pass
 
+class ClassPredictionInProgressError(PredictionError):
+    """Raised when another worker is already predicting the same class."""
+    pass
+
+def class_prediction_lock_name(program: str, section: str) -> str:
+    return f"class-prediction:{program}:{section}"
+
+def _explanation_out(space: str, base_value: float, feature_names: List[str], values, contributions) -> PredictionExplanationOut:
+    return PredictionExplanationOut(
+        space=space,
+        base_value=float(base_value),
+        contributions=[
+            FeatureContribution(feature=name, value=float(value), contribution=float(contribution))
+            for name, value, contribution in zip(feature_names, values, contributions)
+        ],
+    )
+
+def explanation_from_batch(explanations: ExplanationBatch, i: int) -> PredictionExplanationOut:
+    return _explanation_out(explanations.space, explanations.base_values[i], explanations.feature_names,
+                            explanations.feature_values[i], explanations.contributions[i])
+
+def explanation_from_row(row: PredictionExplanation) -> PredictionExplanationOut:
+    return _explanation_out(row.space, row.base_value, row.feature_names.split(","),
+                            decode_vector(row.feature_values), decode_vector(row.contributions))
+
+def _predict(db: Session, df: pd.DataFrame, programs: List[Optional[str]], explain: bool,
+             student_ids: Optional[List[Optional[int]]] = None):
+    """
+    predict_pass_fail (or its explained variant) with each row's program thresholds, plus
+    the risk bands. Returns (probabilities, categories, bands, explanations or None).
+    """
+    thresholds = risk_band_service.band_thresholds_for_students(db, programs)
+    if explain:
+        probabilities, categories, explanations = ml_model_module.predict_pass_fail_explained(
+            df, thresholds.pass_threshold, student_ids=student_ids)
+    else:
+        probabilities, categories = ml_model_module.predict_pass_fail(df, thresholds.pass_threshold, student_ids=student_ids)
+        explanations = None
+    return probabilities, categories, risk_band_service.assign_bands(probabilities, thresholds), explanations
+
 def _prepare_raw_features_for_student(student: Student) -> Optional[pd.DataFrame]:
     """
     Prepares a DataFrame with raw features from a Student object.
@@ -23,7 +84,7 @@ def _prepare_raw_features_for_student(student: Student) -> Optional[pd.DataFrame
     if student.test_1_score is None and \
        student.test_2_score is None and \
        student.test_3_score is None:
-        print(f"Student {student.student_id} has all test scores as None. Prediction will use defaults for these.")
+        logger.debug("Student %s has all test scores as None. Prediction will use defaults for these.", student.student_id)
 
     features_dict = {
         "test_1_score": student.test_1_score,
@@ -34,18 +95,9 @@ def _prepare_raw_features_for_student(student: Student) -> Optional[pd.DataFrame
     return pd.DataFrame([features_dict])
 
 
-def generate_and_save_prediction_for_student(db: Session, student_id: int) -> PredictionOut:
-    # --- ADDED/MODIFIED LOGGING ---
-    print("--- In generate_and_save_prediction_for_student (prediction_service.py) ---")
-    print(f"Accessing ml_model_module.loaded_model. Type: {type(ml_model_module.loaded_model)}")
-    if ml_model_module.loaded_model: # Access via the imported module object
-        print(f"ml_model_module.loaded_model IS an object: {ml_model_module.loaded_model}")
-    else:
-        print(f"ml_model_module.loaded_model IS None or Falsy at the time of request.")
-    # --- END LOGGING ---
-
+def generate_and_save_prediction_for_student(db: Session, student_id: int, explain: bool = False) -> PredictionOut:
     if not ml_model_module.loaded_model: # USE THE MODULE to access the global from ml.model
-        print("PredictionError being raised: ML model components (via ml_model_module.loaded_model) are not loaded.")
+        logger.error("Prediction requested for student %s but ML model components are not loaded.", student_id)
         raise PredictionError("ML model components are not loaded. Cannot make predictions.")
 
     student = crud_users.get_student_by_id(db, student_id)
@@ -57,7 +109,8 @@ def generate_and_save_prediction_for_student(db: Session, student_id: int) -> Pr
         raise PredictionError(f"Could not prepare features for student {student_id}.")
 
     # Also use the module to access predict_pass_fail function
-    predicted_scores_proba, categories_numeric = ml_model_module.predict_pass_fail(df_raw_features)
+    predicted_scores_proba, categories_numeric, risk_bands, explanations = _predict(
+        db, df_raw_features, [student.program], explain, student_ids=[student_id])
 
     score_proba = float(predicted_scores_proba[0])
     category_num = int(categories_numeric[0])
@@ -71,42 +124,53 @@ def generate_and_save_prediction_for_student(db: Session, student_id: int) -> Pr
         date=dt_date.today(),
         predicted_score=score_proba,
         category=category_label,
-        model_type=model_name
+        model_type=model_name,
+        risk_band=str(risk_bands[0])
     )
-    created_prediction_orm = crud_predictions.create_prediction(db, prediction_data)
-    return PredictionOut.model_validate(created_prediction_orm)
+    created_prediction_orm = crud_predictions.create_prediction(db, prediction_data, explanation=explanations)
+    prediction_out = PredictionOut.model_validate(created_prediction_orm)
+    if explanations is not None:
+        prediction_out.explanation = explanation_from_batch(explanations, 0)
+    return prediction_out
 
 
-def generate_and_save_predictions_for_class(db: Session, program: str, section: str) -> List[PredictionOut]:
-    # --- ADDED/MODIFIED LOGGING ---
-    print("--- In generate_and_save_predictions_for_class (prediction_service.py) ---")
-    print(f"Accessing ml_model_module.loaded_model. Type: {type(ml_model_module.loaded_model)}")
-    if ml_model_module.loaded_model: # Access via the imported module object
-        print(f"ml_model_module.loaded_model IS an object: {ml_model_module.loaded_model}")
-    else:
-        print(f"ml_model_module.loaded_model IS None or Falsy at the time of request.")
-    # --- END LOGGING ---
-
+def generate_and_save_predictions_for_class(db: Session, program: str, section: str, explain: bool = False) -> List[PredictionOut]:
     if not ml_model_module.loaded_model: # USE THE MODULE to access the global from ml.model
-        print("PredictionError being raised from class prediction: ML model components (via ml_model_module.loaded_model) are not loaded.")
+        logger.error("Class prediction requested for %s-%s but ML model components are not loaded.", program, section)
         raise PredictionError("ML model components are not loaded. Cannot make predictions.")
 
-    students_in_class = db.query(Student)\
-        .filter(Student.program == program, Student.section == section).all()
+    lock_name = class_prediction_lock_name(program, section)
+    try:
+        with coordination_store.lock(lock_name, CLASS_PREDICTION_LEASE_SECONDS, owner=f"{WORKER_ID}:{uuid.uuid4().hex}"):
+            students_in_class = db.query(Student)\
+                .filter(Student.program == program, Student.section == section).all()
+
+            if not students_in_class:
+                return [] # No students in class, no predictions to make
 
-    if not students_in_class:
-        return [] # No students in class, no predictions to make
+            return predict_and_save_for_students(db, students_in_class, explain=explain)
+    except LockNotAcquiredError:
+        raise ClassPredictionInProgressError(f"Predictions for {program}-{section} are already running in another worker.")
 
+
+def predict_and_save_for_students(db: Session, students: List[Student], explain: bool = False) -> List[PredictionOut]:
+    """
+    Predicts for a batch of students with one predict_pass_fail call and saves the
+    results in one transaction. Used by class predictions and background jobs.
+    With explain=True the same call also yields per-feature contributions, which are stored.
+    """
     all_student_raw_feature_dfs = []
     valid_student_ids_for_prediction = []
+    programs = []
 
-    for student_obj in students_in_class:
+    for student_obj in students:
         df_student_raw_features = _prepare_raw_features_for_student(student_obj)
         if df_student_raw_features is not None and not df_student_raw_features.empty:
             all_student_raw_feature_dfs.append(df_student_raw_features)
             valid_student_ids_for_prediction.append(student_obj.student_id)
+            programs.append(student_obj.program)
         else:
-            print(f"Skipping student {student_obj.student_id} in class {program}-{section} due to issues preparing features.")
+            logger.warning("Skipping student %s due to issues preparing features.", student_obj.student_id)
 
     if not all_student_raw_feature_dfs:
         return [] # No students eligible for prediction
@@ -114,28 +178,223 @@ def generate_and_save_predictions_for_class(db: Session, program: str, section:
     df_features_batch = pd.concat(all_student_raw_feature_dfs, ignore_index=True)
 
     # Use the module to access predict_pass_fail
-    predicted_scores_proba_batch, categories_numeric_batch = ml_model_module.predict_pass_fail(df_features_batch)
+    predicted_scores_proba_batch, categories_numeric_batch, risk_bands, explanations = _predict(
+        db, df_features_batch, programs, explain, student_ids=valid_student_ids_for_prediction)
     # Access model name via the module too
     model_name = ml_model_module.loaded_model.__class__.__name__ if hasattr(ml_model_module.loaded_model, '__class__') else "FriendModel"
 
-    created_predictions_list = []
+    today = dt_date.today()
+    predictions_to_create = []
     for i, student_id in enumerate(valid_student_ids_for_prediction):
         score_proba = float(predicted_scores_proba_batch[i])
         category_num = int(categories_numeric_batch[i])
         category_label = "Pass" if category_num == 1 else "Fail"
 
-        prediction_data = PredictionCreate(
+        predictions_to_create.append(PredictionCreate(
             student_id=student_id,
-            date=dt_date.today(),
+            date=today,
             predicted_score=score_proba,
             category=category_label,
-            model_type=model_name
+            model_type=model_name,
+            risk_band=str(risk_bands[i])
+        ))
+
+    created_predictions_orm = crud_predictions.create_predictions_bulk(db, predictions_to_create, explanations=explanations)
+    predictions_out = [PredictionOut.model_validate(p) for p in created_predictions_orm]
+    if explanations is not None:
+        for i, prediction_out in enumerate(predictions_out):
+            prediction_out.explanation = explanation_from_batch(explanations, i)
+    return predictions_out
+
+def predict_batch(db: Session, request: BatchPredictionRequest) -> BatchPredictionResponse:
+    """
+    Scores a mix of database students and inline feature records with one IN query and one
+    predict_pass_fail call. Results follow the order of request.items; items that cannot be
+    scored carry an error instead of failing the whole batch.
+    """
+    if not ml_model_module.loaded_model:
+        raise PredictionError("ML model components are not loaded. Cannot make predictions.")
+    if len(request.items) > MAX_BATCH_PREDICTION_ITEMS:
+        raise PredictionError(f"A batch may contain at most {MAX_BATCH_PREDICTION_ITEMS} items.")
+
+    student_ids = {item.student_id for item in request.items if item.student_id is not None}
+    students_by_id = {}
+    if student_ids:
+        students_by_id = {
+            student.student_id: student
+            for student in db.query(Student).filter(Student.student_id.in_(student_ids)).all()
+        }
+
+    results = [BatchPredictionResult(index=i, student_id=item.student_id, reference=item.reference)
+               for i, item in enumerate(request.items)]
+    feature_columns = {"test_1_score": [], "test_2_score": [], "test_3_score": [], "learn_guide_completed": []}
+    programs = []
+    scored_indexes = []
+    for i, item in enumerate(request.items):
+        if item.student_id is not None:
+            source = students_by_id.get(item.student_id)
+            if source is None:
+                results[i].error = f"Student with ID {item.student_id} not found."
+                continue
+        else:
+            source = item
+            if item.test_1_score is None and item.test_2_score is None and item.test_3_score is None:
+                results[i].error = "Either student_id or at least one test score is required."
+                continue
+        for column, values in feature_columns.items():
+            values.append(getattr(source, column))
+        programs.append(source.program)
+        scored_indexes.append(i)
+
+    model_name = ml_model_module.loaded_model.__class__.__name__
+    today = dt_date.today()
+    explanations = None
+    if scored_indexes:
+        probabilities, categories, risk_bands, explanations = _predict(
+            db, pd.DataFrame(feature_columns), programs, request.explain,
+            student_ids=[results[i].student_id for i in scored_indexes])
+        for row, i in enumerate(scored_indexes):
+            results[i].predicted_score = float(probabilities[row])
+            results[i].category = "Pass" if int(categories[row]) == 1 else "Fail"
+            results[i].risk_band = str(risk_bands[row])
+            if explanations is not None:
+                results[i].explanation = explanation_from_batch(explanations, row)
+
+    if request.persist:
+        # One prediction per student even if the batch lists it several times
+        first_index_by_student = {}
+        for i in scored_indexes:
+            if results[i].student_id is not None:
+                first_index_by_student.setdefault(results[i].student_id, i)
+        to_create = [
+            PredictionCreate(student_id=student_id, date=today, predicted_score=results[i].predicted_score,
+                             category=results[i].category, model_type=model_name, risk_band=results[i].risk_band)
+            for student_id, i in first_index_by_student.items()
+        ]
+        to_explain = None
+        if explanations is not None:
+            row_of_index = {i: row for row, i in enumerate(scored_indexes)}
+            to_explain = explanations.take([row_of_index[i] for i in first_index_by_student.values()])
+        created = crud_predictions.create_predictions_bulk(db, to_create, explanations=to_explain)
+        prediction_ids = {p.student_id: p.prediction_id for p in created}
+        for i in scored_indexes:
+            if results[i].student_id is not None:
+                results[i].prediction_id = prediction_ids[results[i].student_id]
+
+    failed = sum(1 for result in results if result.error is not None)
+    return BatchPredictionResponse(model_type=model_name, date=today, succeeded=len(results) - failed,
+                                   failed=failed, results=results)
+
+def _scenario_test_3_grid(request: ScenarioRequest) -> np.ndarray:
+    if request.test_3_scores is not None:
+        if len(request.test_3_scores) > MAX_SCENARIO_GRID_POINTS:
+            raise PredictionError(f"Scenario grid has {len(request.test_3_scores)} test_3 scores; at most {MAX_SCENARIO_GRID_POINTS} are allowed.")
+        grid = np.unique(np.asarray(request.test_3_scores, dtype=float))  # Sorted, de-duplicated
+    else:
+        trained_min, trained_max = ml_model_module.get_feature_training_range("test_3_score") or (0.0, 100.0)
+        test_3_min = request.test_3_min if request.test_3_min is not None else trained_min
+        test_3_max = request.test_3_max if request.test_3_max is not None else trained_max
+        if test_3_max < test_3_min:
+            raise PredictionError("test_3_max must be greater than or equal to test_3_min.")
+        if request.test_3_step is None:
+            grid = np.linspace(test_3_min, test_3_max, DEFAULT_SCENARIO_GRID_POINTS)
+        else:
+            num_points = int(math.floor((test_3_max - test_3_min) / request.test_3_step + 1e-9)) + 1
+            if num_points > MAX_SCENARIO_GRID_POINTS:
+                raise PredictionError(f"Scenario grid has {num_points} test_3 scores; at most {MAX_SCENARIO_GRID_POINTS} are allowed.")
+            grid = test_3_min + request.test_3_step * np.arange(num_points)
+    if grid.size == 0:
+        raise PredictionError("Scenario grid is empty.")
+    if grid.size > MAX_SCENARIO_GRID_POINTS:
+        raise PredictionError(f"Scenario grid has {grid.size} test_3 scores; at most {MAX_SCENARIO_GRID_POINTS} are allowed.")
+    return grid
+
+
+def simulate_scenarios_for_students(db: Session, students: List[Student], request: ScenarioRequest) -> ScenarioResponse:
+    """
+    Evaluates every (student, learn-guide status, hypothetical test_3 score) combination
+    in a single predict_pass_fail call. Nothing is written to the database.
+    """
+    if not ml_model_module.loaded_model:
+        raise PredictionError("ML model components are not loaded. Cannot make predictions.")
+
+    model_name = ml_model_module.loaded_model.__class__.__name__
+    if not students:
+        return ScenarioResponse(target_probability=request.target_probability, model_type=model_name, results=[])
+
+    test_3_grid = _scenario_test_3_grid(request)
+    num_students, num_scores = len(students), test_3_grid.size
+
+    def _student_column(attr: str) -> np.ndarray:
+        return np.array([getattr(s, attr) for s in students], dtype=float)  # None -> nan
+
+    if request.learn_guide_completed:
+        lg_options = np.array(request.learn_guide_completed, dtype=bool)
+        num_lg = lg_options.size
+        lg_per_row = np.tile(np.repeat(lg_options, num_scores), num_students)
+    else:
+        # Keep each student's current learn-guide status
+        num_lg = 1
+        lg_per_row = np.repeat(np.array([bool(s.learn_guide_completed) for s in students]), num_scores)
+
+    scenarios_per_student = num_lg * num_scores
+    if num_students * scenarios_per_student > MAX_SCENARIO_ROWS:
+        raise PredictionError(
+            f"Scenario request expands to {num_students * scenarios_per_student} rows; at most {MAX_SCENARIO_ROWS} are allowed."
         )
-        try:
-            created_prediction_orm = crud_predictions.create_prediction(db, prediction_data)
-            created_predictions_list.append(PredictionOut.model_validate(created_prediction_orm))
-        except Exception as e:
-            db.rollback() # Rollback for this specific prediction attempt
-            print(f"Failed to save prediction for student {student_id}: {e}")
-
-    return created_predictions_list
+
+    df_grid = pd.DataFrame({
+        "test_1_score": np.repeat(_student_column("test_1_score"), scenarios_per_student),
+        "test_2_score": np.repeat(_student_column("test_2_score"), scenarios_per_student),
+        "test_3_score": np.tile(test_3_grid, num_students * num_lg),
+        "learn_guide_completed": lg_per_row,
+    })
+
+    thresholds = risk_band_service.band_thresholds_for_students(db, [s.program for s in students])
+    probabilities, categories_numeric = ml_model_module.predict_pass_fail(
+        df_grid, np.repeat(thresholds.pass_threshold, scenarios_per_student), monitor=False)
+    probabilities = np.asarray(probabilities, dtype=float).reshape(num_students, num_lg, num_scores)
+    categories_numeric = np.asarray(categories_numeric).reshape(num_students, num_lg, num_scores)
+    lg_values = lg_per_row.reshape(num_students, num_lg, num_scores)[:, :, 0]
+
+    # Grid is ascending, so the first score reaching the target is the minimum one
+    reaches_target = probabilities >= request.target_probability
+    first_hit = reaches_target.argmax(axis=2)
+    any_hit = reaches_target.any(axis=2)
+
+    results = []
+    for i, student in enumerate(students):
+        curves = []
+        for j in range(num_lg):
+            points = [
+                ScenarioPoint(
+                    test_3_score=float(test_3_grid[k]),
+                    predicted_score=float(probabilities[i, j, k]),
+                    category="Pass" if categories_numeric[i, j, k] == 1 else "Fail",
+                ) for k in range(num_scores)
+            ]
+            curves.append(ScenarioCurve(
+                learn_guide_completed=bool(lg_values[i, j]),
+                points=points,
+                min_test_3_score_for_target=float(test_3_grid[first_hit[i, j]]) if any_hit[i, j] else None,
+            ))
+        results.append(StudentScenarioResult(
+            student_id=student.student_id,
+            current_test_3_score=student.test_3_score,
+            curves=curves,
+        ))
+    return ScenarioResponse(target_probability=request.target_probability, model_type=model_name, results=results)
+
+
+def simulate_scenarios_for_student(db: Session, student_id: int, request: ScenarioRequest) -> ScenarioResponse:
+    student = crud_users.get_student_by_id(db, student_id)
+    if not student:
+        raise PredictionError(f"Student with ID {student_id} not found.")
+    return simulate_scenarios_for_students(db, [student], request)
+
+
+def simulate_scenarios_for_class(db: Session, program: str, section: str, request: ScenarioRequest) -> ScenarioResponse:
+    students_in_class = db.query(Student)\
+        .filter(Student.program == program, Student.section == section)\
+        .order_by(Student.student_id).all()
+    return simulate_scenarios_for_students(db, students_in_class, request)
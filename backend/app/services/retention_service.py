@@ -0,0 +1,194 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, func, desc, and_, literal
+from app.crud import predictions as crud_predictions
+from app.models import Prediction, PredictionArchive, PredictionExplanation
+from app.schema import RetentionReport
+
+from datetime import date as dt_date, timedelta
+from pathlib import Path
+from typing import List, Optional
+import json
+import os
+import shutil
+import tempfile
+
+# Predictions newer than this many days are never compacted
+RETENTION_FULL_DETAIL_DAYS = 90
+# Older history keeps one row per student per bucket of this size ("day" or "week")
+RETENTION_GRANULARITY = "week"
+# Default location for file archives, relative to the backend working directory
+RETENTION_ARCHIVE_DIR = Path("./prediction_archive")
+# Rows archived/deleted per statement, to keep IN (...) lists within SQLite's limits
+RETENTION_CHUNK_SIZE = 5000
+
+VALID_GRANULARITIES = ("day", "week")
+VALID_ARCHIVE_TARGETS = ("table", "file")
+
+
+class RetentionError(Exception):
+    """Raised for invalid retention settings."""
+    pass
+
+
+def _bucket_expression(granularity: str):
+    if granularity == "day":
+        return Prediction.date
+    # Monday of the prediction's week
+    return func.date(Prediction.date, "-6 days", "weekday 1")
+
+
+def _ids_to_compact(db: Session, cutoff: dt_date, granularity: str) -> List[int]:
+    """Every old row except the latest one of its (student, bucket)."""
+    ranked = select(
+        Prediction.prediction_id,
+        func.row_number().over(
+            partition_by=(Prediction.student_id, _bucket_expression(granularity)),
+            order_by=(desc(Prediction.date), desc(Prediction.prediction_id)),
+        ).label("rn"),
+    ).where(Prediction.date < cutoff).subquery()
+    return list(db.scalars(select(ranked.c.prediction_id).where(ranked.c.rn > 1)))
+
+
+def _ids_unchanged_from_previous(db: Session, cutoff: dt_date) -> List[int]:
+    """Old rows whose score, category and model are identical to the student's previous prediction."""
+    ordering = dict(partition_by=Prediction.student_id, order_by=(Prediction.date, Prediction.prediction_id))
+    with_previous = select(
+        Prediction.prediction_id,
+        Prediction.date,
+        Prediction.predicted_score,
+        Prediction.category,
+        Prediction.model_type,
+        func.lag(Prediction.predicted_score).over(**ordering).label("prev_score"),
+        func.lag(Prediction.category).over(**ordering).label("prev_category"),
+        func.lag(Prediction.model_type).over(**ordering).label("prev_model_type"),
+    ).subquery()
+    return list(db.scalars(
+        select(with_previous.c.prediction_id).where(and_(
+            with_previous.c.date < cutoff,
+            with_previous.c.predicted_score == with_previous.c.prev_score,
+            with_previous.c.category == with_previous.c.prev_category,
+            with_previous.c.model_type == with_previous.c.prev_model_type,
+        ))
+    ))
+
+
+def _archive_and_delete(db: Session, prediction_ids: List[int], archive: Optional[str], archive_file) -> set:
+    """Archives (optionally) and deletes the given predictions in chunks. Returns affected student ids."""
+    affected_students = set()
+    today = dt_date.today()
+    for start in range(0, len(prediction_ids), RETENTION_CHUNK_SIZE):
+        chunk = prediction_ids[start:start + RETENTION_CHUNK_SIZE]
+        rows = db.execute(
+            select(Prediction.prediction_id, Prediction.student_id, Prediction.date,
+                   Prediction.predicted_score, Prediction.category, Prediction.model_type, Prediction.risk_band)
+            .where(Prediction.prediction_id.in_(chunk))
+        ).all()
+        affected_students.update(row.student_id for row in rows)
+
+        if archive == "table":
+            db.execute(
+                PredictionArchive.__table__.insert().from_select(
+                    ["prediction_id", "student_id", "date", "predicted_score", "category", "model_type", "risk_band", "archived_on"],
+                    select(Prediction.prediction_id, Prediction.student_id, Prediction.date,
+                           Prediction.predicted_score, Prediction.category, Prediction.model_type,
+                           Prediction.risk_band, literal(today))
+                    .where(Prediction.prediction_id.in_(chunk))
+                )
+            )
+        elif archive == "file":
+            for row in rows:
+                archive_file.write(json.dumps({
+                    "prediction_id": row.prediction_id,
+                    "student_id": row.student_id,
+                    "date": row.date.isoformat(),
+                    "predicted_score": row.predicted_score,
+                    "category": row.category,
+                    "model_type": row.model_type,
+                    "risk_band": row.risk_band,
+                    "archived_on": today.isoformat(),
+                }) + "\n")
+
+        db.execute(delete(PredictionExplanation).where(PredictionExplanation.prediction_id.in_(chunk)))
+        db.execute(delete(Prediction).where(Prediction.prediction_id.in_(chunk)))
+    return affected_students
+
+
+def run_retention(
+    db: Session,
+    full_detail_days: int = RETENTION_FULL_DETAIL_DAYS,
+    granularity: str = RETENTION_GRANULARITY,
+    drop_unchanged: bool = True,
+    archive: Optional[str] = None,
+    archive_path: Optional[Path] = None,
+) -> RetentionReport:
+    """
+    Compacts prediction history older than `full_detail_days`:
+      1. keeps only the latest prediction per student per day/week bucket;
+      2. optionally drops remaining old rows identical to the student's previous prediction.
+    Removed rows can be archived to the predictions_archive table or appended to a JSONL file
+    (written in full before the commit, moved into place after it).
+    Everything runs in one transaction; latest-prediction pointers are rebuilt for affected students.
+    """
+    if granularity not in VALID_GRANULARITIES:
+        raise RetentionError(f"Invalid granularity '{granularity}'. Expected one of {VALID_GRANULARITIES}.")
+    if archive is not None and archive not in VALID_ARCHIVE_TARGETS:
+        raise RetentionError(f"Invalid archive target '{archive}'. Expected one of {VALID_ARCHIVE_TARGETS}.")
+    if full_detail_days < 0:
+        raise RetentionError("full_detail_days must be zero or positive.")
+
+    cutoff = dt_date.today() - timedelta(days=full_detail_days)
+    archive_file = None
+    staging_path = None
+    archive_target = archive
+    if archive == "file":
+        archive_path = Path(archive_path) if archive_path else RETENTION_ARCHIVE_DIR / f"predictions-{dt_date.today().isoformat()}.jsonl"
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        # Rows go to a copy of the archive that replaces it only once the deletes are committed,
+        # so a failed run never leaves archived rows that are still in `predictions`
+        staging_fd, staging_name = tempfile.mkstemp(dir=archive_path.parent, prefix=f".{archive_path.name}.", suffix=".tmp")
+        staging_path = Path(staging_name)
+        archive_file = os.fdopen(staging_fd, "w", encoding="utf-8")
+        archive_target = str(archive_path)
+
+    try:
+        if archive_file and archive_path.exists():
+            # mkstemp creates the copy owner-only; an existing archive keeps its own mode
+            shutil.copymode(archive_path, staging_path)
+            with open(archive_path, encoding="utf-8") as existing:
+                shutil.copyfileobj(existing, archive_file)
+        compact_ids = _ids_to_compact(db, cutoff, granularity)
+        affected_students = _archive_and_delete(db, compact_ids, archive, archive_file)
+
+        unchanged_ids = []
+        if drop_unchanged:
+            unchanged_ids = _ids_unchanged_from_previous(db, cutoff)
+            affected_students |= _archive_and_delete(db, unchanged_ids, archive, archive_file)
+
+        if affected_students:
+            # Same transaction: readers never see compacted history with stale latest pointers
+            crud_predictions.rebuild_latest_predictions(db, sorted(affected_students), commit=False)
+
+        if archive_file:
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+            archive_file.close()
+        db.commit()
+    except Exception:
+        db.rollback()
+        if archive_file:
+            archive_file.close()
+            staging_path.unlink(missing_ok=True)
+        raise
+    if staging_path is not None:
+        os.replace(staging_path, archive_path)
+
+    archived_count = len(compact_ids) + len(unchanged_ids) if archive else 0
+    return RetentionReport(
+        cutoff_date=cutoff,
+        granularity=granularity,
+        compacted_count=len(compact_ids),
+        deduplicated_count=len(unchanged_ids),
+        archived_count=archived_count,
+        archive_target=archive_target,
+        affected_students=len(affected_students),
+    )
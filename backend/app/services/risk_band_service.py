@@ -0,0 +1,198 @@
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+from app.cache import get_versions
+from app.models import RiskBandConfig, Student, StudentLatestPrediction
+from app.schema import RiskBandConfigIn, RiskBandConfigOut
+from app.ml import model as ml_model_module
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import threading
+
+# Thresholds used for programs without their own row and before "*" is configured
+DEFAULT_PROGRAM = "*"
+DEFAULT_HIGH_RISK_BELOW = 0.4
+DEFAULT_MEDIUM_RISK_BELOW = 0.6
+
+RISK_BAND_HIGH = "High"
+RISK_BAND_MEDIUM = "Medium"
+RISK_BAND_LOW = "Low"
+# Bands counted as "at risk" on the dashboard
+AT_RISK_BANDS = (RISK_BAND_HIGH,)
+
+
+class RiskBandError(Exception):
+    """Raised for invalid risk band configurations."""
+    pass
+
+
+@dataclass(frozen=True)
+class BandThresholds:
+    pass_threshold: float
+    high_risk_below: float
+    medium_risk_below: float
+
+
+DEFAULT_THRESHOLDS = BandThresholds(ml_model_module.DEFAULT_PASS_THRESHOLD, DEFAULT_HIGH_RISK_BELOW, DEFAULT_MEDIUM_RISK_BELOW)
+
+
+@dataclass
+class RowThresholds:
+    """Thresholds broadcast to one value per prediction row."""
+    pass_threshold: np.ndarray
+    high_risk_below: np.ndarray
+    medium_risk_below: np.ndarray
+
+
+# Configs are tiny and change rarely; reload only when the table's data version moves
+_configs_cache: Dict[str, object] = {"version": None, "configs": None}
+_configs_lock = threading.Lock()
+
+
+def get_band_configs(db: Session) -> Dict[str, BandThresholds]:
+    version = get_versions((RiskBandConfig.__tablename__,))
+    with _configs_lock:
+        if _configs_cache["version"] == version:
+            return _configs_cache["configs"]
+    configs = {
+        row.program: BandThresholds(row.pass_threshold, row.high_risk_below, row.medium_risk_below)
+        for row in db.query(RiskBandConfig).all()
+    }
+    configs.setdefault(DEFAULT_PROGRAM, DEFAULT_THRESHOLDS)
+    with _configs_lock:
+        _configs_cache["version"] = version
+        _configs_cache["configs"] = configs
+    return configs
+
+
+def thresholds_for_programs(configs: Dict[str, BandThresholds], programs: Sequence[Optional[str]]) -> RowThresholds:
+    """Looks thresholds up once per distinct program and broadcasts them to every row."""
+    keys = np.array([program if program in configs else DEFAULT_PROGRAM for program in programs], dtype=object)
+    if keys.size == 0:
+        empty = np.empty(0)
+        return RowThresholds(empty, empty, empty)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    table = np.array([
+        (configs[key].pass_threshold, configs[key].high_risk_below, configs[key].medium_risk_below)
+        for key in unique_keys
+    ])
+    per_row = table[inverse]
+    return RowThresholds(per_row[:, 0], per_row[:, 1], per_row[:, 2])
+
+
+def assign_bands(probabilities: np.ndarray, thresholds: RowThresholds) -> np.ndarray:
+    probabilities = np.asarray(probabilities, dtype=float)
+    return np.select(
+        [probabilities < thresholds.high_risk_below, probabilities < thresholds.medium_risk_below],
+        [RISK_BAND_HIGH, RISK_BAND_MEDIUM],
+        default=RISK_BAND_LOW,
+    )
+
+
+def band_thresholds_for_students(db: Session, programs: Sequence[Optional[str]]) -> RowThresholds:
+    return thresholds_for_programs(get_band_configs(db), programs)
+
+
+# --- Configuration management ---
+
+def list_band_configs(db: Session) -> List[RiskBandConfigOut]:
+    configs = get_band_configs(db)
+    return [
+        RiskBandConfigOut(program=program, pass_threshold=t.pass_threshold,
+                          high_risk_below=t.high_risk_below, medium_risk_below=t.medium_risk_below)
+        for program, t in sorted(configs.items())
+    ]
+
+
+def set_band_config(db: Session, program: str, config: RiskBandConfigIn) -> RiskBandConfigOut:
+    """Creates or replaces a program's thresholds and re-bands its students' latest predictions."""
+    if config.high_risk_below > config.medium_risk_below:
+        raise RiskBandError("high_risk_below must not exceed medium_risk_below.")
+    row = db.get(RiskBandConfig, program)
+    if row is None:
+        row = RiskBandConfig(program=program)
+        db.add(row)
+    row.pass_threshold = config.pass_threshold
+    row.high_risk_below = config.high_risk_below
+    row.medium_risk_below = config.medium_risk_below
+    db.flush()
+    reband_latest_predictions(db)
+    db.commit()
+    return RiskBandConfigOut.model_validate(row)
+
+
+def delete_band_config(db: Session, program: str) -> bool:
+    """Removes a program's override so it falls back to "*". The default itself can only be replaced."""
+    if program == DEFAULT_PROGRAM:
+        raise RiskBandError("The default configuration cannot be deleted; update it instead.")
+    row = db.get(RiskBandConfig, program)
+    if row is None:
+        return False
+    db.delete(row)
+    db.flush()
+    reband_latest_predictions(db)
+    db.commit()
+    return True
+
+
+# Students per re-band statement when only some are re-banded (one bound parameter each)
+REBAND_CHUNK_SIZE = 5000
+
+
+def _band_case(thresholds: BandThresholds):
+    score = StudentLatestPrediction.predicted_score
+    return case(
+        (score < thresholds.high_risk_below, RISK_BAND_HIGH),
+        (score < thresholds.medium_risk_below, RISK_BAND_MEDIUM),
+        else_=RISK_BAND_LOW,
+    )
+
+
+def _category_case(thresholds: BandThresholds):
+    return case((StudentLatestPrediction.predicted_score >= thresholds.pass_threshold, "Pass"), else_="Fail")
+
+
+def reband_latest_predictions(db: Session, student_ids: Optional[List[int]] = None) -> int:
+    """
+    Applies the stored thresholds (risk band and pass/fail category) to the latest prediction
+    of every student, or only of `student_ids`, with one UPDATE per configured program.
+    Historical Prediction rows keep the band and category assigned at inference time.
+    Does not commit; returns the number of rows updated.
+    """
+    if student_ids is not None:
+        return sum(
+            _reband(db, StudentLatestPrediction.student_id.in_(student_ids[start:start + REBAND_CHUNK_SIZE]))
+            for start in range(0, len(student_ids), REBAND_CHUNK_SIZE)
+        )
+    return _reband(db, None)
+
+
+def _reband(db: Session, only) -> int:
+    stored = {
+        row.program: BandThresholds(row.pass_threshold, row.high_risk_below, row.medium_risk_below)
+        for row in db.query(RiskBandConfig).all()
+    }
+    default = stored.pop(DEFAULT_PROGRAM, DEFAULT_THRESHOLDS)
+    statements: List[Tuple[BandThresholds, object]] = [
+        (thresholds, StudentLatestPrediction.student_id.in_(
+            select(Student.student_id).where(Student.program == program)))
+        for program, thresholds in stored.items()
+    ]
+    configured_programs = list(stored)
+    statements.append((default, StudentLatestPrediction.student_id.in_(
+        select(Student.student_id).where(
+            (Student.program.is_(None)) | (Student.program.not_in(configured_programs)))
+    )))
+
+    updated = 0
+    for thresholds, condition in statements:
+        if only is not None:
+            condition = condition & only
+        result = db.execute(
+            update(StudentLatestPrediction).where(condition)
+            .values(risk_band=_band_case(thresholds), category=_category_case(thresholds))
+            .execution_options(synchronize_session=False)
+        )
+        updated += result.rowcount or 0
+    return updated
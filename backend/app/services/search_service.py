@@ -0,0 +1,190 @@
+"""
+Typeahead search over students' first_name, last_name, program and section.
+
+Backed by an SQLite FTS5 external-content table (students_fts) that stores only the
+inverted index; the text stays in `students`. Triggers on `students` keep it in sync,
+so every create, update and delete path, ORM or bulk SQL, is covered without the
+application having to remember. Prefix indexes for 1-3 characters make short
+typeahead prefixes an index lookup instead of a term-list scan.
+
+Queries are split into words; every word must match the start of a token in any
+column ("jo sm" finds "John Smith"). Students matching every word in full come first,
+then the prefix matches; each group is ordered by bm25 with names weighted above program
+and section. A group matching more than SEARCH_CANDIDATE_LIMIT students ranks only that
+many (the oldest) and cannot be paged past them; a longer query narrows the matches and
+is ranked in full. When SQLite lacks FTS5, search falls back to LIKE filters plus the same
+word-prefix check in Python, which is correct but scans the table.
+"""
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app.models import Student
+from app.schema import DashboardStudentSummary, StudentSearchResponse
+
+from typing import List, Optional
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "students_fts"
+SEARCH_COLUMNS = ("first_name", "last_name", "program", "section")
+# bm25 weights per column, in SEARCH_COLUMNS order
+SEARCH_COLUMN_WEIGHTS = (4.0, 4.0, 1.0, 1.0)
+MAX_SEARCH_TERMS = 8
+MAX_SEARCH_LIMIT = 50
+# Matches ranked per query; bounds broad one- or two-letter prefixes at any table size
+SEARCH_CANDIDATE_LIMIT = 1000
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+_fts_available: Optional[bool] = None
+
+
+class SearchError(Exception):
+    """Raised for queries that cannot be searched (e.g. no searchable words)."""
+    pass
+
+
+_CREATE_FTS = f"""
+CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+    {", ".join(SEARCH_COLUMNS)},
+    content='students', content_rowid='student_id',
+    tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+)
+"""
+
+_NEW_VALUES = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+_OLD_VALUES = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+_COLUMN_LIST = ", ".join(SEARCH_COLUMNS)
+
+_CREATE_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON students BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, {_COLUMN_LIST}) VALUES (new.student_id, {_NEW_VALUES});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON students BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_COLUMN_LIST}) VALUES ('delete', old.student_id, {_OLD_VALUES});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF {_COLUMN_LIST} ON students BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_COLUMN_LIST}) VALUES ('delete', old.student_id, {_OLD_VALUES});
+        INSERT INTO {SEARCH_TABLE}(rowid, {_COLUMN_LIST}) VALUES (new.student_id, {_NEW_VALUES});
+    END""",
+)
+
+
+def ensure_search_index(bind) -> bool:
+    """
+    Creates students_fts, its triggers and its rank configuration if missing, and indexes
+    the existing students. Returns True if the index was created by this call.
+    """
+    global _fts_available
+    if bind.dialect.name != "sqlite":
+        _fts_available = False
+        return False
+    with bind.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+        ).first() is not None
+        if not exists:
+            try:
+                conn.execute(text(_CREATE_FTS))
+            except OperationalError as e:
+                logger.warning("FTS5 is not available (%s); student search falls back to LIKE.", e)
+                _fts_available = False
+                return False
+            weights = ", ".join(str(w) for w in SEARCH_COLUMN_WEIGHTS)
+            conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25({weights})')"))
+            conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+        for statement in _CREATE_TRIGGERS:
+            conn.execute(text(statement))
+    _fts_available = True
+    if not exists:
+        logger.info("Created %s and indexed existing students.", SEARCH_TABLE)
+    return not exists
+
+
+def search_terms(query: str) -> List[str]:
+    terms = _TOKEN_PATTERN.findall(query.lower())[:MAX_SEARCH_TERMS]
+    if not terms:
+        raise SearchError("The search query must contain at least one letter or digit.")
+    return terms
+
+
+def _match_expression(terms: List[str], prefix: bool = True) -> str:
+    # Terms are quoted (no FTS operators from user input) and ANDed. With prefix, each is also
+    # matched as a prefix, and still whole so bm25 scores an exact word above a longer word it starts.
+    if not prefix:
+        return " AND ".join(f'"{term}"' for term in terms)
+    return " AND ".join(f'("{term}" OR "{term}"*)' for term in terms)
+
+
+def _ranked_ids(db: Session, match: str, count: int) -> List[int]:
+    # FTS5 cannot pick the top k by bm25 without scoring every match, so the ranking runs over
+    # the first SEARCH_CANDIDATE_LIMIT matches (rowid order), which stops the scan early.
+    statement = text(
+        f"SELECT rowid FROM ("
+        f"  SELECT rowid, rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match LIMIT :candidates"
+        f") ORDER BY rank, rowid LIMIT :count"
+    ).bindparams(match=match, candidates=SEARCH_CANDIDATE_LIMIT, count=count)
+    return list(db.scalars(statement))
+
+
+def _fts_search(db: Session, terms: List[str], limit: int, offset: int) -> List[Student]:
+    # Whole-word matches come first, so a student whose name is typed out in full is found even when
+    # the prefix matches are past the candidate limit. At most len(exact) prefix hits are duplicates,
+    # so the first offset + limit of each list are enough for the merged page.
+    count = offset + limit
+    exact = _ranked_ids(db, _match_expression(terms, prefix=False), count)
+    seen = set(exact)
+    merged = exact + [i for i in _ranked_ids(db, _match_expression(terms), count) if i not in seen]
+    page = merged[offset:count]
+    if not page:
+        return []
+    by_id = {s.student_id: s for s in db.query(Student).filter(Student.student_id.in_(page))}
+    return [by_id[i] for i in page if i in by_id]
+
+
+def _token_prefixes(student: Student, terms: List[str], whole: bool) -> bool:
+    tokens = _TOKEN_PATTERN.findall(" ".join(str(getattr(student, c) or "") for c in SEARCH_COLUMNS).lower())
+    if whole:
+        return all(term in tokens for term in terms)
+    return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+
+def _like_search(db: Session, terms: List[str], limit: int, offset: int) -> List[Student]:
+    # LIKE narrows to students containing every term; the token check then applies the FTS rule
+    # (each term starts a word in some column) and whole-word matches go first, as with FTS.
+    query = db.query(Student)
+    for term in terms:
+        pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = query.filter(
+            Student.first_name.ilike(pattern, escape="\\") | Student.last_name.ilike(pattern, escape="\\")
+            | Student.program.ilike(pattern, escape="\\") | Student.section.ilike(pattern, escape="\\")
+        )
+    students = query.order_by(Student.last_name, Student.first_name, Student.student_id).all()
+    hits = [s for s in students if _token_prefixes(s, terms, whole=False)]
+    hits.sort(key=lambda s: not _token_prefixes(s, terms, whole=True))
+    return hits[offset:offset + limit]
+
+
+def search_students(db: Session, query: str, limit: int = 20, offset: int = 0) -> StudentSearchResponse:
+    terms = search_terms(query)
+    limit = min(limit, MAX_SEARCH_LIMIT)
+    if _fts_available is None:
+        ensure_search_index(db.get_bind())
+    search = _fts_search if _fts_available else _like_search
+    # One extra row tells whether another page exists without counting every match
+    students = search(db, terms, limit + 1, offset)
+    return StudentSearchResponse(
+        query=query,
+        limit=limit,
+        offset=offset,
+        has_more=len(students) > limit,
+        results=[
+            DashboardStudentSummary(
+                student_id=s.student_id, first_name=s.first_name, last_name=s.last_name,
+                program=s.program, section=s.section,
+                avg_test_score=None if s.avg_test_score is None else round(s.avg_test_score, 2),
+            )
+            for s in students[:limit]
+        ],
+    )
@@ -0,0 +1,266 @@
+"""
+Deterministic synthetic students/feature sets/predictions written straight into a SQLite file.
+
+The same seed always produces the same database. Values are generated with numpy and
+inserted with executemany in chunks; 1M students with three predictions each take about two minutes.
+- Each program has its own score profile (level, spread, improvement from test to test,
+  learn guide completion). Students in the same class share a small offset.
+- Some scores are missing, test 3 most often (not sat yet). Those students have no
+  feature set, like the API leaves them.
+- Prediction histories span several terms. A student's pass probability drifts along a
+  random walk from a start set by their ability, so categories and risk bands flip over time.
+- student_latest_predictions, risk bands and prediction_trend_rollups are filled as the
+  server would have left them. There are faculty accounts for load tests (LOADTEST_PASSWORD).
+
+Usage (from backend/):
+    python -m benchmarks.datasets --students 100000 --terms 3 --predictions-per-student 12 --output loadtest.db
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+import argparse
+import json
+import math
+import sqlite3
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.auth.utils import get_password_hash
+from app.crud.trends import rebuild_trend_rollups
+from app.database import ensure_schema
+from app.ml.model import DEFAULT_PASS_THRESHOLD
+from app.services.risk_band_service import DEFAULT_HIGH_RISK_BELOW, DEFAULT_MEDIUM_RISK_BELOW
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+INSERT_CHUNK_SIZE = 50_000
+
+
+@dataclass(frozen=True)
+class ProgramProfile:
+    weight: float               # Share of all students
+    score_mean: float           # Test 1 score of an average student
+    score_std: float
+    improvement_per_test: float  # Average change from one test to the next
+    learn_guide_rate: float
+
+
+PROGRAM_PROFILES = {
+    "Computer Science": ProgramProfile(weight=0.30, score_mean=670, score_std=110, improvement_per_test=15, learn_guide_rate=0.65),
+    "Information Technology": ProgramProfile(weight=0.20, score_mean=645, score_std=120, improvement_per_test=10, learn_guide_rate=0.60),
+    "Business": ProgramProfile(weight=0.20, score_mean=615, score_std=100, improvement_per_test=5, learn_guide_rate=0.55),
+    "Nursing": ProgramProfile(weight=0.15, score_mean=690, score_std=90, improvement_per_test=12, learn_guide_rate=0.75),
+    "Engineering": ProgramProfile(weight=0.15, score_mean=635, score_std=130, improvement_per_test=20, learn_guide_rate=0.50),
+}
+PROGRAMS = list(PROGRAM_PROFILES)
+SECTIONS = ["A", "B", "C", "D"]
+# Share of students without a score for test 1, 2 and 3
+MISSING_SCORE_RATES = (0.01, 0.03, 0.12)
+# Spread of the per-class offset, in program standard deviations
+CLASS_OFFSET_STD = 0.25
+# Predictions within a term are this many days apart; terms start this many days apart
+PREDICTION_INTERVAL_DAYS = 7
+TERM_DAYS = 120
+# Per-prediction random walk of the pass probability, in log-odds
+PROBABILITY_DRIFT_STD = 0.25
+MODEL_TYPE = "VotingClassifier"
+FIRST_NAMES = [
+    "Aiden", "Amara", "Bea", "Carlos", "Chen", "Dana", "Elif", "Emma", "Farah", "Gabriel",
+    "Hana", "Ivan", "Jamal", "Jia", "Kofi", "Lena", "Liam", "Maria", "Mateo", "Nia",
+    "Noah", "Olga", "Priya", "Ravi", "Sofia", "Tariq", "Uma", "Yuki", "Zoe", "Zanele",
+]
+LAST_NAMES = [
+    "Adeyemi", "Bauer", "Cruz", "Dubois", "Evans", "Fischer", "Garcia", "Haddad", "Ivanova", "Johnson",
+    "Kim", "Lopez", "Mensah", "Nguyen", "Okafor", "Patel", "Quinn", "Rossi", "Santos", "Schmidt",
+    "Silva", "Smith", "Tanaka", "Torres", "Usman", "Varga", "Wang", "Williams", "Yilmaz", "Zhou",
+]
+LOADTEST_PASSWORD = "loadtest"
+
+
+def faculty_email(i: int) -> str:
+    return f"faculty{i}@example.com"
+
+
+def _student_metrics(scores: np.ndarray):
+    """
+    Vectorized equivalent of crud.users._calculate_student_metrics; missing scores are NaN
+    and give NaN metrics where the scalar version returns None.
+    """
+    present = ~np.isnan(scores)
+    counts = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg = np.round(np.nansum(scores, axis=1) / counts, 2)
+        deviations = np.where(present, scores - avg[:, None], 0.0)
+        std = np.round(np.sqrt((deviations ** 2).sum(axis=1) / counts), 2)
+        t1, t3 = scores[:, 0], scores[:, 2]
+        improvement = np.round((t3 - t1) / np.abs(t1) * 100, 2)
+    std[counts < 2] = np.nan
+    return avg, improvement, std
+
+
+def _nullable(values: np.ndarray) -> list:
+    return [None if v != v else v for v in values.tolist()]
+
+
+def _prediction_days_ago(predictions_per_student: int, terms: int) -> np.ndarray:
+    """Days before today of each student's predictions, oldest first, spread over `terms` terms."""
+    per_term = math.ceil(predictions_per_student / terms)
+    if (per_term - 1) * PREDICTION_INTERVAL_DAYS >= TERM_DAYS:
+        raise ValueError(f"{per_term} predictions per term do not fit in a {TERM_DAYS}-day term.")
+    index = np.arange(predictions_per_student)
+    term, step = index // per_term, index % per_term
+    last_term = (predictions_per_student - 1) // per_term
+    days_ago = (last_term - term) * TERM_DAYS + (per_term - 1 - step) * PREDICTION_INTERVAL_DAYS
+    # The newest prediction is today
+    return days_ago - days_ago[-1]
+
+
+def generate_dataset(
+    db_path: Path,
+    num_students: int,
+    predictions_per_student: int = 3,
+    seed: int = 42,
+    terms: int = 1,
+    faculty_users: int = 0,
+) -> dict:
+    """Creates the schema in `db_path` and fills it. Returns row counts."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    ensure_schema(engine)
+
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    today = date.today()
+    profiles = [PROGRAM_PROFILES[p] for p in PROGRAMS]
+    program_weights = np.array([p.weight for p in profiles]) / sum(p.weight for p in profiles)
+    score_mean = np.array([p.score_mean for p in profiles])
+    score_std = np.array([p.score_std for p in profiles])
+    improvement = np.array([p.improvement_per_test for p in profiles])
+    learn_guide_rate = np.array([p.learn_guide_rate for p in profiles])
+    class_offsets = rng.normal(0.0, CLASS_OFFSET_STD, (len(PROGRAMS), len(SECTIONS)))
+    days_ago = _prediction_days_ago(predictions_per_student, terms) if predictions_per_student else None
+    counts = {"students": num_students, "feature_sets": 0, "students_missing_scores": 0, "predictions": 0}
+
+    for start in range(0, num_students, INSERT_CHUNK_SIZE):
+        n = min(INSERT_CHUNK_SIZE, num_students - start)
+        student_ids = np.arange(start + 1, start + n + 1)
+        programs = rng.choice(len(PROGRAMS), n, p=program_weights)
+        sections = rng.integers(0, len(SECTIONS), n)
+        ability = rng.normal(0.0, 1.0, n) + class_offsets[programs, sections]
+        learn_guide = rng.random(n) < learn_guide_rate[programs]
+        base = score_mean[programs] + score_std[programs] * 0.8 * ability
+        scores = (
+            base[:, None]
+            + improvement[programs][:, None] * np.arange(3)
+            + rng.normal(0.0, 0.4, (n, 3)) * score_std[programs][:, None]
+        )
+        scores = np.clip(scores, 300, 999).round(1)
+        scores[rng.random((n, 3)) < np.array(MISSING_SCORE_RATES)] = np.nan
+        avg, improvement_rate, std = _student_metrics(scores)
+        dob_offsets = rng.integers(18 * 365, 30 * 365, n)
+        first_names = rng.integers(0, len(FIRST_NAMES), n)
+        last_names = rng.integers(0, len(LAST_NAMES), n)
+
+        student_rows = [
+            (sid, FIRST_NAMES[f], LAST_NAMES[l], (today - timedelta(days=off)).isoformat(),
+             PROGRAMS[p], SECTIONS[s], t1, t2, t3, a, imp, sd, lg)
+            for sid, f, l, off, p, s, t1, t2, t3, a, imp, sd, lg in zip(
+                student_ids.tolist(), first_names.tolist(), last_names.tolist(), dob_offsets.tolist(),
+                programs.tolist(), sections.tolist(), _nullable(scores[:, 0]), _nullable(scores[:, 1]),
+                _nullable(scores[:, 2]), _nullable(avg), _nullable(improvement_rate), _nullable(std),
+                learn_guide.tolist())
+        ]
+        conn.executemany(
+            "INSERT INTO students (student_id, first_name, last_name, dob, program, section, test_1_score, "
+            "test_2_score, test_3_score, avg_test_score, score_improvement_rate, test_scores_std_dev, "
+            "learn_guide_completed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            student_rows,
+        )
+        # Feature set columns are NOT NULL: only students with all three scores have one
+        feature_rows = [row[:1] + row[6:] for row in student_rows if None not in row[6:9]]
+        conn.executemany(
+            "INSERT INTO student_feature_sets (student_id, test_1_score, test_2_score, test_3_score, "
+            "avg_test_score, score_improvement_rate, test_scores_std_dev, learn_guide_completed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            feature_rows,
+        )
+        counts["feature_sets"] += len(feature_rows)
+        counts["students_missing_scores"] += n - len(feature_rows)
+
+        if predictions_per_student:
+            # Log-odds random walk starting from the student's ability, oldest prediction first
+            start_logit = 1.6 * ability + 0.4 * learn_guide - 0.2
+            drift = (improvement[programs] / score_std[programs])[:, None]
+            steps = rng.normal(0.0, PROBABILITY_DRIFT_STD, (n, predictions_per_student)) + 0.1 * drift
+            probabilities = (1 / (1 + np.exp(-(start_logit[:, None] + np.cumsum(steps, axis=1))))).round(4).ravel()
+            categories = np.where(probabilities >= DEFAULT_PASS_THRESHOLD, "Pass", "Fail")
+            bands = np.where(probabilities < DEFAULT_HIGH_RISK_BELOW, "High",
+                             np.where(probabilities < DEFAULT_MEDIUM_RISK_BELOW, "Medium", "Low"))
+            dates = [(today - timedelta(days=d)).isoformat() for d in days_ago.tolist()] * n
+            conn.executemany(
+                "INSERT INTO predictions (student_id, date, predicted_score, category, model_type, risk_band) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                zip(np.repeat(student_ids, predictions_per_student).tolist(), dates, probabilities.tolist(),
+                    categories.tolist(), [MODEL_TYPE] * len(dates), bands.tolist()),
+            )
+            counts["predictions"] += n * predictions_per_student
+        conn.commit()
+
+    # Same result as crud.predictions.rebuild_latest_predictions, without going through a Session
+    conn.execute(
+        "INSERT OR REPLACE INTO student_latest_predictions (student_id, prediction_id, date, predicted_score, category, risk_band) "
+        "SELECT student_id, prediction_id, date, predicted_score, category, risk_band FROM ("
+        "  SELECT *, row_number() OVER (PARTITION BY student_id ORDER BY date DESC, prediction_id DESC) AS rn"
+        "  FROM predictions) WHERE rn = 1"
+    )
+    conn.execute("INSERT INTO users (email, hashed_password, role) VALUES ('bench@example.com', '!', 'faculty')")
+    if faculty_users:
+        # bcrypt is slow on purpose; every account shares one hash of the same password
+        hashed_password = get_password_hash(LOADTEST_PASSWORD)
+        conn.executemany(
+            "INSERT INTO users (email, hashed_password, role) VALUES (?, ?, 'faculty')",
+            [(faculty_email(i), hashed_password) for i in range(1, faculty_users + 1)],
+        )
+    conn.commit()
+    conn.close()
+
+    with Session(engine) as db:
+        counts["trend_rollups"] = rebuild_trend_rollups(db)
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    engine.dispose()
+    counts["faculty_users"] = faculty_users
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, required=True, help="SQLite file to create")
+    parser.add_argument("--students", type=int, default=SCALES["100k"])
+    parser.add_argument("--predictions-per-student", type=int, default=12)
+    parser.add_argument("--terms", type=int, default=3, help="Terms the prediction history spans")
+    parser.add_argument("--faculty-users", type=int, default=50, help=f"faculty<i>@example.com accounts, password '{LOADTEST_PASSWORD}'")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="Replace an existing file")
+    args = parser.parse_args()
+
+    if args.output.exists():
+        if not args.force:
+            sys.exit(f"{args.output} exists; pass --force to replace it.")
+        for path in (args.output, Path(f"{args.output}-wal"), Path(f"{args.output}-shm")):
+            path.unlink(missing_ok=True)
+    start = time.perf_counter()
+    counts = generate_dataset(
+        args.output, args.students, predictions_per_student=args.predictions_per_student,
+        seed=args.seed, terms=args.terms, faculty_users=args.faculty_users,
+    )
+    print(f"Generated in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
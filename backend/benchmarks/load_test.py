@@ -0,0 +1,314 @@
+"""
+Replays a mixed faculty workload against a running server and reports latency percentiles.
+
+Requests arrive open-loop: a seeded Poisson process at --rate requests per second, each
+one a scenario drawn from the mix (dashboard polls with ETags, trend charts, class
+rosters, student histories, search, roster edits, single and class predictions, logins)
+on behalf of a random faculty account. A late response never delays the next arrival, and
+latency is measured from when the request was due, so queueing in an overloaded
+server shows up in the percentiles instead of lowering the offered rate.
+
+Students and classes are sampled from the server's SQLite file, and the accounts are the
+ones benchmarks.datasets creates. Build a database and start the server first:
+    python -m benchmarks.datasets --students 100000 --output loadtest.db
+    DATABASE_URL=sqlite:///./loadtest.db ADMISSION_CONTROL_ENABLED=0 uvicorn app.main:app --workers 4
+
+Usage (from backend/):
+    python -m benchmarks.load_test --db loadtest.db --rate 50 --duration 60
+    python -m benchmarks.load_test --db loadtest.db --mix dashboard_poll=1,class_predict=1 --output load.json
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.datasets import LAST_NAMES, LOADTEST_PASSWORD, faculty_email
+from benchmarks.run_benchmarks import summarize
+
+# Relative weights of the default mix; dashboards are polled far more often than anything is edited
+DEFAULT_MIX = {
+    "dashboard_poll": 35,
+    "trends": 5,
+    "class_roster": 10,
+    "student_history": 15,
+    "search": 12,
+    "roster_edit": 10,
+    "student_predict": 6,
+    "class_predict": 2,
+    "login": 5,
+}
+ROSTER_SAMPLE_SIZE = 2_000
+STUDENT_COLUMNS = ("student_id", "first_name", "last_name", "dob", "program", "section",
+                   "test_1_score", "test_2_score", "test_3_score", "learn_guide_completed")
+
+
+@dataclass
+class Faculty:
+    email: str
+    token: str = ""
+    etags: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+@dataclass
+class Fixtures:
+    students: List[dict]
+    classes: List[tuple]
+    graded: List[dict]       # Students with all three scores
+
+
+@dataclass
+class Sample:
+    scenario: str
+    status: str              # HTTP status code, or the exception name for transport errors
+    latency_s: float         # From when the request was due
+    service_s: float         # From when it was sent
+
+
+def load_fixtures(db_path: Path, rng: np.random.Generator, sample_size: int = ROSTER_SAMPLE_SIZE) -> Fixtures:
+    conn = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+    try:
+        max_id = conn.execute("SELECT max(student_id) FROM students").fetchone()[0]
+        if not max_id:
+            raise SystemExit(f"{db_path} has no students; build it with python -m benchmarks.datasets.")
+        ids = sorted(set(rng.integers(1, max_id + 1, sample_size).tolist()))
+        placeholders = ", ".join("?" * len(ids))
+        rows = conn.execute(f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students WHERE student_id IN ({placeholders})", ids)
+        students = [dict(zip(STUDENT_COLUMNS, row)) for row in rows]
+        classes = conn.execute("SELECT DISTINCT program, section FROM students WHERE program IS NOT NULL AND section IS NOT NULL").fetchall()
+    finally:
+        conn.close()
+    graded = [s for s in students if None not in (s["test_1_score"], s["test_2_score"], s["test_3_score"])]
+    return Fixtures(students=students, classes=classes, graded=graded)
+
+
+# --- Scenarios: each sends one request and returns its response ---
+
+Scenario = Callable[[httpx.AsyncClient, Faculty, Fixtures, np.random.Generator], Awaitable[httpx.Response]]
+
+
+async def dashboard_poll(client, user, fixtures, rng):
+    headers = dict(user.headers)
+    if "dashboard" in user.etags:
+        headers["If-None-Match"] = user.etags["dashboard"]
+    response = await client.get("/dashboard-stats", headers=headers)
+    if "etag" in response.headers:
+        user.etags["dashboard"] = response.headers["etag"]
+    return response
+
+
+async def trends(client, user, fixtures, rng):
+    program, _ = fixtures.classes[rng.integers(len(fixtures.classes))]
+    return await client.get("/analytics/trends", params={"granularity": "week", "program": program}, headers=user.headers)
+
+
+async def class_roster(client, user, fixtures, rng):
+    program, section = fixtures.classes[rng.integers(len(fixtures.classes))]
+    return await client.get(f"/predictions/class/{program}/{section}/latest", headers=user.headers)
+
+
+async def student_history(client, user, fixtures, rng):
+    student = fixtures.students[rng.integers(len(fixtures.students))]
+    return await client.get(f"/students/{student['student_id']}/predictions", headers=user.headers)
+
+
+async def search(client, user, fixtures, rng):
+    name = LAST_NAMES[rng.integers(len(LAST_NAMES))]
+    return await client.get("/students/search", params={"q": name[:rng.integers(2, 5)]}, headers=user.headers)
+
+
+async def roster_edit(client, user, fixtures, rng):
+    # A re-graded test 3; everything else is sent back unchanged. Students with a missing score
+    # are left out: updating them fails on the NOT NULL feature set columns.
+    student = fixtures.graded[rng.integers(len(fixtures.graded))]
+    student["test_3_score"] = round(float(np.clip(student["test_3_score"] + rng.normal(0, 15), 300, 999)), 1)
+    form = {
+        name: ("true" if value else "false") if name == "learn_guide_completed" else str(value)
+        for name, value in student.items() if name != "student_id"
+    }
+    return await client.put(f"/students/{student['student_id']}", data=form, headers=user.headers)
+
+
+async def student_predict(client, user, fixtures, rng):
+    student = fixtures.students[rng.integers(len(fixtures.students))]
+    return await client.post(f"/students/{student['student_id']}/predict", headers=user.headers)
+
+
+async def class_predict(client, user, fixtures, rng):
+    program, section = fixtures.classes[rng.integers(len(fixtures.classes))]
+    return await client.post(f"/predictions/class/{program}/{section}", headers=user.headers)
+
+
+async def login(client, user, fixtures, rng):
+    response = await client.post("/login", data={"username": user.email, "password": LOADTEST_PASSWORD})
+    if response.status_code == 200:
+        user.token = response.json()["access_token"]
+    return response
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "dashboard_poll": dashboard_poll,
+    "trends": trends,
+    "class_roster": class_roster,
+    "student_history": student_history,
+    "search": search,
+    "roster_edit": roster_edit,
+    "student_predict": student_predict,
+    "class_predict": class_predict,
+    "login": login,
+}
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'; expected one of {', '.join(SCENARIOS)}.")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run_load(
+    base_url: str,
+    fixtures: Fixtures,
+    users: List[Faculty],
+    mix: Dict[str, float],
+    rate: float,
+    duration: float,
+    warmup: float,
+    seed: int,
+    connections: int,
+    timeout: float,
+) -> List[Sample]:
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = np.array([mix[name] for name in names], dtype=float)
+    weights /= weights.sum()
+    schedule_rng = np.random.default_rng(seed)
+    samples: List[Sample] = []
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(login(client, user, fixtures, None) for user in users))
+        missing = [user.email for user in users if not user.token]
+        if missing:
+            raise SystemExit(f"Could not log in as {missing[0]} (and {len(missing) - 1} more); was the database built by benchmarks.datasets?")
+
+        async def execute(index: int, scenario: str, user: Faculty, due: float, record: bool):
+            # Each request draws its parameters from its own stream, so the sequence of requests
+            # is the same on every run whatever the response times
+            rng = np.random.default_rng([seed, index])
+            sent = time.perf_counter()
+            try:
+                response = await SCENARIOS[scenario](client, user, fixtures, rng)
+                outcome = str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            done = time.perf_counter()
+            if record:
+                samples.append(Sample(scenario, outcome, done - due, done - sent))
+
+        tasks = set()
+        start = time.perf_counter()
+        due = start
+        index = 0
+        while True:
+            due += schedule_rng.exponential(1.0 / rate)
+            if due - start >= warmup + duration:
+                break
+            scenario = names[schedule_rng.choice(len(names), p=weights)]
+            user = users[schedule_rng.integers(len(users))]
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(execute(index, scenario, user, due, due - start >= warmup))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            index += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+    return samples
+
+
+def report(samples: List[Sample], duration: float) -> dict:
+    def block(group: List[Sample]) -> dict:
+        statuses: Dict[str, int] = {}
+        for sample in group:
+            statuses[sample.status] = statuses.get(sample.status, 0) + 1
+        stats = summarize([s.latency_s for s in group])
+        # summarize's throughput assumes back-to-back calls; under concurrent load it is the completion rate
+        stats["throughput_per_s"] = round(len(group) / duration, 2)
+        stats["service_p95_ms"] = round(float(np.percentile([s.service_s for s in group], 95)) * 1000.0, 3)
+        stats["errors"] = sum(n for status, n in statuses.items() if not status.startswith(("2", "3")))
+        stats["statuses"] = dict(sorted(statuses.items()))
+        return stats
+
+    by_scenario: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        by_scenario.setdefault(sample.scenario, []).append(sample)
+    return {
+        "overall": block(samples) if samples else {},
+        "scenarios": {name: block(group) for name, group in sorted(by_scenario.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", type=Path, required=True, help="The server's SQLite file, to sample students and classes from")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rate", type=float, default=20.0, help="Requests per second offered")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds measured, after the warmup")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    parser.add_argument("--users", type=int, default=20, help="Faculty accounts to spread requests over")
+    parser.add_argument("--mix", default=None, help=f"Scenario weights, e.g. dashboard_poll=3,search=1 (default: {DEFAULT_MIX})")
+    parser.add_argument("--connections", type=int, default=64, help="Most open connections to the server")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds before a request counts as failed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    fixtures = load_fixtures(args.db, np.random.default_rng(args.seed))
+    users = [Faculty(faculty_email(i)) for i in range(1, args.users + 1)]
+    print(f"Offering {args.rate:g} req/s for {args.warmup:g}s warmup + {args.duration:g}s to {args.base_url}", file=sys.stderr)
+    samples = asyncio.run(run_load(
+        args.base_url, fixtures, users, mix, args.rate, args.duration, args.warmup,
+        args.seed, args.connections, args.timeout,
+    ))
+
+    results = report(samples, args.duration)
+    for name, stats in [("overall", results["overall"]), *results["scenarios"].items()]:
+        if stats:
+            print(f"{name:>16}: n={stats['iterations']:<6} p50={stats['p50_ms']:>9.1f}ms p95={stats['p95_ms']:>9.1f}ms "
+                  f"p99={stats['p99_ms']:>9.1f}ms errors={stats['errors']}", file=sys.stderr)
+    text = json.dumps({
+        "base_url": args.base_url,
+        "target_rate_per_s": args.rate,
+        "duration_s": args.duration,
+        "mix": mix,
+        "seed": args.seed,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **results,
+    }, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Bytes on the wire and encode time of list payloads in every response encoding.
+
+Builds class-history rows (PredictionOut) and student rows (StudentOut) like the API
+returns them and serializes each payload as row-wise JSON (what the API sends by
+default), columnar JSON, MessagePack and Arrow IPC, each uncompressed, gzip'd and
+brotli'd. Encodings whose optional package is not installed are skipped.
+
+Usage (from backend/):
+    python -m benchmarks.payload_encodings --rows 10000
+    python -m benchmarks.payload_encodings --rows 1000 --output encodings.json
+"""
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+
+from app import encoding
+from app.schema import PredictionOut, StudentOut
+from benchmarks.datasets import PROGRAMS, SECTIONS
+from benchmarks.run_benchmarks import measure
+
+DEFAULT_ROWS = 10_000
+DEFAULT_ITERATIONS = 20
+
+
+def prediction_rows(n: int, seed: int = 0) -> List[PredictionOut]:
+    rng = np.random.default_rng(seed)
+    scores = rng.uniform(0.0, 1.0, n)
+    start = date(2024, 1, 1)
+    return [
+        PredictionOut(
+            prediction_id=i + 1, student_id=int(rng.integers(1, max(n // 3, 2))),
+            date=start + timedelta(days=int(i % 365)), predicted_score=float(score),
+            category="Pass" if score >= 0.5 else "Fail", model_type="VotingClassifier",
+            risk_band="High" if score < 0.4 else ("Medium" if score < 0.6 else "Low"),
+        )
+        for i, score in enumerate(scores)
+    ]
+
+
+def student_rows(n: int, seed: int = 0) -> List[StudentOut]:
+    rng = np.random.default_rng(seed)
+    scores = rng.uniform(300, 999, (n, 3))
+    return [
+        StudentOut(
+            student_id=i + 1, first_name=f"First{i + 1}", last_name=f"Last{i + 1}", dob=date(2000, 1, 1),
+            program=PROGRAMS[i % len(PROGRAMS)], section=SECTIONS[i % len(SECTIONS)],
+            test_1_score=round(float(t1), 1), test_2_score=round(float(t2), 1), test_3_score=round(float(t3), 1),
+            learn_guide_completed=bool(i % 2),
+        )
+        for i, (t1, t2, t3) in enumerate(scores)
+    ]
+
+
+def row_json(items) -> bytes:
+    # Same serialization as cached_json_response
+    return json.dumps(jsonable_encoder(items), separators=(",", ":")).encode("utf-8")
+
+
+def bench_payload(model, items, iterations: int) -> Dict[str, dict]:
+    encoders: Dict[str, Callable[[], bytes]] = {"json": lambda: row_json(items)}
+    for media_type in encoding.available_columnar_types():
+        encoders[media_type] = lambda media_type=media_type: encoding.encode_columnar(model, items, media_type)
+
+    results = {}
+    for name, encode in encoders.items():
+        body = encode()
+        encode_ms = float(np.median(measure(encode, iterations))) * 1000
+        results[name] = {"bytes": len(body), "encode_ms": round(encode_ms, 2)}
+        for coding in encoding.available_encodings():
+            compressed = encoding.compress(body, coding)
+            compress_ms = float(np.median(measure(lambda: encoding.compress(body, coding), iterations))) * 1000
+            results[f"{name}+{coding}"] = {
+                "bytes": len(compressed), "encode_ms": round(encode_ms + compress_ms, 2),
+            }
+    baseline = results["json"]["bytes"]
+    for result in results.values():
+        result["ratio_vs_json"] = round(result["bytes"] / baseline, 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    report = {
+        "rows": args.rows,
+        "payloads": {
+            "class history (PredictionOut)": bench_payload(PredictionOut, prediction_rows(args.rows), args.iterations),
+            "students (StudentOut)": bench_payload(StudentOut, student_rows(args.rows), args.iterations),
+        },
+    }
+    for payload, results in report["payloads"].items():
+        print(payload, file=sys.stderr)
+        for name, result in results.items():
+            print(f"  {name:48s} {result['bytes']:>10,d} B  x{result['ratio_vs_json']:<6} {result['encode_ms']:>8.2f} ms", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
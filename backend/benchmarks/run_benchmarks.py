@@ -0,0 +1,204 @@
+"""
+End-to-end backend benchmarks.
+
+Builds a synthetic database at the requested scale in a temp directory, drives the FastAPI
+app in-process through its ASGI interface, microbenchmarks the inference and metrics hot
+paths, and writes latency percentiles and throughput as JSON. With --baseline, results are
+compared to a stored run and the exit code is 1 if any benchmark's p95 regressed.
+
+Usage (from backend/):
+    python -m benchmarks.run_benchmarks --scale 1k --output bench.json
+    python -m benchmarks.run_benchmarks --scale 1k --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --scale 1k --baseline benchmarks/baseline.json
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+# Iterations per benchmark at each scale; heavy endpoints get fewer runs at large scales
+DEFAULT_ITERATIONS = {"1k": 50, "100k": 10, "1m": 3}
+HEAVY_ITERATIONS = {"1k": 20, "100k": 3, "1m": 1}
+DEFAULT_TOLERANCE = 0.20
+
+
+def summarize(samples_s: List[float], items_per_call: int = 1) -> Dict[str, float]:
+    samples_ms = np.asarray(samples_s) * 1000.0
+    total_s = float(np.sum(samples_s))
+    return {
+        "iterations": len(samples_s),
+        "mean_ms": round(float(samples_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples_ms, 99)), 3),
+        "throughput_per_s": round(len(samples_s) * items_per_call / total_s, 2) if total_s > 0 else None,
+    }
+
+
+def measure(fn: Callable[[], None], iterations: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def compare_to_baseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[dict]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("p95_ms"):
+            continue
+        ratio = current["p95_ms"] / previous["p95_ms"]
+        current["baseline_p95_ms"] = previous["p95_ms"]
+        current["p95_ratio"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append({"benchmark": name, "p95_ms": current["p95_ms"],
+                                "baseline_p95_ms": previous["p95_ms"], "ratio": round(ratio, 3)})
+    return regressions
+
+
+def run(scale: str, iterations: Optional[int], workdir: Path, predictions_per_student: int) -> Dict[str, dict]:
+    db_path = workdir / f"bench_{scale}.db"
+    # Must be set before anything imports app.database
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    # Back-to-back iterations would hit the per-user rate limits; these are latency benchmarks
+    os.environ["ADMISSION_CONTROL_ENABLED"] = "0"
+
+    from benchmarks.datasets import SCALES, generate_dataset
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.auth.auth import create_access_token
+    from app.cache import response_cache
+    from app.crud.users import _calculate_student_metrics
+    from app.ml import model as ml_model_module
+
+    start = time.perf_counter()
+    counts = generate_dataset(db_path, SCALES[scale], predictions_per_student=predictions_per_student)
+    print(f"Generated {counts} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    n_default = iterations or DEFAULT_ITERATIONS[scale]
+    n_heavy = min(n_default, HEAVY_ITERATIONS[scale]) if iterations is None else iterations
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": "bench@example.com"})}
+    results: Dict[str, dict] = {}
+
+    with TestClient(app) as client:
+        def get(url: str, extra_headers: Optional[dict] = None, cold: bool = True):
+            def call():
+                if cold:
+                    response_cache.clear()
+                response = client.get(url, headers={**headers, **(extra_headers or {})})
+                assert response.status_code in (200, 304), f"{url} -> {response.status_code}"
+            return call
+
+        def post(url: str):
+            def call():
+                response = client.post(url, headers=headers)
+                assert response.status_code == 200, f"{url} -> {response.status_code}"
+            return call
+
+        program, section = "Computer Science", "A"
+        class_path = f"/predictions/class/{program}/{section}"
+        dashboard_etag = client.get("/dashboard-stats", headers=headers).headers.get("etag", "")
+
+        http_benchmarks = [
+            ("GET /students", get("/students"), n_heavy),
+            ("GET /dashboard-stats", get("/dashboard-stats"), n_default),
+            ("GET /dashboard-stats (304)", get("/dashboard-stats", {"If-None-Match": dashboard_etag}, cold=False), n_default),
+            ("POST /students/{id}/predict", post("/students/1/predict"), n_default),
+            ("POST /predictions/class (sync)", post(class_path), n_heavy),
+            ("GET /predictions/class/latest", get(f"{class_path}/latest"), n_default),
+            ("GET /predictions/class/history", get(f"{class_path}/history"), n_heavy),
+            ("GET /students/{id}/predictions", get("/students/1/predictions"), n_default),
+            ("GET /predictions/risk-ranking", get("/predictions/risk-ranking?limit=20"), n_default),
+        ]
+        for name, fn, n in http_benchmarks:
+            results[name] = summarize(measure(fn, n))
+            print(f"{name}: {results[name]}", file=sys.stderr)
+
+    import pandas as pd
+    rng = np.random.default_rng(0)
+    for batch_size in (1, 1_000, 100_000):
+        frame = pd.DataFrame({
+            "test_1_score": rng.uniform(300, 999, batch_size),
+            "test_2_score": rng.uniform(300, 999, batch_size),
+            "test_3_score": rng.uniform(300, 999, batch_size),
+            "learn_guide_completed": rng.random(batch_size) < 0.5,
+        })
+        n = n_default if batch_size < 100_000 else n_heavy
+        name = f"predict_pass_fail[batch={batch_size}]"
+        results[name] = summarize(measure(lambda: ml_model_module.predict_pass_fail(frame), n), items_per_call=batch_size)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+        name = f"predict_pass_fail_explained[batch={batch_size}]"
+        results[name] = summarize(measure(lambda: ml_model_module.predict_pass_fail_explained(frame), n), items_per_call=batch_size)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+
+    metric_inputs = rng.uniform(300, 999, (10_000, 3)).tolist()
+    def calculate_metrics():
+        for t1, t2, t3 in metric_inputs:
+            _calculate_student_metrics(t1, t2, t3)
+    results["_calculate_student_metrics[x10000]"] = summarize(measure(calculate_metrics, n_default), items_per_call=10_000)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(DEFAULT_ITERATIONS), default="1k")
+    parser.add_argument("--iterations", type=int, default=None, help="Override iterations for every benchmark")
+    parser.add_argument("--predictions-per-student", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against this stored report")
+    parser.add_argument("--save-baseline", type=Path, default=None, help="Store this run as a baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed p95 slowdown (0.2 = 20%%)")
+    parser.add_argument("--workdir", type=Path, default=None, help="Where to build the database (default: temp dir)")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", module="sklearn")
+    with tempfile.TemporaryDirectory(prefix="pof-bench-") as tmp:
+        workdir = args.workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        results = run(args.scale, args.iterations, workdir, args.predictions_per_student)
+
+    report = {
+        "scale": args.scale,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+        "regressions": [],
+    }
+    if args.baseline and args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("scale") != args.scale:
+            print(f"Warning: baseline scale {baseline.get('scale')} differs from {args.scale}", file=sys.stderr)
+        report["regressions"] = compare_to_baseline(results, baseline.get("results", {}), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        args.save_baseline.write_text(text)
+
+    if report["regressions"]:
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['benchmark']}: p95 {regression['p95_ms']}ms "
+                  f"vs baseline {regression['baseline_p95_ms']}ms (x{regression['ratio']})", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
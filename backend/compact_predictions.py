@@ -0,0 +1,27 @@
+# compact_predictions.py
+# Compacts old prediction history; suitable for a nightly cron job.
+import argparse
+from app.database import SessionLocal
+from app.services import retention_service
+
+parser = argparse.ArgumentParser(description="Compact prediction history older than the full-detail window.")
+parser.add_argument("--full-detail-days", type=int, default=retention_service.RETENTION_FULL_DETAIL_DAYS)
+parser.add_argument("--granularity", choices=retention_service.VALID_GRANULARITIES, default=retention_service.RETENTION_GRANULARITY)
+parser.add_argument("--keep-unchanged", action="store_true", help="Don't drop rows identical to the previous prediction")
+parser.add_argument("--archive", choices=retention_service.VALID_ARCHIVE_TARGETS, default=None)
+parser.add_argument("--archive-path", default=None, help="JSONL file to append to when --archive=file")
+args = parser.parse_args()
+
+db = SessionLocal()
+try:
+    report = retention_service.run_retention(
+        db,
+        full_detail_days=args.full_detail_days,
+        granularity=args.granularity,
+        drop_unchanged=not args.keep_unchanged,
+        archive=args.archive,
+        archive_path=args.archive_path,
+    )
+finally:
+    db.close()
+print(report.model_dump_json(indent=2))
@@ -1,7 +1,28 @@
 # create_tables.py
-from app.database import Base, engine
-import app.models
+from app.database import SessionLocal, ensure_schema
+from app.crud import dashboard as crud_dashboard
+from app.crud import predictions as crud_predictions
+from app.crud import trends as crud_trends
+from app.services import risk_band_service
 
-# Create tables based on models
-Base.metadata.create_all(bind=engine)
+# Create tables based on models, plus any columns/indexes added since the DB was created
+created_tables = ensure_schema()
 
+if created_tables & {"student_latest_predictions", "risk_band_configs"}:
+    db = SessionLocal()
+    if "student_latest_predictions" in created_tables:
+        crud_predictions.rebuild_latest_predictions(db)
+    risk_band_service.reband_latest_predictions(db)
+    db.commit()
+    db.close()
+
+
+if "prediction_trend_rollups" in created_tables:
+    db = SessionLocal()
+    crud_trends.rebuild_trend_rollups(db)
+    db.close()
+
+if created_tables & {"dashboard_class_aggregates", "dashboard_risk_band_counts"}:
+    db = SessionLocal()
+    crud_dashboard.rebuild_dashboard_aggregates(db)
+    db.close()
@@ -0,0 +1,41 @@
+# export_snapshot.py
+# Writes a point-in-time Parquet/Arrow snapshot of students, feature sets and predictions
+# for offline analysis; suitable for a nightly cron job with --incremental.
+import argparse
+import json
+import sys
+from pathlib import Path
+from app.database import engine
+from app.replica import analytics_replica
+from app.services import export_service
+from app.services.export_service import ExportError
+
+parser = argparse.ArgumentParser(description="Export students, student_feature_sets and predictions to Parquet or Arrow IPC.")
+parser.add_argument("--output-dir", type=Path, default=export_service.EXPORT_DIR)
+parser.add_argument("--format", choices=export_service.VALID_FORMATS, default="parquet")
+parser.add_argument("--date-partition", choices=export_service.VALID_DATE_PARTITIONS, default=export_service.EXPORT_DATE_PARTITION,
+                    help="Partition Parquet predictions by month or by day")
+parser.add_argument("--incremental", action="store_true", help="Only export predictions added since the latest snapshot")
+parser.add_argument("--chunk-size", type=int, default=export_service.EXPORT_CHUNK_SIZE)
+parser.add_argument("--from-replica", action="store_true", help="Read the analytics replica (ANALYTICS_REPLICA_PATH) instead of main.db")
+args = parser.parse_args()
+
+source = engine
+if args.from_replica:
+    if analytics_replica.snapshot_time() is None:
+        sys.exit("No analytics replica: set ANALYTICS_REPLICA_PATH and let the server refresh it first.")
+    source = analytics_replica.engine
+
+try:
+    snapshot_dir = export_service.export_snapshot(
+        source,
+        output_dir=args.output_dir,
+        fmt=args.format,
+        incremental=args.incremental,
+        chunk_size=args.chunk_size,
+        date_partition=args.date_partition,
+    )
+except ExportError as e:
+    sys.exit(str(e))
+print(snapshot_dir)
+print(json.dumps(export_service.read_manifest(snapshot_dir), indent=2))
@@ -0,0 +1,105 @@
+"""
+Shared fixtures. The app runs against a throwaway SQLite database in a temporary
+working directory (archives and exports land there too); every test starts from an
+empty database with one admin and two faculty accounts.
+"""
+import os
+import sys
+import tempfile
+
+_WORKDIR = tempfile.mkdtemp(prefix="pof-tests-")
+# Must be set before anything imports app.database
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_WORKDIR, 'test.db')}"
+os.environ.setdefault("ADMISSION_CONTROL_ENABLED", "0")
+os.environ.pop("ANALYTICS_REPLICA_PATH", None)
+os.environ.pop("COORDINATION_BACKEND", None)
+os.chdir(_WORKDIR)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date
+from typing import Callable, List, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from app.auth.auth import create_access_token
+from app.cache import response_cache
+from app.crud.predictions import create_predictions_bulk
+from app.crud.users import create_student_with_features, create_user
+from app.database import Base, SessionLocal
+from app.main import app
+from app.models import Prediction, Student, User
+from app.schema import PredictionCreate
+
+ADMIN_EMAIL = "admin@example.com"
+FACULTY_EMAIL = "faculty@example.com"
+OTHER_FACULTY_EMAIL = "faculty2@example.com"
+
+
+@pytest.fixture(scope="session")
+def client() -> TestClient:
+    with TestClient(app) as test_client:
+        db = SessionLocal()
+        try:
+            create_user(db, ADMIN_EMAIL, "admin-password", role="admin")
+            create_user(db, FACULTY_EMAIL, "faculty-password")
+            create_user(db, OTHER_FACULTY_EMAIL, "faculty-password")
+        finally:
+            db.close()
+        yield test_client
+
+
+@pytest.fixture
+def admin_headers(client) -> dict:
+    return {"Authorization": "Bearer " + create_access_token({"sub": ADMIN_EMAIL})}
+
+
+@pytest.fixture
+def faculty_headers(client) -> dict:
+    return {"Authorization": "Bearer " + create_access_token({"sub": FACULTY_EMAIL})}
+
+
+@pytest.fixture
+def other_faculty_headers(client) -> dict:
+    return {"Authorization": "Bearer " + create_access_token({"sub": OTHER_FACULTY_EMAIL})}
+
+
+@pytest.fixture
+def db(client):
+    """A session on the test database, emptied (except users) before the test."""
+    session = SessionLocal()
+    for table in reversed(Base.metadata.sorted_tables):
+        if table.name != User.__tablename__:
+            session.execute(delete(table))
+    session.commit()
+    response_cache.clear()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def add_student(db) -> Callable[..., Student]:
+    def _add(program: str = "BSIT", section: str = "A", scores=(80.0, 85.0, 90.0),
+             learn_guide_completed: bool = True, first_name: str = "Ana", last_name: str = "Cruz") -> Student:
+        return create_student_with_features(
+            db, first_name=first_name, last_name=last_name, dob=date(2004, 5, 1),
+            program=program, section=section, test_1_score=scores[0], test_2_score=scores[1],
+            test_3_score=scores[2], learn_guide_completed=learn_guide_completed,
+        )
+    return _add
+
+
+@pytest.fixture
+def add_predictions(db) -> Callable[..., List[Prediction]]:
+    def _add(student_id: int, scores, on: date = date(2025, 1, 15), risk_band: Optional[str] = None) -> List[Prediction]:
+        return create_predictions_bulk(db, [
+            PredictionCreate(
+                student_id=student_id, date=on, predicted_score=score,
+                category="Pass" if score >= 0.5 else "Fail", model_type="LogisticRegression",
+                risk_band=risk_band or ("High" if score < 0.4 else "Medium" if score < 0.7 else "Low"),
+            ) for score in scores
+        ])
+    return _add
@@ -0,0 +1,53 @@
+import pytest
+from starlette.requests import Request
+
+from app import admission
+from app.admission import AdmissionController, ClassLimits, admission_controller, client_address
+
+_ONE_REQUEST = ClassLimits(rate_per_second=0.1, burst=1, concurrency=4, reserved_for_interactive=1, max_queue=4, max_wait_seconds=1.0)
+
+
+@pytest.fixture
+def strict_admission(monkeypatch):
+    """Admission on, with fresh gates allowing one request per bucket."""
+    gates = AdmissionController(limits={name: _ONE_REQUEST for name in admission.DEFAULT_LIMITS}, enabled=True).gates
+    monkeypatch.setattr(admission_controller, "enabled", True)
+    monkeypatch.setattr(admission_controller, "gates", gates)
+    return gates
+
+
+def _request(client_host: str, forwarded_for=None) -> Request:
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded_for or []]
+    return Request({"type": "http", "client": (client_host, 1234), "headers": headers})
+
+
+def test_an_empty_bucket_answers_429_with_retry_after(client, faculty_headers, admin_headers, db, strict_admission):
+    assert client.get("/students/search", params={"q": "ana"}, headers=faculty_headers).status_code == 200
+
+    limited = client.get("/students/search", params={"q": "ana"}, headers=faculty_headers)
+
+    assert limited.status_code == 429
+    assert int(limited.headers["retry-after"]) >= 1
+    # Buckets are per user
+    assert client.get("/students/search", params={"q": "ana"}, headers=admin_headers).status_code == 200
+
+
+def test_forwarded_for_is_only_trusted_from_listed_proxies(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_TRUSTED_PROXIES", frozenset({"10.0.0.2", "10.0.0.3"}))
+
+    assert client_address(_request("203.0.113.9", ["198.51.100.1"])) == "203.0.113.9"
+    assert client_address(_request("10.0.0.2", ["198.51.100.1"])) == "198.51.100.1"
+    # A client-supplied hop ahead of the real one is ignored; proxy hops are skipped
+    assert client_address(_request("10.0.0.2", ["6.6.6.6, 198.51.100.1", "10.0.0.3"])) == "198.51.100.1"
+    assert client_address(_request("10.0.0.2")) == "10.0.0.2"
+
+
+def test_clients_behind_a_trusted_proxy_get_their_own_buckets(client, db, strict_admission, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_TRUSTED_PROXIES", frozenset({"testclient"}))
+
+    def delete(forwarded_for):
+        return client.delete("/students/999999", headers={"X-Forwarded-For": forwarded_for}).status_code
+
+    assert delete("198.51.100.1") == 404
+    assert delete("198.51.100.2") == 404
+    assert delete("198.51.100.1") == 429
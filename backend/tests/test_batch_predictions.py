@@ -0,0 +1,46 @@
+from app.models import Prediction, StudentLatestPrediction
+from app.services import prediction_service
+
+
+def test_batch_scores_students_and_inline_rows(client, faculty_headers, db, add_student):
+    student = add_student(scores=(600.0, 650.0, 700.0))
+
+    response = client.post("/predictions/batch", json={"items": [
+        {"student_id": student.student_id},
+        {"reference": "applicant-7", "test_1_score": 500, "test_2_score": 550, "test_3_score": 600, "learn_guide_completed": True},
+        {"student_id": 999999},
+    ]}, headers=faculty_headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (2, 1)
+    by_index = {r["index"]: r for r in body["results"]}
+    assert by_index[0]["student_id"] == student.student_id and by_index[0]["category"] in ("Pass", "Fail")
+    assert by_index[1]["reference"] == "applicant-7" and 0 <= by_index[1]["predicted_score"] <= 1
+    assert by_index[2]["error"]
+    assert db.query(Prediction).count() == 0
+
+
+def test_batch_persists_student_predictions_when_asked(client, faculty_headers, db, add_student):
+    ids = [add_student(scores=(600.0, 650.0, 700.0)).student_id for _ in range(2)]
+
+    response = client.post("/predictions/batch", json={
+        "items": [{"student_id": i} for i in ids], "persist": True,
+    }, headers=faculty_headers)
+
+    saved = {r["student_id"]: r["prediction_id"] for r in response.json()["results"]}
+    assert set(saved) == set(ids) and all(saved.values())
+    latest = {row.student_id: row.prediction_id for row in db.query(StudentLatestPrediction)}
+    assert latest == saved
+
+
+def test_unexpected_batch_failure_is_a_clean_500(client, faculty_headers, monkeypatch):
+    def explode(db, request):
+        raise RuntimeError("model file went away")
+
+    monkeypatch.setattr(prediction_service, "predict_batch", explode)
+
+    response = client.post("/predictions/batch", json={"items": [{"student_id": 1}]}, headers=faculty_headers)
+
+    assert response.status_code == 500
+    assert response.json()["detail"] == "An unexpected error occurred during batch prediction."
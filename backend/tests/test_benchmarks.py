@@ -0,0 +1,21 @@
+from benchmarks.run_benchmarks import compare_to_baseline, summarize
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    summary = summarize([0.001] * 99 + [0.101], items_per_call=10)
+
+    assert summary["iterations"] == 100
+    assert summary["p50_ms"] == 1.0
+    assert summary["p99_ms"] > 1.0
+    assert summary["throughput_per_s"] == round(1000 / 0.2, 2)
+
+
+def test_only_p95_slowdowns_beyond_the_tolerance_regress():
+    results = {"fast": {"p95_ms": 11.0}, "slow": {"p95_ms": 13.0}, "new": {"p95_ms": 5.0}}
+    baseline = {"fast": {"p95_ms": 10.0}, "slow": {"p95_ms": 10.0}}
+
+    regressions = compare_to_baseline(results, baseline, tolerance=0.2)
+
+    assert [r["benchmark"] for r in regressions] == ["slow"]
+    assert results["fast"]["p95_ratio"] == 1.1
+    assert "p95_ratio" not in results["new"]
@@ -0,0 +1,53 @@
+import pytest
+
+from app.coordination import LocalCoordinationStore, LockNotAcquiredError, SQLiteCoordinationStore
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def stores(request, tmp_path):
+    """Two handles on one store, as two workers would see it."""
+    if request.param == "local":
+        store = LocalCoordinationStore()
+        return store, store
+    path = str(tmp_path / "coordination.db")
+    return SQLiteCoordinationStore(path), SQLiteCoordinationStore(path)
+
+
+def test_counters_are_shared(stores):
+    first, second = stores
+    first.incr(["data_version:students", "data_version:predictions"])
+    second.incr(["data_version:students"])
+
+    assert first.get_counters(["data_version:students", "data_version:predictions", "data_version:other"]) == {
+        "data_version:students": 2, "data_version:predictions": 1,
+    }
+
+
+def test_values_are_shared(stores):
+    first, second = stores
+    first.set_value("model_version", "abc")
+    second.set_value("model_version", "def")
+
+    assert first.get_value("model_version") == "def"
+    assert first.get_value("missing") is None
+
+
+def test_a_lease_has_one_owner_until_it_expires(stores):
+    first, second = stores
+
+    assert first.try_acquire("class-predict:BSIT/A", ttl_seconds=60, owner="worker-1")
+    assert first.try_acquire("class-predict:BSIT/A", ttl_seconds=60, owner="worker-1")  # Renewal
+    assert not second.try_acquire("class-predict:BSIT/A", ttl_seconds=60, owner="worker-2")
+    assert second.try_acquire("leader", ttl_seconds=-1, owner="worker-2")
+    assert first.try_acquire("leader", ttl_seconds=60, owner="worker-1")  # Expired
+
+
+def test_lock_waits_then_gives_up(stores):
+    first, second = stores
+    with first.lock("startup-schema", ttl_seconds=60, owner="worker-1"):
+        with pytest.raises(LockNotAcquiredError):
+            with second.lock("startup-schema", ttl_seconds=60, wait_seconds=0.1, owner="worker-2"):
+                pass
+
+    with second.lock("startup-schema", ttl_seconds=60, owner="worker-2"):
+        pass
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.crud.dashboard import rebuild_dashboard_aggregates
+from app.crud.users import delete_student_and_features, update_student_with_features
+from app.services.dashboard_service import DashboardBroadcaster, DashboardStreamError, build_dashboard_data, dashboard_delta
+
+
+def _aggregates(db):
+    classes = db.execute(text("SELECT * FROM dashboard_class_aggregates WHERE student_count != 0 ORDER BY program, section"))
+    bands = db.execute(text("SELECT * FROM dashboard_risk_band_counts WHERE student_count != 0 ORDER BY risk_band"))
+    return [tuple(row) for row in classes], [tuple(row) for row in bands]
+
+
+def test_trigger_maintained_aggregates_match_a_rebuild(db, add_student, add_predictions):
+    students = [add_student(program=p, section=s, scores=sc) for p, s, sc in (
+        ("BSIT", "A", (95.0, 92.0, 90.0)), ("BSIT", "B", (70.0, 65.0, 62.0)),
+        ("BSN", "A", (85.0, 80.0, 88.0)), ("BSN", "A", (50.0, 52.0, 55.0)),
+    )]
+    for student, score in zip(students, (0.2, 0.5, 0.9, 0.35)):
+        add_predictions(student.student_id, [score])
+    add_predictions(students[0].student_id, [0.8], on=date(2025, 2, 1))
+    update_student_with_features(
+        db, student_id=students[1].student_id, first_name="Ana", last_name="Cruz", dob=date(2004, 5, 1),
+        program="BSN", section="B", test_1_score=55.0, test_2_score=58.0, test_3_score=60.0, learn_guide_completed=False,
+    )
+    delete_student_and_features(db, students[2].student_id)
+    maintained, dashboard = _aggregates(db), build_dashboard_data(db)
+
+    rebuild_dashboard_aggregates(db)
+
+    assert _aggregates(db) == maintained
+    assert build_dashboard_data(db) == dashboard
+    assert dashboard.total_students == 3 and dashboard.students_at_risk_count == 1
+
+
+def test_a_rebuild_refreshes_the_cached_dashboard(client, faculty_headers, db, add_student):
+    add_student()
+    first = client.get("/dashboard-stats", headers=faculty_headers)
+    # A write that bypasses the triggers and the session's change tracking
+    db.execute(text("UPDATE dashboard_class_aggregates SET student_count = 99"))
+    db.commit()
+    assert client.get("/dashboard-stats", headers=faculty_headers).json() == first.json()
+
+    rebuild_dashboard_aggregates(db)
+
+    second = client.get("/dashboard-stats", headers=faculty_headers)
+    assert second.headers["etag"] != first.headers["etag"]
+    assert second.json()["data"]["total_students"] == 1
+
+
+def test_deltas_carry_only_changed_fields_and_items():
+    previous = {
+        "total_students": 3, "total_programs": 2,
+        "students_per_program": [{"program": "BSIT", "count": 2}, {"program": "BSN", "count": 1}],
+    }
+    current = {
+        "total_students": 3, "total_programs": 1,
+        "students_per_program": [{"program": "BSIT", "count": 3}],
+    }
+
+    assert dashboard_delta(previous, current) == {
+        "total_programs": 1,
+        "students_per_program": [{"program": "BSIT", "count": 3}, {"program": "BSN", "removed": True}],
+    }
+    assert dashboard_delta(current, current) == {}
+
+
+def test_concurrent_subscribers_cannot_exceed_the_cap(db):
+    broadcaster = DashboardBroadcaster(max_subscribers=1)
+
+    async def subscribe_twice():
+        try:
+            return await asyncio.gather(broadcaster.subscribe(), broadcaster.subscribe(), return_exceptions=True)
+        finally:
+            broadcaster.stop()
+
+    results = asyncio.run(subscribe_twice())
+
+    assert sum(isinstance(r, DashboardStreamError) for r in results) == 1
+    assert sum(isinstance(r, tuple) for r in results) == 1
+
+
+def test_empty_program_counts_as_a_class_but_a_missing_one_does_not(db, add_student):
+    add_student(program="", section="")
+    add_student(program=None, section=None)
+    add_student(program="BSIT", section="A")
+    maintained = _aggregates(db)
+
+    dashboard = build_dashboard_data(db)
+
+    assert dashboard.total_students == 3
+    assert [(p.program, p.count) for p in dashboard.students_per_program] == [("", 1), ("BSIT", 1)]
+    assert [(s.section, s.count) for s in dashboard.students_per_section] == [("", 1), ("A", 1)]
+    assert (dashboard.total_programs, dashboard.total_sections) == (2, 2)
+    rebuild_dashboard_aggregates(db)
+    assert _aggregates(db) == maintained
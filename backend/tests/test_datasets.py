@@ -0,0 +1,44 @@
+import sqlite3
+
+from benchmarks.datasets import PREDICTION_INTERVAL_DAYS, TERM_DAYS, generate_dataset
+
+
+def _rows(path, query):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def test_the_same_seed_gives_the_same_data(tmp_path):
+    first, second, other = tmp_path / "a.db", tmp_path / "b.db", tmp_path / "c.db"
+    generate_dataset(first, 200, predictions_per_student=3, seed=7)
+    generate_dataset(second, 200, predictions_per_student=3, seed=7)
+    generate_dataset(other, 200, predictions_per_student=3, seed=8)
+
+    for query in ("SELECT * FROM students ORDER BY student_id", "SELECT * FROM predictions ORDER BY prediction_id"):
+        assert _rows(first, query) == _rows(second, query)
+        assert _rows(first, query) != _rows(other, query)
+
+
+def test_derived_tables_agree_with_the_history(tmp_path):
+    path = tmp_path / "data.db"
+
+    counts = generate_dataset(path, 300, predictions_per_student=4, seed=1, terms=2)
+
+    assert counts["predictions"] == 1200
+    assert counts["feature_sets"] + counts["students_missing_scores"] == 300
+    assert _rows(path, "SELECT count(*) FROM student_feature_sets WHERE test_3_score IS NULL") == [(0,)]
+    assert _rows(path, "SELECT count(*) FROM student_latest_predictions") == [(300,)]
+    # The latest row is each student's newest prediction
+    assert _rows(path, """
+        SELECT count(*) FROM student_latest_predictions l JOIN predictions p ON p.prediction_id = l.prediction_id
+        WHERE p.student_id != l.student_id OR EXISTS (
+            SELECT 1 FROM predictions n WHERE n.student_id = l.student_id AND (n.date, n.prediction_id) > (l.date, l.prediction_id))
+    """) == [(0,)]
+    assert _rows(path, "SELECT sum(prediction_count), sum(pass_count) FROM prediction_trend_rollups") == \
+        _rows(path, "SELECT count(*), sum(category = 'Pass') FROM predictions")
+    # Two terms of two weekly predictions: every student shares the same four dates
+    assert _rows(path, "SELECT count(DISTINCT date), julianday(max(date)) - julianday(min(date)) FROM predictions") == \
+        [(4, TERM_DAYS + PREDICTION_INTERVAL_DAYS)]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from app import main
+from app.ml.drift import DRIFT_BASELINE_ROWS, DriftMonitor
+
+
+def _batch(rows: int, shift: float = 0.0, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    features = pd.DataFrame({"average_score": rng.normal(650 + shift, 60, rows)})
+    raw = pd.DataFrame({"learn_guide_completed": rng.random(rows) < 0.6})
+    return raw, features, rng.random(rows)
+
+
+def _psi_samples(text: str):
+    return [line for line in text.splitlines() if line.startswith("pof_drift_psi{")]
+
+
+def test_the_first_rows_become_the_baseline_and_a_shift_is_drift():
+    monitor = DriftMonitor()
+    monitor.observe(*_batch(DRIFT_BASELINE_ROWS, seed=1))
+    monitor.observe(*_batch(500, seed=2))
+    assert monitor.report()["columns"][0]["status"] == "stable"
+
+    monitor.restart_window()
+    monitor.observe(*_batch(500, shift=120, seed=3))
+
+    statuses = {c["column"]: c["status"] for c in monitor.report()["columns"]}
+    assert statuses["average_score"] == "drift"
+    assert statuses["learn_guide_completed"] == "stable"
+
+
+def test_resetting_the_window_clears_the_psi_gauges(client, admin_headers, monkeypatch):
+    monitor = DriftMonitor()
+    monkeypatch.setattr(main, "drift_monitor", monitor)
+    monitor.observe(*_batch(DRIFT_BASELINE_ROWS, seed=1))
+    monitor.observe(*_batch(500, shift=120, seed=2))
+    assert _psi_samples(client.get("/metrics").text)
+
+    response = client.post("/monitoring/drift/reset", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert not _psi_samples(client.get("/metrics").text)
+    assert response.json()["columns"][0]["psi"] is None
@@ -0,0 +1,90 @@
+import gzip
+import json
+
+import pytest
+
+from app import encoding
+from app.encoding import ARROW_STREAM, COLUMNAR_JSON, MSGPACK, choose_content_encoding
+
+
+def test_content_coding_follows_quality_values():
+    assert choose_content_encoding("gzip;q=1, br;q=0.5") == "gzip"
+    assert choose_content_encoding("identity") is None
+    assert choose_content_encoding("*") in encoding.available_encodings()
+    assert choose_content_encoding("gzip, br;q=0") == "gzip"
+
+
+def test_large_responses_are_gzipped_with_a_weak_etag(client, db, add_student):
+    for i in range(40):
+        add_student(first_name=f"Student{i}")
+
+    plain = client.get("/students", headers={"Accept-Encoding": "identity"})
+    zipped = client.get("/students", headers={"Accept-Encoding": "gzip"})
+
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in zipped.headers["vary"]
+    assert zipped.headers["etag"] == "W/" + plain.headers["etag"]
+    assert zipped.json() == plain.json()
+    # A weak validator still revalidates
+    revalidated = client.get("/students", headers={"Accept-Encoding": "gzip", "If-None-Match": zipped.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_small_responses_are_not_compressed(client, db, add_student):
+    add_student()
+
+    response = client.get("/students", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_columnar_json_has_one_array_per_field(client, db, add_student):
+    ids = [add_student(first_name=name).student_id for name in ("Ana", "Ben")]
+
+    rows = client.get("/students").json()
+    response = client.get("/students", headers={"Accept": COLUMNAR_JSON})
+
+    assert response.headers["content-type"].startswith(COLUMNAR_JSON)
+    body = response.json()
+    assert body["length"] == 2
+    assert body["columns"]["student_id"] == ids
+    assert body["columns"]["first_name"] == [r["first_name"] for r in rows]
+
+
+def test_row_json_stays_the_default(client, db, add_student):
+    add_student()
+
+    response = client.get("/students", headers={"Accept": f"application/json, {COLUMNAR_JSON};q=0.5"})
+
+    assert isinstance(response.json(), list)
+
+
+def test_json_answers_of_negotiated_endpoints_vary_on_accept(client, faculty_headers, db, add_student, add_predictions):
+    student = add_student()
+    add_predictions(student.student_id, [0.3])
+
+    for url in ("/students", f"/students/{student.student_id}/predictions", "/risk-bands"):
+        response = client.get(url, headers=faculty_headers)
+        assert response.headers["content-type"].startswith("application/json")
+        assert "Accept" in [value.strip() for value in response.headers["vary"].split(",")], url
+
+
+def test_msgpack_and_arrow_decode_to_the_same_columns(client, faculty_headers, db, add_student, add_predictions):
+    msgpack = pytest.importorskip("msgpack")
+    pyarrow = pytest.importorskip("pyarrow")
+    student = add_student()
+    add_predictions(student.student_id, [0.3, 0.6, 0.9])
+    url = f"/students/{student.student_id}/predictions"
+
+    packed = msgpack.unpackb(client.get(url, headers={**faculty_headers, "Accept": MSGPACK}).content)
+    arrow = pyarrow.ipc.open_stream(client.get(url, headers={**faculty_headers, "Accept": ARROW_STREAM}).content).read_all()
+
+    assert packed["length"] == 3 == arrow.num_rows
+    assert arrow.column("prediction_id").to_pylist() == packed["columns"]["prediction_id"]
+    assert arrow.column("category").to_pylist() == packed["columns"]["category"]
+
+
+def test_compressed_bodies_round_trip():
+    body = json.dumps([{"n": i} for i in range(500)]).encode()
+
+    assert gzip.decompress(encoding.compress(body, "gzip")) == body
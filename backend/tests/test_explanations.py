@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+
+from app.ml.explain import decode_vector, encode_vector
+
+
+def test_vectors_round_trip_as_float32():
+    values = np.array([0.25, -1.5, 3.0])
+
+    assert np.allclose(decode_vector(encode_vector(values)), values)
+
+
+def test_explained_prediction_is_stored_and_served(client, faculty_headers, add_student):
+    student = add_student(scores=(600.0, 650.0, 700.0))
+
+    prediction = client.post(f"/students/{student.student_id}/predict", params={"explain": True}, headers=faculty_headers).json()
+    stored = client.get(f"/predictions/{prediction['prediction_id']}/explanation", headers=faculty_headers)
+
+    assert prediction["explanation"]["contributions"]
+    assert stored.status_code == 200
+    # Stored as float32
+    served, returned = stored.json(), prediction["explanation"]
+    assert [c["feature"] for c in served["contributions"]] == [c["feature"] for c in returned["contributions"]]
+    assert np.allclose([c["contribution"] for c in served["contributions"]],
+                       [c["contribution"] for c in returned["contributions"]], atol=1e-6)
+
+
+def test_contributions_add_up_to_the_prediction(client, faculty_headers, add_student):
+    student = add_student(scores=(550.0, 600.0, 720.0))
+
+    prediction = client.post(f"/students/{student.student_id}/predict", params={"explain": True}, headers=faculty_headers).json()
+
+    explanation = prediction["explanation"]
+    total = explanation["base_value"] + sum(c["contribution"] for c in explanation["contributions"])
+    if explanation["space"] == "log_odds":
+        total = 1 / (1 + math.exp(-total))
+    assert math.isclose(total, prediction["predicted_score"], abs_tol=1e-3)
+
+
+def test_unexplained_predictions_have_no_explanation(client, faculty_headers, add_student):
+    student = add_student(scores=(600.0, 650.0, 700.0))
+
+    prediction = client.post(f"/students/{student.student_id}/predict", headers=faculty_headers).json()
+
+    assert prediction["explanation"] is None
+    assert client.get(f"/predictions/{prediction['prediction_id']}/explanation", headers=faculty_headers).status_code == 404
@@ -0,0 +1,70 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
+
+from app.database import Base, ensure_schema
+from app.models import Prediction, Student
+from app.services import export_service
+from app.services.export_service import ExportError, export_snapshot, open_snapshot_table
+
+
+def test_prediction_ids_are_not_reused_after_deletes(db, add_student, add_predictions):
+    student = add_student()
+    last = add_predictions(student.student_id, [0.4, 0.6])[-1].prediction_id
+    db.query(Prediction).filter_by(prediction_id=last).delete()
+    db.commit()
+
+    assert add_predictions(student.student_id, [0.7])[0].prediction_id > last
+
+
+def test_existing_predictions_table_is_rebuilt_with_autoincrement(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(engine)
+    old_ddl = str(CreateTable(Prediction.__table__).compile(dialect=sqlite.dialect())).replace(" AUTOINCREMENT", "")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE predictions")
+        conn.exec_driver_sql(old_ddl)
+        conn.exec_driver_sql("INSERT INTO students (student_id, first_name, last_name, dob, program, section) "
+                             "VALUES (1, 'Ana', 'Cruz', '2004-05-01', 'BSIT', 'A')")
+        conn.exec_driver_sql("INSERT INTO predictions VALUES (7, 1, '2025-01-15', 0.6, 'Pass', 'LogisticRegression', 'Low')")
+
+    ensure_schema(engine)
+
+    with engine.connect() as conn:
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'predictions'")).scalar()
+        assert "AUTOINCREMENT" in ddl
+        assert conn.execute(text("SELECT prediction_id FROM predictions")).scalars().all() == [7]
+        assert conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'predictions'")).scalar() == 7
+    engine.dispose()
+
+
+def test_incremental_snapshots_chain_back_to_the_full_one(db, add_student, add_predictions, tmp_path):
+    pytest.importorskip("pyarrow")
+    student = add_student()
+    add_predictions(student.student_id, [0.3, 0.5])
+    full = export_snapshot(db.get_bind(), output_dir=tmp_path, fmt="arrow")
+    add_predictions(student.student_id, [0.8], on=date(2025, 2, 1))
+
+    increment = export_snapshot(db.get_bind(), output_dir=tmp_path, fmt="arrow", incremental=True)
+
+    manifest = export_service.read_manifest(increment)["tables"]["predictions"]
+    assert manifest["rows"] == 1 and manifest["chain_rows"] == 3
+    assert manifest["after_prediction_id"] == export_service.read_manifest(full)["tables"]["predictions"]["up_to_prediction_id"]
+    assert open_snapshot_table(increment, "predictions").column("predicted_score").to_pylist() == [0.3, 0.5, 0.8]
+
+
+def test_incremental_export_is_refused_after_deletes(db, add_student, add_predictions, tmp_path):
+    pytest.importorskip("pyarrow")
+    kept, removed = add_student(), add_student()
+    add_predictions(kept.student_id, [0.3])
+    add_predictions(removed.student_id, [0.5])
+    export_snapshot(db.get_bind(), output_dir=tmp_path, fmt="arrow")
+    db.query(Student).filter_by(student_id=removed.student_id).delete()
+    db.commit()
+
+    with pytest.raises(ExportError, match="take a full snapshot"):
+        export_snapshot(db.get_bind(), output_dir=tmp_path, fmt="arrow", incremental=True)
+    assert len(export_service.list_snapshots(tmp_path)) == 1
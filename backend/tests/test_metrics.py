@@ -0,0 +1,31 @@
+from app.metrics import Counter, Histogram
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, route="/x")
+
+    lines = histogram.render()
+
+    assert 'test_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/x",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/x"} 3' in lines
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "Test.", ("name",))
+    counter.inc(name='a"b\\c')
+
+    assert 'test_total{name="a\\"b\\\\c"} 1.0' in counter.render()
+
+
+def test_requests_are_recorded_by_route_template(client, faculty_headers, add_student):
+    student = add_student()
+    client.get(f"/students/{student.student_id}/predictions", headers=faculty_headers)
+
+    body = client.get("/metrics").text
+
+    assert 'pof_http_request_duration_seconds_count{method="GET",route="/students/{student_id}/predictions",status="200"}' in body
+    assert 'pof_http_request_db_queries_count{method="GET",route="/students/{student_id}/predictions"}' in body
@@ -0,0 +1,84 @@
+import json
+import time
+
+import pytest
+
+from app.models import StudentLatestPrediction
+from app.services import job_service
+
+
+def _wait_until_finished(client, headers, job_id, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("completed", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _events(stream_text):
+    events = []
+    for block in stream_text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_class_job_predicts_every_student(client, faculty_headers, db, add_student):
+    ids = {add_student(section="J", scores=(600.0, 650.0, 700.0)).student_id for _ in range(3)}
+
+    submitted = client.post("/predictions/class/BSIT/J/jobs", headers=faculty_headers)
+    job = _wait_until_finished(client, faculty_headers, submitted.json()["job_id"])
+
+    assert submitted.status_code == 202
+    assert job["status"] == "completed"
+    assert job["total_students"] == job["processed_students"] == 3
+    assert {row.student_id for row in db.query(StudentLatestPrediction)} == ids
+
+
+def test_events_stream_progress_until_the_job_ends(client, faculty_headers, add_student):
+    for _ in range(2):
+        add_student(section="K", scores=(600.0, 650.0, 700.0))
+    job_id = client.post("/predictions/class/BSIT/K/jobs", headers=faculty_headers).json()["job_id"]
+
+    response = client.get(f"/jobs/{job_id}/events", headers=faculty_headers)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    names = [name for name, _ in events]
+    assert "progress" in names
+    assert names[-1] == "status" and events[-1][1]["status"] == "completed"
+
+
+def test_unknown_job_is_404(client, faculty_headers):
+    assert client.get("/jobs/missing", headers=faculty_headers).status_code == 404
+    assert client.get("/jobs/missing/events", headers=faculty_headers).status_code == 404
+
+
+def test_jobs_are_hidden_from_other_users_but_not_admins(client, faculty_headers, other_faculty_headers, admin_headers, add_student):
+    add_student(section="L", scores=(600.0, 650.0, 700.0))
+    job_id = client.post("/predictions/class/BSIT/L/jobs", headers=faculty_headers).json()["job_id"]
+    job = _wait_until_finished(client, faculty_headers, job_id)
+
+    assert client.get(f"/jobs/{job_id}", headers=other_faculty_headers).status_code == 404
+    assert client.get(f"/jobs/{job_id}/events", headers=other_faculty_headers).status_code == 404
+    assert client.delete(f"/jobs/{job_id}", headers=other_faculty_headers).status_code == 404
+    assert client.get(f"/jobs/{job_id}", headers=admin_headers).json()["status"] == job["status"]
+    assert job["created_at"].endswith(("Z", "+00:00"))
+
+
+def test_joining_an_identical_job_shares_it(monkeypatch):
+    manager = job_service.PredictionJobManager(worker_count=1)
+    monkeypatch.setattr(manager, "_start", lambda job: None)  # Keep the job in flight
+    try:
+        job, _ = manager.submit_class_job("BSIT", "M", submitted_by=1)
+        joined, deduplicated = manager.submit_class_job("BSIT", "M", submitted_by=2)
+
+        assert deduplicated and joined is job
+        assert manager.get_job(job.job_id, user_id=2) is job
+        with pytest.raises(job_service.JobNotFoundError):
+            manager.cancel_job(job.job_id, user_id=3)
+        assert manager.get_job(job.job_id) is job
+    finally:
+        manager.shutdown()
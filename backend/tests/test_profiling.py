@@ -0,0 +1,88 @@
+import asyncio
+import cProfile
+
+import pytest
+
+from app import profiling
+from app.profiling import _ProfiledSteps, _pstats_report, profile_store
+
+
+@pytest.fixture
+def armed(admin_headers, client):
+    def _arm(path_prefix, mode="cprofile"):
+        response = client.post("/debug/profiling", params={"path_prefix": path_prefix, "mode": mode}, headers=admin_headers)
+        assert response.status_code == 200
+    yield _arm
+    profile_store.disarm_all()
+
+
+def _profile_of(response):
+    return profile_store.get(response.headers["x-profile-id"])
+
+
+def test_cprofile_covers_sync_endpoints_in_the_threadpool(client, db, add_student, armed):
+    add_student()
+    armed("/students")
+
+    response = client.get("/students")
+
+    profile = _profile_of(response)
+    assert profile.mode == "cprofile"
+    assert "get_all_students" in profile.output
+
+
+def test_cprofile_covers_async_endpoints(client, faculty_headers, db, add_student, armed):
+    student = add_student()
+    armed(f"/students/{student.student_id}/predictions")
+
+    response = client.get(f"/students/{student.student_id}/predictions", headers=faculty_headers)
+
+    assert "get_predictions_by_student_id" in _profile_of(response).output
+
+
+def test_cprofile_of_a_request_rejected_before_its_endpoint(client, db, armed):
+    armed("/students/1/predictions")
+
+    response = client.get("/students/1/predictions")
+
+    assert response.status_code == 401
+    assert _profile_of(response).output.startswith("No endpoint code ran")
+
+
+def test_profiled_coroutine_excludes_other_tasks():
+    def busy_elsewhere():
+        return sum(range(1000))
+
+    async def other_request():
+        for _ in range(5):
+            busy_elsewhere()
+            await asyncio.sleep(0)
+
+    async def profiled_request():
+        for _ in range(5):
+            await asyncio.sleep(0)
+        return "done"
+
+    async def main(profiler):
+        other = asyncio.create_task(other_request())
+        result = await _ProfiledSteps(profiled_request(), profiler)
+        await other
+        return result
+
+    profiler = cProfile.Profile()
+    assert asyncio.run(main(profiler)) == "done"
+    report = _pstats_report(profiler)
+    assert "profiled_request" in report
+    assert "busy_elsewhere" not in report
+
+
+def test_profile_header_requires_an_admin_token(client, admin_headers, faculty_headers, db, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+
+    anonymous = client.get("/students", headers={"X-Profile": "sample"})
+    faculty = client.get("/students", headers={**faculty_headers, "X-Profile": "sample"})
+    admin = client.get("/students", headers={**admin_headers, "X-Profile": "sample"})
+
+    assert "x-profile-id" not in anonymous.headers
+    assert "x-profile-id" not in faculty.headers
+    assert _profile_of(admin).mode == "sample"
@@ -0,0 +1,62 @@
+from datetime import date
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.auth.auth import get_db
+from app.crud.predictions import create_predictions_bulk
+from app.models import Prediction
+from app.query_profiler import QueryProfilerMiddleware, query_budget, statement_shape
+from app.schema import PredictionCreate
+
+
+def _profiled_app(strict: bool) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware, strict=strict)
+
+    @app.get("/queries/{count}")
+    @query_budget(2)
+    def run_queries(count: int, db=Depends(get_db)):
+        for i in range(count):
+            db.execute(text("SELECT :i"), {"i": i})
+        return {"ran": count}
+
+    return app
+
+
+def test_statement_shapes_ignore_literals_and_in_list_length():
+    assert statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?) AND x = 5") == \
+        statement_shape("SELECT *  FROM t\nWHERE id IN (?) AND x = 12")
+
+
+def test_requests_report_their_queries(db):
+    response = TestClient(_profiled_app(strict=False)).get("/queries/2")
+
+    assert response.status_code == 200
+    assert '"query_count":2' in response.headers["x-query-profile"]
+    assert "2 queries" in response.headers["server-timing"]
+
+
+def test_strict_mode_fails_requests_over_budget(db):
+    response = TestClient(_profiled_app(strict=True)).get("/queries/3")
+
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Query budget exceeded: 3 > 2"
+
+
+def test_bulk_inserted_predictions_keep_their_rows(db, add_student, add_predictions):
+    students = [add_student(first_name=name) for name in ("A", "B", "C")]
+    # A gap in the id sequence ahead of the bulk insert
+    add_predictions(students[0].student_id, [0.5])
+    db.query(Prediction).delete()
+    db.commit()
+
+    created = create_predictions_bulk(db, [
+        PredictionCreate(student_id=student.student_id, date=date(2025, 1, 15), predicted_score=score,
+                         category="Pass", model_type="LogisticRegression")
+        for score, student in zip((0.3, 0.1, 0.2, 0.9), students + students[:1])
+    ])
+
+    stored = {p.prediction_id: (p.student_id, p.predicted_score) for p in db.query(Prediction)}
+    assert {p.prediction_id: (p.student_id, p.predicted_score) for p in created} == stored
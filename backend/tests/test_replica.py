@@ -0,0 +1,88 @@
+from datetime import datetime
+from types import SimpleNamespace
+import logging
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app import replica
+from app.replica import FRESHNESS_HEADER, AnalyticsReplica, primary_database_path
+
+
+@pytest.fixture
+def analytics_replica(tmp_path, monkeypatch):
+    replica_db = AnalyticsReplica(path=str(tmp_path / "replica.db"), max_staleness_seconds=120)
+    monkeypatch.setattr(replica, "analytics_replica", replica_db)
+    yield replica_db
+    replica_db.engine.dispose()
+
+
+def _class_history(client, headers):
+    return client.get("/predictions/class/BSIT/A/history", headers=headers)
+
+
+def test_class_history_reads_the_replica_snapshot(client, faculty_headers, db, add_student, add_predictions, analytics_replica):
+    student = add_student()
+    add_predictions(student.student_id, [0.4])
+    snapshot_at = analytics_replica.refresh(primary_database_path())
+    add_predictions(student.student_id, [0.8])
+
+    response = _class_history(client, faculty_headers)
+
+    assert [p["predicted_score"] for p in response.json()] == [0.4]
+    assert datetime.fromisoformat(response.headers[FRESHNESS_HEADER].replace("Z", "+00:00")) == snapshot_at
+
+
+def test_a_stale_replica_falls_back_to_the_primary(client, faculty_headers, db, add_student, add_predictions, analytics_replica):
+    student = add_student()
+    add_predictions(student.student_id, [0.4])
+    snapshot_at = analytics_replica.refresh(primary_database_path())
+    add_predictions(student.student_id, [0.8])
+    analytics_replica.max_staleness_seconds = 0
+
+    response = _class_history(client, faculty_headers)
+
+    assert sorted(p["predicted_score"] for p in response.json()) == [0.4, 0.8]
+    assert datetime.fromisoformat(response.headers[FRESHNESS_HEADER].replace("Z", "+00:00")) > snapshot_at
+
+
+def test_a_students_history_includes_its_newest_prediction(client, faculty_headers, db, add_student, add_predictions, analytics_replica):
+    student = add_student()
+    analytics_replica.refresh(primary_database_path())
+    add_predictions(student.student_id, [0.8])
+
+    response = client.get(f"/students/{student.student_id}/predictions", headers=faculty_headers)
+
+    assert response.status_code == 200
+    assert [p["predicted_score"] for p in response.json()] == [0.8]
+
+
+def test_dashboard_stats_read_the_primary(client, faculty_headers, db, add_student, analytics_replica):
+    add_student()
+    analytics_replica.refresh(primary_database_path())
+    add_student()
+
+    response = client.get("/dashboard-stats", headers=faculty_headers)
+
+    assert response.json()["data"]["total_students"] == 2
+    assert FRESHNESS_HEADER not in response.headers
+
+
+def test_a_copy_restarted_by_writes_finishes_in_one_step(db, add_student, analytics_replica, monkeypatch, caplog):
+    for _ in range(20):
+        add_student()
+    monkeypatch.setattr(replica, "ANALYTICS_REPLICA_BACKUP_PAGES", 1)
+
+    def write_between_steps(seconds):
+        # Every pause lets a writer in, which restarts the stepped copy
+        add_student()
+    monkeypatch.setattr(replica, "time", SimpleNamespace(sleep=write_between_steps, perf_counter=time.perf_counter))
+
+    with caplog.at_level(logging.INFO, logger=replica.__name__):
+        analytics_replica.refresh(primary_database_path())
+
+    assert "copying in one step" in caplog.text
+    with analytics_replica.SessionLocal() as replica_db:
+        copied = replica_db.execute(text("SELECT count(*) FROM students")).scalar()
+    assert copied == db.execute(text("SELECT count(*) FROM students")).scalar()
@@ -0,0 +1,50 @@
+from app import cache
+from app.coordination import LocalCoordinationStore, SQLiteCoordinationStore
+
+
+def test_unchanged_data_answers_304(client, faculty_headers, add_student):
+    add_student()
+    first = client.get("/students", headers=faculty_headers)
+
+    again = client.get("/students", headers={**faculty_headers, "If-None-Match": first.headers["ETag"]})
+
+    assert first.status_code == 200 and len(first.json()) == 1
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+
+def test_a_commit_changes_the_etag(client, faculty_headers, add_student):
+    add_student()
+    first = client.get("/students", headers=faculty_headers)
+    add_student(first_name="Ben")
+
+    again = client.get("/students", headers={**faculty_headers, "If-None-Match": first.headers["ETag"]})
+
+    assert again.status_code == 200
+    assert again.headers["ETag"] != first.headers["ETag"]
+    assert len(again.json()) == 2
+
+
+def test_etags_do_not_survive_a_restart_of_the_counters(monkeypatch):
+    before = cache.make_etag("students", (3,))
+
+    # A restarted process: a fresh local store whose counters start again at 0
+    monkeypatch.setattr(cache, "coordination_store", LocalCoordinationStore())
+    cache.data_version_epoch.cache_clear()
+    try:
+        after = cache.make_etag("students", (3,))
+    finally:
+        monkeypatch.undo()
+        cache.data_version_epoch.cache_clear()
+
+    assert before != after
+    assert cache.make_etag("students", (3,)) == before
+
+
+def test_sqlite_store_keeps_the_first_epoch(tmp_path):
+    path = str(tmp_path / "coordination.db")
+
+    first = SQLiteCoordinationStore(path).setdefault_value(cache.DATA_VERSION_EPOCH_KEY, "a")
+    second = SQLiteCoordinationStore(path).setdefault_value(cache.DATA_VERSION_EPOCH_KEY, "b")
+
+    assert first == second == "a"
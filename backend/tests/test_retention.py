@@ -0,0 +1,108 @@
+from datetime import date, timedelta
+import json
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models import Prediction, PredictionArchive, StudentLatestPrediction
+from app.services import retention_service
+
+OLD_MONDAY = date.today() - timedelta(days=200 + date.today().weekday())
+
+
+def _old_week(add_predictions, student_id):
+    # Four predictions in one old week, then a recent one
+    for offset, score in enumerate((0.2, 0.3, 0.4, 0.5)):
+        add_predictions(student_id, [score], on=OLD_MONDAY + timedelta(days=offset))
+    add_predictions(student_id, [0.6], on=date.today())
+
+
+def test_retention_requires_admin(client, faculty_headers, db):
+    response = client.post("/predictions/retention", headers=faculty_headers)
+
+    assert response.status_code == 403
+
+
+def test_compacts_old_weeks_to_their_latest_prediction(client, admin_headers, db, add_student, add_predictions):
+    student = add_student()
+    _old_week(add_predictions, student.student_id)
+
+    response = client.post("/predictions/retention", params={"archive": "table"}, headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json()["compacted_count"] == 3
+    kept = db.query(Prediction).order_by(Prediction.date).all()
+    assert [(p.date, p.predicted_score) for p in kept] == [(OLD_MONDAY + timedelta(days=3), 0.5), (date.today(), 0.6)]
+    assert db.query(PredictionArchive).count() == 3
+    assert db.get(StudentLatestPrediction, student.student_id).predicted_score == 0.6
+
+
+def test_file_archive_is_written_after_the_commit(db, add_student, add_predictions, tmp_path):
+    _old_week(add_predictions, add_student().student_id)
+    archive_path = tmp_path / "archive.jsonl"
+    archive_path.write_text('{"prediction_id": 0}\n')
+
+    report = retention_service.run_retention(db, archive="file", archive_path=archive_path)
+
+    lines = archive_path.read_text().splitlines()
+    assert report.archived_count == 3
+    assert len(lines) == 4 and json.loads(lines[0]) == {"prediction_id": 0}
+    assert list(tmp_path.iterdir()) == [archive_path]
+
+
+def test_failed_commit_leaves_the_file_archive_untouched(db, add_student, add_predictions, tmp_path, monkeypatch):
+    _old_week(add_predictions, add_student().student_id)
+    archive_path = tmp_path / "archive.jsonl"
+
+    def fail_commit(self):
+        raise RuntimeError("disk I/O error")
+    monkeypatch.setattr(Session, "commit", fail_commit)
+    with pytest.raises(RuntimeError):
+        retention_service.run_retention(db, archive="file", archive_path=archive_path)
+    monkeypatch.undo()
+
+    assert not archive_path.exists()
+    assert list(tmp_path.iterdir()) == []
+    assert db.query(Prediction).count() == 5
+
+
+def test_latest_pointers_are_rebuilt_in_the_compaction_transaction(db, add_student, add_predictions, monkeypatch):
+    _old_week(add_predictions, add_student().student_id)
+    commits = []
+    real_commit = Session.commit
+    monkeypatch.setattr(Session, "commit", lambda self: (commits.append(1), real_commit(self)))
+
+    report = retention_service.run_retention(db)
+
+    assert report.affected_students == 1
+    assert len(commits) == 1
+
+
+def test_history_can_be_limited_to_a_date_range(client, faculty_headers, add_student, add_predictions):
+    student = add_student()
+    for day in (1, 10, 20):
+        add_predictions(student.student_id, [0.5], on=date(2025, 3, day))
+
+    response = client.get(
+        f"/students/{student.student_id}/predictions",
+        params={"start_date": "2025-03-05", "end_date": "2025-03-20"},
+        headers=faculty_headers,
+    )
+
+    assert [p["date"] for p in response.json()] == ["2025-03-20", "2025-03-10"]
+
+
+def test_retention_keeps_bands_from_the_current_thresholds(client, admin_headers, db, add_student, add_predictions):
+    student = add_student(program="BSIT", section="A")
+    _old_week(add_predictions, student.student_id)
+    client.put("/risk-bands/BSIT", json={"pass_threshold": 0.65, "high_risk_below": 0.7, "medium_risk_below": 0.8}, headers=admin_headers)
+
+    assert client.post("/predictions/retention", params={"archive": "table"}, headers=admin_headers).status_code == 200
+
+    db.expire_all()
+    latest = db.get(StudentLatestPrediction, student.student_id)
+    assert (latest.risk_band, latest.category) == ("High", "Fail")
+    assert db.execute(text("SELECT risk_band, student_count FROM dashboard_risk_band_counts WHERE student_count > 0")).all() == [("High", 1)]
+    shown = client.get("/predictions/class/BSIT/A/latest", headers=admin_headers).json()
+    assert [(p["risk_band"], p["category"]) for p in shown] == [("High", "Fail")]
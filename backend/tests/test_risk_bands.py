@@ -0,0 +1,37 @@
+import numpy as np
+
+from app.models import StudentLatestPrediction
+from app.services.risk_band_service import BandThresholds, assign_bands, thresholds_for_programs
+
+
+def test_bands_follow_each_programs_thresholds():
+    configs = {"*": BandThresholds(0.5, 0.4, 0.6), "BSN": BandThresholds(0.7, 0.5, 0.8)}
+    thresholds = thresholds_for_programs(configs, ["BSIT", "BSN", "BSN", None])
+
+    bands = assign_bands(np.array([0.45, 0.45, 0.75, 0.9]), thresholds)
+
+    assert list(bands) == ["Medium", "High", "Medium", "Low"]
+
+
+def test_changing_thresholds_rebands_latest_predictions(client, admin_headers, db, add_student, add_predictions):
+    student = add_student(program="BSN")
+    add_predictions(student.student_id, [0.45], risk_band="Medium")
+
+    response = client.put("/risk-bands/BSN", json={"pass_threshold": 0.7, "high_risk_below": 0.5, "medium_risk_below": 0.8}, headers=admin_headers)
+
+    assert response.status_code == 200
+    db.expire_all()
+    assert db.get(StudentLatestPrediction, student.student_id).risk_band == "High"
+    assert {c["program"] for c in client.get("/risk-bands", headers=admin_headers).json()} >= {"BSN"}
+
+
+def test_thresholds_out_of_order_are_rejected(client, admin_headers, db):
+    response = client.put("/risk-bands/BSN", json={"pass_threshold": 0.5, "high_risk_below": 0.7, "medium_risk_below": 0.6}, headers=admin_headers)
+
+    assert response.status_code == 400
+
+
+def test_only_admins_change_thresholds(client, faculty_headers, db):
+    response = client.put("/risk-bands/BSN", json={"pass_threshold": 0.5, "high_risk_below": 0.4, "medium_risk_below": 0.6}, headers=faculty_headers)
+
+    assert response.status_code == 403
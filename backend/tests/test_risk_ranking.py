@@ -0,0 +1,44 @@
+from app.crud import predictions as crud_predictions
+
+
+def test_ranks_latest_predictions_lowest_first(client, faculty_headers, add_student, add_predictions):
+    scores = {}
+    for score in (0.9, 0.2, 0.55):
+        student = add_student()
+        add_predictions(student.student_id, [score])
+        scores[student.student_id] = score
+
+    response = client.get("/predictions/risk-ranking", params={"limit": 2}, headers=faculty_headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total_ranked"] == 3
+    assert [s["predicted_score"] for s in body["students"]] == [0.2, 0.55]
+    assert [s["rank"] for s in body["students"]] == [1, 2]
+
+
+def test_percentile_mode_returns_bottom_share(client, faculty_headers, add_student, add_predictions):
+    for score in (0.1, 0.3, 0.5, 0.7, 0.9):
+        add_predictions(add_student().student_id, [score])
+
+    response = client.get("/predictions/risk-ranking", params={"percentile": 40}, headers=faculty_headers)
+
+    assert [s["predicted_score"] for s in response.json()["students"]] == [0.1, 0.3]
+
+
+def test_percentile_mode_is_capped(client, faculty_headers, add_student, add_predictions, monkeypatch):
+    monkeypatch.setattr(crud_predictions, "RISK_RANKING_MAX_LIMIT", 3)
+    for score in (0.1, 0.2, 0.3, 0.4, 0.5):
+        add_predictions(add_student().student_id, [score])
+
+    response = client.get("/predictions/risk-ranking", params={"percentile": 100}, headers=faculty_headers)
+
+    body = response.json()
+    assert body["total_ranked"] == 5
+    assert len(body["students"]) == 3
+
+
+def test_limit_above_cap_is_rejected(client, faculty_headers):
+    response = client.get("/predictions/risk-ranking", params={"limit": crud_predictions.RISK_RANKING_MAX_LIMIT + 1}, headers=faculty_headers)
+
+    assert response.status_code == 422
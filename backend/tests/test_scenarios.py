@@ -0,0 +1,99 @@
+from app.models import Prediction
+from app.services.prediction_service import MAX_SCENARIO_GRID_POINTS
+
+
+def test_student_scenarios_score_each_combination_without_saving(client, faculty_headers, db, add_student):
+    student = add_student(scores=(650.0, 700.0, 720.0))
+
+    response = client.post(
+        f"/students/{student.student_id}/what-if",
+        json={"test_3_scores": [500, 700, 900], "learn_guide_completed": [True, False]},
+        headers=faculty_headers,
+    )
+
+    assert response.status_code == 200
+    (result,) = response.json()["results"]
+    assert result["student_id"] == student.student_id
+    assert result["current_test_3_score"] == 720.0
+    assert [curve["learn_guide_completed"] for curve in result["curves"]] == [True, False]
+    for curve in result["curves"]:
+        assert [p["test_3_score"] for p in curve["points"]] == [500, 700, 900]
+        assert all(0 <= p["predicted_score"] <= 1 for p in curve["points"])
+    assert db.query(Prediction).count() == 0
+
+
+def test_class_scenarios_cover_every_student(client, faculty_headers, add_student):
+    ids = {add_student(section="B", scores=(600.0, 650.0, 700.0)).student_id for _ in range(3)}
+    add_student(section="C")
+
+    response = client.post(
+        "/predictions/class/BSIT/B/what-if",
+        json={"test_3_min": 400, "test_3_max": 900, "test_3_step": 250},
+        headers=faculty_headers,
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert {r["student_id"] for r in results} == ids
+    assert [p["test_3_score"] for p in results[0]["curves"][0]["points"]] == [400, 650, 900]
+
+
+def test_unknown_student_is_rejected(client, faculty_headers, db):
+    response = client.post("/students/999/what-if", json={"test_3_scores": [700]}, headers=faculty_headers)
+
+    assert response.status_code == 400
+
+
+def _what_if_curve(client, headers, student_id, target):
+    response = client.post(
+        f"/students/{student_id}/what-if",
+        json={"test_3_scores": [300, 500, 700, 900], "learn_guide_completed": [True], "target_probability": target},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    (result,) = response.json()["results"]
+    (curve,) = result["curves"]
+    return curve
+
+
+def test_min_score_for_target_is_the_first_grid_score_reaching_it(client, faculty_headers, add_student):
+    student = add_student(scores=(650.0, 700.0, 720.0))
+    probabilities = [p["predicted_score"] for p in _what_if_curve(client, faculty_headers, student.student_id, 0.7)["points"]]
+    target = max(probabilities)
+
+    curve = _what_if_curve(client, faculty_headers, student.student_id, target)
+
+    expected = next(p["test_3_score"] for p in curve["points"] if p["predicted_score"] >= target)
+    assert curve["min_test_3_score_for_target"] == expected
+
+
+def test_min_score_for_target_includes_a_target_met_exactly_at_the_lowest_score(client, faculty_headers, add_student):
+    student = add_student(scores=(650.0, 700.0, 720.0))
+    probabilities = [p["predicted_score"] for p in _what_if_curve(client, faculty_headers, student.student_id, 0.7)["points"]]
+
+    curve = _what_if_curve(client, faculty_headers, student.student_id, min(probabilities))
+
+    assert curve["min_test_3_score_for_target"] == 300
+
+
+def test_min_score_for_target_is_none_when_no_score_reaches_it(client, faculty_headers, add_student):
+    student = add_student(scores=(650.0, 700.0, 720.0))
+    probabilities = [p["predicted_score"] for p in _what_if_curve(client, faculty_headers, student.student_id, 0.7)["points"]]
+    assert max(probabilities) < 1.0
+
+    curve = _what_if_curve(client, faculty_headers, student.student_id, (max(probabilities) + 1.0) / 2)
+
+    assert curve["min_test_3_score_for_target"] is None
+
+
+def test_explicit_score_list_is_capped_like_the_range_grid(client, faculty_headers, add_student):
+    student = add_student()
+
+    response = client.post(
+        f"/students/{student.student_id}/what-if",
+        json={"test_3_scores": [700.0] * (MAX_SCENARIO_GRID_POINTS + 1)},  # Capped before de-duplication
+        headers=faculty_headers,
+    )
+
+    assert response.status_code == 400
+    assert str(MAX_SCENARIO_GRID_POINTS) in response.json()["detail"]
@@ -0,0 +1,57 @@
+import pytest
+
+from app.services import search_service
+
+
+@pytest.fixture(params=["fts", "like"])
+def search_mode(request, monkeypatch, db):
+    search_service.ensure_search_index(db.get_bind())
+    if request.param == "like":
+        monkeypatch.setattr(search_service, "_fts_available", False)
+    return request.param
+
+
+def _names(response):
+    return [f"{s.first_name} {s.last_name}" for s in response.results]
+
+
+def test_every_word_must_start_a_word_in_some_column(db, add_student, search_mode):
+    add_student(first_name="John", last_name="Smith")
+    add_student(first_name="Mary", last_name="Ann-Smithers")
+    add_student(first_name="Johnny", last_name="Reyes")
+
+    assert set(_names(search_service.search_students(db, "jo sm"))) == {"John Smith"}
+    assert set(_names(search_service.search_students(db, "smith"))) == {"John Smith", "Mary Ann-Smithers"}
+    assert _names(search_service.search_students(db, "ohn")) == []
+
+
+def test_whole_word_matches_come_first(db, add_student, search_mode):
+    add_student(first_name="Johnny", last_name="Abad")
+    add_student(first_name="John", last_name="Zamora")
+
+    assert _names(search_service.search_students(db, "john")) == ["John Zamora", "Johnny Abad"]
+
+
+def test_whole_word_match_is_found_past_the_candidate_limit(db, add_student, monkeypatch):
+    search_service.ensure_search_index(db.get_bind())
+    monkeypatch.setattr(search_service, "SEARCH_CANDIDATE_LIMIT", 3)
+    for i in range(5):
+        add_student(first_name=f"Rosalind{i}", last_name="Tan")
+    add_student(first_name="Rosa", last_name="Tan")
+
+    assert _names(search_service.search_students(db, "rosa", limit=1)) == ["Rosa Tan"]
+
+
+def test_pages_do_not_overlap(db, add_student, search_mode):
+    for i in range(5):
+        add_student(first_name="Lea", last_name=f"Lim{i}")
+
+    first = search_service.search_students(db, "lea", limit=3)
+    second = search_service.search_students(db, "lea", limit=3, offset=3)
+
+    assert first.has_more and not second.has_more
+    assert len(set(_names(first)) | set(_names(second))) == 5
+
+
+def test_a_query_without_words_is_rejected(client, faculty_headers):
+    assert client.get("/students/search", params={"q": "--"}, headers=faculty_headers).status_code == 400
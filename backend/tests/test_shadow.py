@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.ml import shadow
+from app.ml.shadow import ChallengerModel, ShadowScorer
+from app.models import ChallengerPrediction
+
+
+class _Identity:
+    def transform(self, values):
+        return values
+
+
+class _Constant:
+    def __init__(self, probability: float):
+        self.probability = probability
+
+    def predict_proba(self, values):
+        return np.column_stack([1 - np.full(len(values), self.probability), np.full(len(values), self.probability)])
+
+
+def _scorer(max_pending: int = 8) -> ShadowScorer:
+    scorer = ShadowScorer(max_pending=max_pending)
+    scorer.set_challengers([ChallengerModel(
+        name="always-pass", version="v-challenger", bundle_dir=Path("."), model=_Constant(0.9),
+        scaler=_Identity(), feature_names=["test_1_score", "test_2_score", "test_3_score"],
+    )])
+    return scorer
+
+
+def _raw(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "test_1_score": [600.0] * rows, "test_2_score": [650.0] * rows,
+        "test_3_score": [700.0] * rows, "learn_guide_completed": [True] * rows,
+    })
+
+
+def test_challenger_scores_are_stored_and_summarized(db):
+    scorer = _scorer()
+
+    assert scorer.submit(_raw(4), np.array([0.2, 0.6, 0.8, 0.95]), 0.5, "v-champion", [1, 2, None, 4])
+    assert scorer.flush(timeout=10)
+
+    stored = db.query(ChallengerPrediction).order_by(ChallengerPrediction.id).all()
+    assert [r.agrees for r in stored] == [False, True, True, True]
+    assert [r.student_id for r in stored] == [1, 2, None, 4]
+    summary = scorer.report()[0]
+    assert (summary["rows_scored"], summary["agreement_rate"]) == (4, 0.75)
+    scorer.shutdown()
+
+
+def test_waiting_batches_are_written_in_one_transaction(db, monkeypatch):
+    scorer = _scorer()
+    commits = []
+    original_store = scorer._store
+    monkeypatch.setattr(scorer, "_store", lambda rows: commits.append(len(rows)) or original_store(rows))
+    monkeypatch.setattr(shadow, "SHADOW_MAX_ROWS_PER_COMMIT", 4)
+    scorer._ensure_thread = lambda: None  # Queue without a writer, as during a burst
+    for _ in range(3):
+        scorer.submit(_raw(2), np.array([0.6, 0.7]), 0.5, "v-champion")
+
+    del scorer._ensure_thread
+    scorer._ensure_thread()
+    assert scorer.flush(timeout=10)
+
+    assert commits == [4, 2]
+    assert db.query(ChallengerPrediction).count() == 6
+    scorer.shutdown()
+
+
+def test_a_full_queue_drops_and_counts_batches(monkeypatch):
+    scorer = _scorer(max_pending=1)
+    monkeypatch.setattr(scorer, "_ensure_thread", lambda: None)
+
+    assert scorer.submit(_raw(1), np.array([0.6]), 0.5, "v-champion")
+    assert not scorer.submit(_raw(1), np.array([0.6]), 0.5, "v-champion")
+
+    assert scorer.dropped_batches == 1
+    assert scorer.pending_batches == 1
+
+
+def test_nothing_is_queued_without_challengers():
+    assert not ShadowScorer().submit(_raw(1), np.array([0.6]), 0.5, "v-champion")
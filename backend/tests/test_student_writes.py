@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import event
+
+from app.crud.users import delete_student_and_features, update_student_with_features
+from app.models import (
+    ExamOutcome, Prediction, PredictionExplanation, Student, StudentFeatureSet, StudentLatestPrediction,
+)
+
+
+@contextmanager
+def _statements(db):
+    executed = []
+    listener = lambda conn, cursor, statement, *args: executed.append(statement)
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield executed
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+def test_updating_a_student_upserts_its_features_in_two_statements(db, add_student):
+    student = add_student(scores=(600.0, 650.0, 700.0))
+
+    with _statements(db) as executed:
+        updated = update_student_with_features(
+            db, student_id=student.student_id, first_name="Ana", last_name="Reyes", dob=date(2004, 5, 1),
+            program="BSN", section="B", test_1_score=700.0, test_2_score=750.0, test_3_score=800.0,
+            learn_guide_completed=False,
+        )
+
+    assert len(executed) == 2
+    assert (updated.last_name, updated.program, updated.avg_test_score) == ("Reyes", "BSN", 750.0)
+    db.expire_all()
+    features = db.query(StudentFeatureSet).filter_by(student_id=student.student_id).all()
+    assert [(f.test_3_score, f.learn_guide_completed) for f in features] == [(800.0, False)]
+
+
+def test_updating_a_missing_student_returns_none(db):
+    assert update_student_with_features(
+        db, student_id=999999, first_name="A", last_name="B", dob=date(2004, 5, 1), program="BSIT",
+        section="A", test_1_score=None, test_2_score=None, test_3_score=None, learn_guide_completed=True,
+    ) is None
+
+
+def test_deleting_a_student_cascades_to_its_history(client, faculty_headers, db, add_student, add_predictions):
+    student, other = add_student(scores=(600.0, 650.0, 700.0)), add_student()
+    add_predictions(student.student_id, [0.3, 0.8])
+    add_predictions(other.student_id, [0.6])
+    client.post(f"/students/{student.student_id}/predict", params={"explain": True}, headers=faculty_headers)
+    db.add(ExamOutcome(student_id=student.student_id, exam_date=date(2025, 3, 1), passed=True))
+    db.commit()
+    student_id = student.student_id
+
+    with _statements(db) as executed:
+        assert delete_student_and_features(db, student_id) == student_id
+
+    assert len(executed) == 1
+    for model in (StudentFeatureSet, Prediction, StudentLatestPrediction, ExamOutcome):
+        assert db.query(model).filter_by(student_id=student_id).count() == 0
+    assert db.query(PredictionExplanation).count() == 0
+    assert db.query(Prediction).filter_by(student_id=other.student_id).count() == 1
+    assert db.get(StudentLatestPrediction, other.student_id) is not None
+
+
+def test_deleting_a_missing_student_is_a_404(client, db):
+    assert client.delete("/students/999999").status_code == 404
+    assert db.query(Student).count() == 0
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.ml import model as ml_model_module
+from app.ml import training
+
+
+def _labelled_chunks(rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    scores = rng.uniform(300, 999, size=(rows, 3))
+    frame = pd.DataFrame(scores, columns=["test_1_score", "test_2_score", "test_3_score"])
+    frame["learn_guide_completed"] = rng.random(rows) < 0.6
+    frame["passed"] = (scores.mean(axis=1) + rng.normal(0, 60, rows) > 650).astype(int)
+    return [frame.iloc[:rows // 2], frame.iloc[rows // 2:]]
+
+
+def test_training_writes_a_complete_versioned_bundle(tmp_path):
+    bundle_dir, metadata = training.train(_labelled_chunks(200), folds=2, n_jobs=1, bundles_dir=tmp_path)
+
+    assert bundle_dir.parent == tmp_path
+    assert bundle_dir.name.endswith(metadata["model_version"])
+    assert metadata["training_rows"] == 200
+    assert metadata["evaluation"]
+    for name in (ml_model_module.MODEL_FILENAME, ml_model_module.SCALER_FILENAME,
+                 ml_model_module.FEATURE_NAMES_FILENAME, training.METADATA_FILENAME):
+        assert (bundle_dir / name).exists()
+    assert not list(tmp_path.glob(".staging-*"))
+
+
+def test_activating_points_current_at_the_bundle(tmp_path):
+    bundle_dir = tmp_path / "20250101T000000Z-abc"
+    bundle_dir.mkdir()
+    pointer = tmp_path / "CURRENT"
+
+    training.activate_bundle(bundle_dir, pointer=pointer)
+
+    assert pointer.read_text().strip() == bundle_dir.name
+
+
+def test_too_few_labelled_students_is_an_error(tmp_path):
+    with pytest.raises(training.TrainingError):
+        training.train(_labelled_chunks(20), folds=2, n_jobs=1, bundles_dir=tmp_path)
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,62 @@
+from datetime import date
+
+from app.crud.trends import get_trend_points, rebuild_trend_rollups
+from app.models import PredictionTrendRollup
+
+
+def _rollups(db):
+    return sorted(
+        (r.program, r.section, r.bucket_date, r.prediction_count, round(r.probability_sum, 6),
+         r.pass_count, r.fail_count, r.flips_to_pass, r.flips_to_fail)
+        for r in db.query(PredictionTrendRollup)
+    )
+
+
+def _history(add_student, add_predictions):
+    first, second = add_student(program="BSIT", section="A"), add_student(program="BSN", section="B")
+    add_predictions(first.student_id, [0.3], on=date(2025, 1, 6))
+    add_predictions(first.student_id, [0.7, 0.8], on=date(2025, 1, 8))
+    add_predictions(first.student_id, [0.2], on=date(2025, 2, 3))
+    add_predictions(second.student_id, [0.9, 0.4], on=date(2025, 1, 8))
+
+
+def test_incremental_rollups_match_a_rebuild(db, add_student, add_predictions):
+    _history(add_student, add_predictions)
+    incremental = _rollups(db)
+
+    rebuild_trend_rollups(db)
+
+    assert incremental == _rollups(db)
+    bsit_january = [r for r in incremental if r[0] == "BSIT" and r[2] == date(2025, 1, 8)]
+    assert bsit_january[0][7:] == (1, 0)  # 0.3 Fail, then 0.7 Pass
+
+
+def test_days_sum_into_weeks_and_months(db, add_student, add_predictions):
+    _history(add_student, add_predictions)
+
+    weeks = get_trend_points(db, "week")
+    months = get_trend_points(db, "month", program="BSIT")
+
+    assert [(p.bucket_start, p.predictions) for p in weeks] == [(date(2025, 1, 6), 5), (date(2025, 2, 3), 1)]
+    assert [(p.bucket_start, p.predictions, p.flips_to_pass, p.flips_to_fail) for p in months] == [
+        (date(2025, 1, 1), 3, 1, 0), (date(2025, 2, 1), 1, 0, 1),
+    ]
+
+
+def test_flips_count_events_not_students(db, add_student, add_predictions):
+    student = add_student()
+    add_predictions(student.student_id, [0.3, 0.7, 0.2, 0.8], on=date(2025, 1, 6))  # Fail, Pass, Fail, Pass
+
+    (point,) = get_trend_points(db, "day")
+
+    assert (point.flips_to_pass, point.flips_to_fail, point.flips) == (2, 1, 3)
+
+
+def test_trends_endpoint_breaks_down_by_class(client, faculty_headers, db, add_student, add_predictions):
+    _history(add_student, add_predictions)
+
+    response = client.get("/analytics/trends", params={"granularity": "month", "by_class": True}, headers=faculty_headers)
+
+    assert response.status_code == 200
+    classes = {(p["program"], p["section"], p["bucket_start"]): p["predictions"] for p in response.json()["points"]}
+    assert classes == {("BSIT", "A", "2025-01-01"): 3, ("BSN", "B", "2025-01-01"): 2, ("BSIT", "A", "2025-02-01"): 1}
@@ -0,0 +1,52 @@
+# train_model.py
+# Retrains the pass/fail model from students with recorded exam outcomes and writes a versioned bundle.
+import argparse
+import json
+from pathlib import Path
+from app.database import SessionLocal, ensure_schema
+from app.ml import model as ml_model_module
+from app.ml import training
+
+parser = argparse.ArgumentParser(description="Train the pass/fail model on students and their exam outcomes.")
+parser.add_argument("--folds", type=int, default=training.DEFAULT_CV_FOLDS, help="Cross-validation folds")
+parser.add_argument("--n-jobs", type=int, default=-1, help="Folds fitted in parallel (-1 = all cores)")
+parser.add_argument("--calibration", choices=training.CALIBRATION_METHODS, default="none",
+                    help="Calibrate probabilities (calibrated models have no per-feature explanations)")
+parser.add_argument("--chunk-size", type=int, default=training.EXPORT_CHUNK_SIZE, help="Rows read per chunk")
+parser.add_argument("--min-rows", type=int, default=training.MIN_TRAINING_ROWS)
+parser.add_argument("--from-csv", type=Path, default=None, help="Train from a previous --export-csv file instead of the database")
+parser.add_argument("--export-csv", type=Path, default=None, help="Only export the labelled training data to this CSV file")
+parser.add_argument("--bundles-dir", type=Path, default=ml_model_module.BUNDLES_DIR)
+parser.add_argument("--activate", action="store_true", help="Serve the new bundle after the next model reload")
+args = parser.parse_args()
+
+if args.from_csv is not None:
+    chunks = training.iter_training_chunks_from_csv(args.from_csv, args.chunk_size)
+    db = None
+else:
+    ensure_schema()
+    db = SessionLocal()
+    if args.export_csv is not None:
+        rows = training.export_training_data(db, args.export_csv, args.chunk_size)
+        db.close()
+        print(f"Exported {rows} labelled students to {args.export_csv}")
+        raise SystemExit(0)
+    chunks = training.iter_training_chunks(db, args.chunk_size)
+
+try:
+    bundle_dir, metadata = training.train(
+        chunks, folds=args.folds, n_jobs=args.n_jobs, calibration=args.calibration,
+        min_rows=args.min_rows, bundles_dir=args.bundles_dir,
+    )
+except training.TrainingError as e:
+    raise SystemExit(f"Training failed: {e}")
+finally:
+    if db is not None:
+        db.close()
+
+print(json.dumps(metadata, indent=2))
+if args.activate:
+    training.activate_bundle(bundle_dir)
+    print(f"Activated {bundle_dir.name}; POST /model/reload (or restart) to serve it.")
+else:
+    print(f"Wrote {bundle_dir}; serve it with ML_BUNDLE_DIR={bundle_dir} or rerun with --activate.")